@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+baseline.py
+
+Streaming ROI baseline that follows lighting drift.
+
+The scripts used to block for BASELINE_SAMPLES * INTERVAL seconds at start and
+then keep that baseline forever, so slow lighting changes over a shift were
+integrated as phantom flow. OnlineBaseline is usable from the first frame
+(provisional baseline = that frame) and is updated with O(1) work per sample,
+but only while no event is active, so a pour never pulls it up:
+
+  - the first n samples: running mean (Welford, alpha = 1/count)
+  - afterwards: EWMA with time constant tau seconds, alpha = 1 - exp(-dt/tau),
+    so the tracking speed does not depend on the (adaptive) sample rate.
+    Time spent inside events is not counted in dt.
+  - tau=None freezes the baseline after n samples (the old fixed baseline,
+    without the blocking startup).
+
+BaselineCache persists a settled baseline to baseline_cache.json together with
+a cheap fingerprint of the scene: a 16x16 gray thumbnail of the ROI, the frame
+shape and the camera's exposure/gain/white-balance settings. On restart one or
+two frames are compared against it; when the scene still matches, the cached
+baseline is used straight away (OnlineBaseline.restore) and the 20-frame
+collection is skipped. Entries are keyed per script/device/value so several
+scripts can share the file.
+
+usage:
+    baseline = OnlineBaseline(n=20, tau=300.0)
+    base_mean, base_std = baseline.get(mean_roi, std_roi)
+    ... delta = mean_roi - base_mean; event = ...
+    if baseline.update(frame_ts, mean_roi, std_roi, active=event):
+        print("BASELINE DONE", baseline.mean)
+
+    cache = BaselineCache("baseline_cache.json", "myscript:0:mean", ROI)
+    cached = cache.load(cap, [cap.read()[1] for _ in range(2)])
+    if cached: baseline.restore(cached)
+    ...
+    cache.save(cap, [quiet_frame], baseline.mean)
+"""
+import json, math, os
+from datetime import datetime
+import numpy as np
+import cv2
+from metrics import roi_bounds
+
+BASELINE_SAMPLES = 20
+TAU = 300.0      # seconds
+CACHE_PATH = "baseline_cache.json"
+THUMB_SIZE = (16, 16)
+THUMB_TOL = 4.0  # mean |difference| of the thumbnails (gray levels) still counted as the same scene
+# capture settings that change the ROI brightness; any difference invalidates the cache
+EXPOSURE_PROPS = {
+    'auto_exposure': cv2.CAP_PROP_AUTO_EXPOSURE,
+    'exposure': cv2.CAP_PROP_EXPOSURE,
+    'gain': cv2.CAP_PROP_GAIN,
+    'brightness': cv2.CAP_PROP_BRIGHTNESS,
+    'contrast': cv2.CAP_PROP_CONTRAST,
+    'auto_wb': cv2.CAP_PROP_AUTO_WB,
+    'wb_temperature': cv2.CAP_PROP_WB_TEMPERATURE,
+}
+
+
+class OnlineBaseline:
+    def __init__(self, n=BASELINE_SAMPLES, tau=TAU):
+        self.n = n
+        self.tau = tau
+        self.count = 0
+        self.mean = None
+        self.last_ts = None
+        self.held = 0          # samples skipped because an event was active
+
+    @property
+    def ready(self):
+        return self.count >= self.n
+
+    def restore(self, values):
+        # start from a known baseline (e.g. BaselineCache), already settled
+        self.mean = [float(v) for v in values]
+        self.count = self.n
+
+    def get(self, *values):
+        # current baseline; before the first update the values themselves (provisional)
+        if self.mean is None:
+            return tuple(float(v) for v in values)
+        return tuple(self.mean)
+
+    def update(self, ts, *values, active=False):
+        # returns True once, when the first n samples have been collected
+        dt = 0.0 if self.last_ts is None else ts - self.last_ts
+        self.last_ts = ts
+        if active:
+            self.held += 1
+            return False
+        if self.mean is None:
+            self.mean = [float(v) for v in values]
+            self.count = 1
+            return self.n <= 1
+        self.count += 1
+        if self.count <= self.n:
+            a = 1.0 / self.count
+        elif self.tau is None:
+            return False
+        else:
+            a = 1.0 - math.exp(-max(dt, 0.0) / self.tau)
+        for i, v in enumerate(values):
+            self.mean[i] += a * (v - self.mean[i])
+        return self.count == self.n
+
+
+def thumbnail(frames, roi):
+    # mean of the downscaled gray ROI over the given frames
+    acc = None
+    for frame in frames:
+        y1, y2, x1, x2 = roi_bounds(roi, frame.shape[1], frame.shape[0])
+        crop = frame[y1:y2, x1:x2]
+        if crop.ndim == 3:
+            crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        t = cv2.resize(crop, THUMB_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+        acc = t if acc is None else acc + t
+    return acc / len(frames)
+
+
+def exposure_props(cap):
+    return {name: round(float(cap.get(prop)), 3) for name, prop in EXPOSURE_PROPS.items()}
+
+
+class BaselineCache:
+    def __init__(self, path=CACHE_PATH, key='default', roi=None, tol=THUMB_TOL):
+        self.path = path
+        self.key = key
+        self.roi = roi
+        self.tol = tol
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def load(self, cap, frames):
+        # cached baseline values if the scene in `frames` matches the fingerprint, else None
+        frames = [f for f in frames if f is not None]
+        entry = self._read().get(self.key)
+        if entry is None or not frames:
+            return None
+        if entry['roi'] != list(self.roi) or entry['shape'] != list(frames[0].shape):
+            print("BASELINE CACHE stale: ROI or frame size changed")
+            return None
+        props = exposure_props(cap)
+        if entry['props'] != props:
+            changed = [k for k in props if entry['props'].get(k) != props[k]]
+            print("BASELINE CACHE stale: camera settings changed:", ",".join(changed))
+            return None
+        diff = float(np.abs(thumbnail(frames, self.roi) - np.array(entry['thumb'], np.float32)).mean())
+        if diff > self.tol:
+            print(f"BASELINE CACHE stale: scene changed (thumbnail diff {diff:.2f} > {self.tol})")
+            return None
+        print(f"BASELINE CACHE hit: saved {entry['saved']} (thumbnail diff {diff:.2f})")
+        return entry['values']
+
+    def save(self, cap, frames, values):
+        frames = [f for f in frames if f is not None]
+        if not frames:
+            return
+        data = self._read()
+        data[self.key] = {'values': [float(v) for v in values],
+                          'roi': list(self.roi),
+                          'shape': list(frames[0].shape),
+                          'props': exposure_props(cap),
+                          'thumb': np.round(thumbnail(frames, self.roi), 2).tolist(),
+                          'saved': datetime.utcnow().isoformat(timespec='seconds') + 'Z'}
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+batch_analysis.py
+
+Fleet-wide calibration dataset: many flow logs (several Pis, several sessions)
+with their calibration files, analysed in parallel and merged into one CSV.
+
+The offline tools only read flow_log.csv and calib_points.csv in the working
+directory. Here each job is one (rig, session, flow log, calibration file);
+the jobs are spread over a ProcessPoolExecutor (all cores by default). Each
+worker loads its log once, computes the baseline and integral of every signal
+for all of its calibration windows (calib_pipeline.py) and returns the
+pump_dataset.csv rows. The rows are merged in job order, with rig and session
+columns in front, into fleet_dataset.csv. Signals that only some logs have
+(grid cells, fg_frac, ...) are left empty for the others, also when they are
+named with --signals. A job that fails is reported and skipped, the rest of the
+fleet still gets written.
+
+Jobs come from a directory tree, one session per directory:
+
+    runs/<rig>/<session>/flow_log.csv      (or flow_log.bin, or a flow_store.py flow_log/ directory)
+    runs/<rig>/<session>/calib_points.csv
+
+or from a CSV with columns rig,session,flow_log,calib[,cam_id] (paths relative
+to that CSV). cam_id picks one camera of a monitor_multicam.py log.
+
+usage:
+    ./batch_analysis.py --root runs
+    ./batch_analysis.py --jobs jobs.csv --workers 4 --out fleet_dataset.csv
+    ./batch_analysis.py --root runs --signals mean_roi,std_roi
+"""
+import argparse, csv, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from log_reader import read_calib_points, flow_log_columns
+from calib_pipeline import log_results, dataset_rows, signal_columns, BASE_COLUMNS
+
+OUT = "fleet_dataset.csv"
+FLOW_LOGS = ("flow_log.csv", "flow_log.bin", "flow_log")   # looked for in this order in a session directory
+CALIB_CSV = "calib_points.csv"
+
+
+def find_jobs(root):
+    # (rig, session, flow_log, calib, cam_id) for every root/<rig>/<session> with a flow log and calib_points.csv
+    jobs = []
+    for rig in sorted(os.listdir(root)):
+        if not os.path.isdir(os.path.join(root, rig)):
+            continue
+        for session in sorted(os.listdir(os.path.join(root, rig))):
+            d = os.path.join(root, rig, session)
+            logs = [os.path.join(d, name) for name in FLOW_LOGS if os.path.exists(os.path.join(d, name))]
+            if logs and os.path.exists(os.path.join(d, CALIB_CSV)):
+                jobs.append((rig, session, logs[0], os.path.join(d, CALIB_CSV), None))
+    return jobs
+
+
+def read_jobs(path):
+    base = os.path.dirname(path)
+    with open(path, 'r', newline='') as f:
+        return [(row['rig'], row['session'], os.path.join(base, row['flow_log']), os.path.join(base, row['calib']),
+                 row.get('cam_id') or None) for row in csv.DictReader(f)]
+
+
+def analyze(job, signals=None):
+    # pump_dataset rows of one job, with rig and session; runs in a worker process
+    rig, session, flow_log, calib_path, cam_id = job
+    calib = read_calib_points(calib_path)
+    cols = flow_log_columns(flow_log)
+    # requested signals this log does not have are left blank in its rows
+    sigs = [s for s in signals if s in cols] if signals else signal_columns(cols)
+    results, counts, n = log_results(flow_log, calib, sigs, cam_id)
+    fieldnames, rows = dataset_rows(calib, results, counts, list(signals) if signals else sigs)
+    for row in rows:
+        row['rig'], row['session'] = rig, session
+    return fieldnames, rows, n
+
+
+def _run(args):
+    # top-level wrapper so the pool can pickle it; errors come back as text
+    job, signals = args
+    try:
+        return analyze(job, signals), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def run_jobs(jobs, signals=None, workers=None):
+    # [(job, result or None, error or None)] in job order
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        return [(job, res, err) for job, (res, err) in zip(jobs, ex.map(_run, [(job, signals) for job in jobs]))]
+
+
+def write_fleet_dataset(path, done):
+    fieldnames = ['rig', 'session'] + BASE_COLUMNS
+    rows = []
+    for names, job_rows, _ in done:
+        fieldnames += [c for c in names if c not in fieldnames]
+        rows += job_rows
+    with open(path, 'w', newline='') as f:
+        w = csv.DictWriter(f, fieldnames=fieldnames, restval='')
+        w.writeheader()
+        w.writerows(rows)
+    return len(rows)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument('--root', help='directory of <rig>/<session>/ directories')
+    src.add_argument('--jobs', help='CSV with rig,session,flow_log,calib[,cam_id]')
+    ap.add_argument('--signals', default=None, help='comma separated log columns (default: all metric columns of each log)')
+    ap.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    ap.add_argument('--out', default=OUT)
+    args = ap.parse_args()
+
+    jobs = find_jobs(args.root) if args.root else read_jobs(args.jobs)
+    if not jobs:
+        print("No jobs found")
+        sys.exit(1)
+    signals = args.signals.split(',') if args.signals else None
+    t0 = time.time()
+    done = []
+    for (rig, session, flow_log, _, _), res, err in run_jobs(jobs, signals, args.workers):
+        if err:
+            print(f"{rig}/{session}: FAILED {err}")
+            continue
+        print(f"{rig}/{session}: {len(res[1])} windows, {res[2]} log rows ({flow_log})")
+        done.append(res)
+    n = write_fleet_dataset(args.out, done)
+    print(f"Wrote {n} rows from {len(done)}/{len(jobs)} logs to {args.out} in {time.time() - t0:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+benchmark.py
+
+Benchmark of the camera hot path, no camera needed.
+
+Runs every stage of the sampling loop over synthetic frames (and optionally a
+recording: video file or image directory, see frame_source.py) at several
+resolutions and ROI sizes, and reports per-stage latency percentiles and the
+frames per second each stage alone would sustain:
+
+  metrics_roi     FrameMetrics.roi() on a BGR frame (predictor scripts)
+  metrics_full    FrameMetrics.full() on a BGR frame (monitor scripts)
+  metrics_luma    FrameMetrics.full() on a gray frame (LUMA capture mode)
+  multi_roi       MultiRoiMetrics 3x4 grid + 2 named ROIs
+  log_csv         FlowLogWriter.write() of one row (batched, fsync on rotate)
+  log_bin         BinaryFlowLog.write() of one record
+  annotate        frame copy + annotate_image()
+  imencode        JPEG encode of a frame (quality 90)
+  imwrite         cv2.imwrite() of the frame to a temp dir
+  decode_full     cv2.imdecode() of the JPEG at full size (mjpeg.py, IMREAD_COLOR)
+  decode_reduced  cv2.imdecode() with IMREAD_REDUCED_GRAYSCALE_2
+  flow_dis        FlowSignal.update() with DIS at the default 96 px working
+                  width (signals.py, SIGNAL = 'flow'; budget adaptation off)
+  flow_farneback  the same with Farneback
+  foreground      ForegroundFraction.update() with MOG2 (signals.py,
+                  FOREGROUND in tailored_test.py); compare with metrics_roi
+  event_loop      one monitor_flow iteration: metrics, event test, baseline
+                  update, CSV row, and annotate + imwrite on event frames
+                  (every other synthetic frame has a pour in the ROI)
+
+Results are written as JSON (with host, CPU, library versions and git commit)
+so runs can be compared across commits and boards:
+
+    python3 benchmark.py                                  # -> bench_<host>_<time>.json
+    python3 benchmark.py --source clips/clip_auto1_....avi --sizes 640x480
+    python3 benchmark.py --compare bench_pi4.json bench_pi5.json
+"""
+import argparse, json, os, platform, socket, subprocess, sys, tempfile, time
+from datetime import datetime
+import numpy as np
+import cv2
+from metrics import FrameMetrics, MultiRoiMetrics
+from flow_logger import FlowLogWriter
+from binlog import BinaryFlowLog
+from baseline import OnlineBaseline
+from signals import FlowSignal, ForegroundFraction
+from image_writer import annotate_image
+
+SIZES = "320x240,640x480,1280x720"
+ROI_SIDES = "0.1,0.3,0.6"     # side of the centred ROI box as a fraction of the frame
+FRAMES = 200                  # timed frames per stage and configuration
+WARMUP = 10
+SYNTH_FRAMES = 16             # distinct synthetic frames, cycled
+MEAN_THRESHOLD = 8.0
+STD_THRESHOLD = 6.0
+
+
+def centred_roi(side):
+    lo, hi = 0.5 - side/2, 0.5 + side/2
+    return (lo, hi, lo, hi)
+
+
+def synthetic_frames(w, h, n=SYNTH_FRAMES, seed=0):
+    # dark background with sensor noise; half of the frames carry a bright "pour" in the centre
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(n):
+        f = np.clip(40 + rng.normal(0, 3, (h, w, 3)), 0, 255).astype(np.uint8)
+        if i % 2:
+            f[int(h*0.3):int(h*0.7), int(w*0.4):int(w*0.6)] = 200
+        frames.append(f)
+    return frames
+
+
+def recorded_frames(source, w, h, limit=SYNTH_FRAMES*4):
+    from frame_source import open_source
+    cap = open_source(source)
+    frames = []
+    while len(frames) < limit:
+        ok, frame, _ = cap.read()
+        if not ok:
+            break
+        frames.append(cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA) if frame.shape[:2] != (h, w) else frame)
+    cap.release()
+    if not frames:
+        raise SystemExit(f"no frames in {source}")
+    return frames
+
+
+def time_stage(fn, frames, n):
+    for i in range(WARMUP):
+        fn(frames[i % len(frames)])
+    lat = np.empty(n)
+    for i in range(n):
+        f = frames[i % len(frames)]
+        t0 = time.perf_counter()
+        fn(f)
+        lat[i] = time.perf_counter() - t0
+    return lat
+
+
+def summarize(lat):
+    ms = lat * 1000.0
+    return {"n": int(len(lat)),
+            "mean_ms": round(float(ms.mean()), 4),
+            "p50_ms": round(float(np.percentile(ms, 50)), 4),
+            "p90_ms": round(float(np.percentile(ms, 90)), 4),
+            "p99_ms": round(float(np.percentile(ms, 99)), 4),
+            "max_ms": round(float(ms.max()), 4),
+            "fps": round(float(1.0 / lat.mean()), 1) if lat.mean() > 0 else None}
+
+
+def stages(roi, tmp, frames):
+    fm = FrameMetrics(roi)
+    fm_luma = FrameMetrics(roi)
+    multi = MultiRoiMetrics(grid=(3,4), named={'left': (0.3,0.7,0.1,0.4), 'right': (0.3,0.7,0.6,0.9)})
+    log = FlowLogWriter(os.path.join(tmp, "bench_log.csv"), fsync='rotate')
+    binlog = BinaryFlowLog(os.path.join(tmp, "bench_log.bin"))
+    text = ["TS:2025-11-25T13:31:00.000000Z", "MEAN_ROI:128.00 DELTA:86.00", "STD_ROI:79.00 DELTA_STD:78.00", "EVENT:1"]
+    jpeg_path = os.path.join(tmp, "bench.jpg")
+    # inputs of the luma and decode stages, prepared outside the timed calls
+    grays = {id(f): cv2.cvtColor(f, cv2.COLOR_BGR2GRAY) for f in frames}
+    jpegs = {id(f): cv2.imencode(".jpg", f, [cv2.IMWRITE_JPEG_QUALITY, 90])[1] for f in frames}
+    row = ["2025-11-25T13:31:00.000000Z", "49.81", "34.49", "128.80", "79.71", 640, 480, 1]
+
+    baseline = OnlineBaseline()
+    # unlimited budget so the stage times the configured width, not the adapted one
+    flows = {m: FlowSignal(roi, m, budget_ms=float('inf')) for m in ('dis', 'farneback')}
+    stamps = iter(range(1, 1 << 62))
+    fg = ForegroundFraction(roi)
+
+    def event_loop(f):
+        mean_all, std_all, mean_roi, std_roi, w, h = fm.full(f)
+        base_mean, base_std = baseline.get(mean_roi, std_roi)
+        delta_mean = mean_roi - base_mean
+        delta_std = std_roi - base_std
+        event = (delta_mean > MEAN_THRESHOLD) or (delta_std > STD_THRESHOLD)
+        baseline.update(time.perf_counter(), mean_roi, std_roi, active=event)
+        log.write(["2025-11-25T13:31:00.000000Z", f"{mean_all:.2f}", f"{std_all:.2f}", f"{mean_roi:.2f}", f"{std_roi:.2f}", w, h, int(event)])
+        if event:
+            cv2.imwrite(jpeg_path, annotate_image(f.copy(), text))
+
+    return {
+        "metrics_roi": fm.roi,
+        "metrics_full": fm.full,
+        "metrics_luma": lambda f: fm_luma.full(grays[id(f)]),
+        "multi_roi": multi,
+        "log_csv": lambda f: log.write(row),
+        "log_bin": lambda f: binlog.write(1.7e9, 49.8, 34.5, 128.8, 79.7, 640, 480, 1),
+        "annotate": lambda f: annotate_image(f.copy(), text),
+        "imencode": lambda f: cv2.imencode(".jpg", f, [cv2.IMWRITE_JPEG_QUALITY, 90]),
+        "imwrite": lambda f: cv2.imwrite(jpeg_path, f),
+        "decode_full": lambda f: cv2.imdecode(jpegs[id(f)], cv2.IMREAD_COLOR),
+        "decode_reduced": lambda f: cv2.imdecode(jpegs[id(f)], cv2.IMREAD_REDUCED_GRAYSCALE_2),
+        "flow_dis": lambda f: flows['dis'].update(f, next(stamps)),
+        "flow_farneback": lambda f: flows['farneback'].update(f, next(stamps)),
+        "foreground": fg.update,
+        "event_loop": event_loop,
+    }, (log, binlog)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def cpu_model():
+    try:
+        with open("/proc/cpuinfo") as f:
+            info = f.read()
+    except OSError:
+        return platform.processor()
+    for key in ("Model", "model name", "Hardware"):   # Pi boards report "Model : Raspberry Pi 4 ..."
+        for line in info.splitlines():
+            if line.startswith(key) and ":" in line:
+                return line.split(":", 1)[1].strip()
+    return platform.processor()
+
+
+def run(args):
+    sizes = [tuple(int(v) for v in s.split("x")) for s in args.sizes.split(",")]
+    sides = [float(s) for s in args.rois.split(",")]
+    sources = ["synthetic"] + ([args.source] if args.source else [])
+    only = set(args.stages.split(",")) if args.stages else None
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for source in sources:
+            for w, h in sizes:
+                frames = synthetic_frames(w, h) if source == "synthetic" else recorded_frames(source, w, h)
+                for side in sides:
+                    fns, closers = stages(centred_roi(side), tmp, frames)
+                    for name, fn in fns.items():
+                        if only and name not in only:
+                            continue
+                        res = summarize(time_stage(fn, frames, args.frames))
+                        results.append({"source": source, "size": f"{w}x{h}", "roi": side, "stage": name, **res})
+                        print(f"{source:>10} {w}x{h} roi={side:.2f} {name:<15} p50:{res['p50_ms']:8.3f}ms "
+                              f"p99:{res['p99_ms']:8.3f}ms fps:{res['fps']}")
+                    for c in closers:
+                        c.close()
+    return {"meta": {"host": socket.gethostname(), "cpu": cpu_model(), "machine": platform.machine(),
+                     "cpus": os.cpu_count(), "python": platform.python_version(), "numpy": np.__version__,
+                     "opencv": cv2.__version__, "cv_threads": cv2.getNumThreads(), "commit": git_commit(),
+                     "utc": datetime.utcnow().isoformat(timespec='seconds') + "Z",
+                     "frames": args.frames, "argv": sys.argv[1:]},
+            "results": results}
+
+
+def compare(path_a, path_b):
+    with open(path_a) as f:
+        a = json.load(f)
+    with open(path_b) as f:
+        b = json.load(f)
+    key = lambda r: (r["source"], r["size"], r["roi"], r["stage"])
+    rb = {key(r): r for r in b["results"]}
+    print(f"A: {path_a} ({a['meta'].get('cpu')}, {a['meta'].get('commit')})")
+    print(f"B: {path_b} ({b['meta'].get('cpu')}, {b['meta'].get('commit')})")
+    print(f"{'source':>10} {'size':>9} {'roi':>4} {'stage':<15} {'A p50':>9} {'B p50':>9} {'B/A':>6}")
+    for r in a["results"]:
+        o = rb.get(key(r))
+        if o is None:
+            continue
+        ratio = o["p50_ms"] / r["p50_ms"] if r["p50_ms"] > 0 else float('nan')
+        print(f"{r['source']:>10} {r['size']:>9} {r['roi']:>4} {r['stage']:<15} {r['p50_ms']:9.3f} {o['p50_ms']:9.3f} {ratio:6.2f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--sizes', default=SIZES, help='comma separated WxH list')
+    ap.add_argument('--rois', default=ROI_SIDES, help='comma separated ROI side fractions')
+    ap.add_argument('--frames', type=int, default=FRAMES, help='timed frames per stage')
+    ap.add_argument('--source', default=None, help='also run on a recording (video file or image directory)')
+    ap.add_argument('--stages', default=None, help='comma separated subset of stages')
+    ap.add_argument('--out', default=None, help='JSON output path')
+    ap.add_argument('--compare', nargs=2, metavar=('A.json', 'B.json'), help='compare two result files')
+    args = ap.parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+    report = run(args)
+    out = args.out or f"bench_{socket.gethostname()}_{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.json"
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=1)
+    print("Saved", out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+binlog.py
+
+Fixed-width binary flow log (append-only) with a memory-mapped reader.
+
+Each sample is one packed record: float64 UTC epoch timestamp followed by the
+float32 metrics (plus frame size and event flag). The file starts with a small
+self-describing header so columns can be added later without breaking old logs:
+
+    b"FLOWBIN1" | uint32 json length | json {"fields": [[name, dtype], ...]} | records...
+
+read_binlog() maps the records with np.memmap, so loading weeks of 30 fps data
+is a header parse plus an mmap instead of a csv.DictReader / fromisoformat loop.
+A record truncated by a crash mid-write is ignored.
+
+usage:
+    python3 binlog.py flow_log.csv flow_log.bin     # convert an existing CSV log
+    log = read_binlog("flow_log.bin"); log['mean_roi'], timestamps(log)
+"""
+import os, sys, json, struct, time, atexit
+import numpy as np
+
+MAGIC = b"FLOWBIN1"
+FLOW_FIELDS = [("ts","<f8"), ("mean_all","<f4"), ("std_all","<f4"), ("mean_roi","<f4"), ("std_roi","<f4"),
+               ("w","<u2"), ("h","<u2"), ("event_flag","u1")]
+FLUSH_ROWS = 256
+FLUSH_SEC = 5.0
+
+
+def _header_bytes(fields):
+    meta = json.dumps({"fields": [list(f) for f in fields]}).encode()
+    return MAGIC + struct.pack("<I", len(meta)) + meta
+
+
+def read_header(path):
+    # returns (numpy dtype, offset of the first record)
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: not a binary flow log")
+        (n,) = struct.unpack("<I", f.read(4))
+        meta = json.loads(f.read(n))
+    return np.dtype([tuple(fd) for fd in meta["fields"]]), len(MAGIC) + 4 + n
+
+
+class BinaryFlowLog:
+    def __init__(self, path, fields=FLOW_FIELDS, flush_rows=FLUSH_ROWS, flush_sec=FLUSH_SEC):
+        self.path = path
+        self.dtype = np.dtype(fields)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            dtype, offset = read_header(path)
+            if dtype != self.dtype:
+                raise ValueError(f"{path}: existing log has fields {dtype.names}, expected {self.dtype.names}")
+            # drop a partial record left by a crash so new records stay aligned
+            size = os.path.getsize(path)
+            whole = offset + (size - offset) // self.dtype.itemsize * self.dtype.itemsize
+            if whole != size:
+                os.truncate(path, whole)
+            self.f = open(path, 'ab')
+        else:
+            self.f = open(path, 'ab')
+            self.f.write(_header_bytes(fields))
+        self.buf = np.zeros(flush_rows, self.dtype)   # reused batch buffer
+        self.n = 0
+        self.flush_sec = flush_sec
+        self.last_flush = time.monotonic()
+        atexit.register(self.close)
+
+    def write(self, *values):
+        self.buf[self.n] = values
+        self.n += 1
+        if self.n == len(self.buf) or time.monotonic() - self.last_flush >= self.flush_sec:
+            self.flush()
+
+    def flush(self):
+        if self.f is None:
+            return
+        if self.n:
+            self.f.write(self.buf[:self.n].tobytes())
+            self.n = 0
+        self.f.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        if self.f is None:
+            return
+        self.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+        self.f = None
+
+
+def read_binlog(path):
+    # structured np.memmap over the records (read-only); empty array for an empty log
+    dtype, offset = read_header(path)
+    n = (os.path.getsize(path) - offset) // dtype.itemsize
+    if n == 0:
+        return np.zeros(0, dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(n,))
+
+
+def timestamps(log):
+    # float epoch seconds -> datetime64[us] (UTC, naive like the CSV timestamps)
+    return (np.asarray(log['ts']) * 1e6).round().astype('datetime64[us]')
+
+
+def csv_to_binlog(csv_path, bin_path):
+    from log_reader import read_flow_log, epoch_seconds
+    log = read_flow_log(csv_path)
+    # columns after event_flag (ROI grid / named ROIs) become extra float32 fields
+    names = [name for name, _ in FLOW_FIELDS]
+    extra = [c for c in log if c != 'timestamp' and c not in names]
+    fields = FLOW_FIELDS + [(c, "<f4") for c in extra]
+    recs = np.zeros(len(log['timestamp']), np.dtype(fields))
+    recs['ts'] = epoch_seconds(log['timestamp'])
+    for name in names[1:] + extra:
+        recs[name] = log[name]
+    with open(bin_path, 'wb') as f:
+        f.write(_header_bytes(fields))
+        f.write(recs.tobytes())
+    return len(recs)
+
+
+def main():
+    if len(sys.argv) != 3:
+        print("Usage: binlog.py FLOW_LOG.csv FLOW_LOG.bin")
+        sys.exit(1)
+    n = csv_to_binlog(sys.argv[1], sys.argv[2])
+    print(f"Wrote {n} records to {sys.argv[2]}")
+
+
+if __name__ == "__main__":
+    main()
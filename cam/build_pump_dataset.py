@@ -1,49 +1,45 @@
 #!/usr/bin/env python3
 import csv, sys
-from datetime import datetime
-import numpy as np
+import os
+from log_reader import read_calib_points, isostamps
+from window_cache import WindowCache
+from calib_pipeline import log_results
 
-def parse(s): return datetime.fromisoformat(s.replace("Z",""))
-
-# load flow_log
-flow=[]
-with open('flow_log.csv','r') as f:
-    r=csv.DictReader(f)
-    for row in r:
-        flow.append({'ts':parse(row['timestamp']),'mean_roi':float(row['mean_roi']),'std_roi':float(row['std_roi'])})
+FLOW_LOG = "flow_log.csv"   # or a flow_store.py segment directory such as "flow_log"
 
 # load calib_points
-with open('calib_points.csv','r') as f:
-    r=csv.DictReader(f)
-    out = []
-    for row in r:
-        start=parse(row['start_ts']); end=parse(row['end_ts'])
-        pre = [x['mean_roi'] for x in flow if x['ts'] < start]
-        pre_std = [x['std_roi'] for x in flow if x['ts'] < start]
-        baseline_mean = float(np.mean(pre)) if pre else 0.0
-        baseline_std = float(np.mean(pre_std)) if pre_std else 0.0
-        sel = [x for x in flow if start <= x['ts'] <= end]
-        if len(sel) < 2:
-            integral_mean = 'NA'; integral_std = 'NA'; samples = len(sel)
-        else:
-            times = np.array([(x['ts']-sel[0]['ts']).total_seconds() for x in sel])
-            vals_mean = np.array([abs(x['mean_roi']-baseline_mean) for x in sel])
-            vals_std = np.array([abs(x['std_roi']-baseline_std) for x in sel])
-            integral_mean = float(np.trapz(vals_mean, times))
-            integral_std = float(np.trapz(vals_std, times))
-            samples = len(sel)
-        out.append({
-            'label':row['label'],
-            'measured_ml':row['volume_ml'],
-            'start_ts':row['start_ts'],
-            'end_ts':row['end_ts'],
-            'integral_mean':integral_mean,
-            'integral_std':integral_std,
-            'baseline_mean':baseline_mean,
-            'baseline_std':baseline_std,
-            'samples':samples,
-            'notes':row.get('notes','')
-        })
+calib = read_calib_points('calib_points.csv')
+notes = calib.get('notes', [''] * len(calib['label']))
+start_ts, end_ts = isostamps(calib['start_ts']), isostamps(calib['end_ts'])
+
+# baselines/integrals of all windows; only new log rows and new/changed windows are computed (window_cache.py),
+# a segment directory is read around each cluster of nearby windows instead
+if os.path.isdir(FLOW_LOG):
+    results, counts, _ = log_results(FLOW_LOG, calib, ['mean_roi', 'std_roi'])
+else:
+    results, counts = WindowCache().compute(FLOW_LOG, calib, ['mean_roi', 'std_roi'])
+out = []
+for k in range(len(calib['label'])):
+    baseline_mean = float(results['mean_roi'][0][k])
+    baseline_std = float(results['std_roi'][0][k])
+    samples = int(counts[k])
+    if samples < 2:
+        integral_mean = 'NA'; integral_std = 'NA'
+    else:
+        integral_mean = float(results['mean_roi'][1][k])
+        integral_std = float(results['std_roi'][1][k])
+    out.append({
+        'label':calib['label'][k],
+        'measured_ml':f"{calib['volume_ml'][k]:.3f}",
+        'start_ts':start_ts[k],
+        'end_ts':end_ts[k],
+        'integral_mean':integral_mean,
+        'integral_std':integral_std,
+        'baseline_mean':baseline_mean,
+        'baseline_std':baseline_std,
+        'samples':samples,
+        'notes':notes[k]
+    })
 with open('pump_dataset.csv','w',newline='') as f:
     w=csv.DictWriter(f, fieldnames=list(out[0].keys()) if out else ['label'])
     w.writeheader()
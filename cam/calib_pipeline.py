@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+calib_pipeline.py
+
+One-pass calibration pipeline: loads flow_log.csv and calib_points.csv once and
+writes calib_integrals.csv, calib_integrals_std.csv and pump_dataset.csv together.
+
+compute_all_calib_integrals.py, compute_all_calib_integrals_std.py,
+build_pump_dataset.py and calibrate_flow.py each reload both files to compute
+nearly the same integrals. Here every signal column of the log (mean_roi,
+std_roi, mean_all, std_all and any extra metric columns such as ROI grid cells
+or fg_frac) goes into one IntegralIndex, and the baselines and integrals of all
+calibration windows are computed per signal with the vectorized index queries
+(integral_index.py).
+
+Results are kept in window_cache.json (window_cache.py): a rebuild reads only
+the log rows appended since the last run and computes only new or changed
+calibration windows. --full ignores the cache and indexes the whole log. A
+flow_store.py segment directory is not cached; the windows are grouped into
+clusters of nearby windows and only the segments around each cluster are read.
+
+Outputs (same formats as the single scripts):
+  calib_integrals.csv       label,volume_ml,integral                   (mean_roi)
+  calib_integrals_std.csv   label,volume_ml,integral_std,baseline_std,samples
+  pump_dataset.csv          build_pump_dataset.py columns, then integral_<col>/
+                            baseline_<col> for every other signal. Columns that
+                            are already in pump_dataset.csv and not produced
+                            here (voltage_V, current_A, rpm from
+                            add_motor_data.sh, ...) are kept, matched by label.
+
+usage:
+    ./calib_pipeline.py
+    ./calib_pipeline.py --flow-log flow_log.bin --signals mean_roi,std_roi,fg_frac
+    ./calib_pipeline.py --flow-log flow_log_multicam.csv --cam-id 0
+    ./calib_pipeline.py --full
+"""
+import argparse, csv, os
+import numpy as np
+from log_reader import read_flow_log, flow_log_columns, read_calib_points, epoch_seconds, isostamps, TEXT_COLS
+from integral_index import IntegralIndex
+from flow_store import window_groups
+from window_cache import WindowCache
+
+FLOW_LOG = "flow_log.csv"
+CALIB_CSV = "calib_points.csv"
+OUT_MEAN = "calib_integrals.csv"
+OUT_STD = "calib_integrals_std.csv"
+PUMP_DATASET = "pump_dataset.csv"
+NOT_SIGNALS = ('timestamp', 'w', 'h', 'event_flag', 'cam_id')
+# pump_dataset.csv names of the two original signals
+LEGACY_NAMES = {'mean_roi': 'mean', 'std_roi': 'std'}
+BASE_COLUMNS = ['label','measured_ml','start_ts','end_ts','integral_mean','integral_std',
+                'baseline_mean','baseline_std','samples','notes']
+
+
+def signal_columns(names):
+    return [c for c in names if c not in NOT_SIGNALS and c not in TEXT_COLS]
+
+
+def load_index(flow_log, signals, cam_id=None):
+    # IntegralIndex over the whole log, or over the rows of one camera
+    log = read_flow_log(flow_log)
+    if cam_id is not None and 'cam_id' in log:
+        sel = log['cam_id'] == cam_id
+        log = {k: v[sel] for k, v in log.items()}
+    return IntegralIndex(epoch_seconds(log['timestamp']), {s: log[s] for s in signals})
+
+
+def window_results(idx, calib, signals):
+    # per signal: (baselines, integrals) over all calibration windows, plus sample counts
+    starts, ends = epoch_seconds(calib['start_ts']), epoch_seconds(calib['end_ts'])
+    results = {}
+    for s in signals:
+        bases = idx.baselines(s, starts)
+        results[s] = (bases, idx.integrals(s, starts, ends, bases))
+    return results, idx.counts(starts, ends)
+
+
+def log_results(flow_log, calib, signals, cam_id=None):
+    # window_results straight from a flow log, plus the number of log rows indexed;
+    # a segment directory is read per cluster of nearby windows (flow_store.window_groups)
+    if not (os.path.isdir(flow_log) and cam_id is None):
+        idx = load_index(flow_log, signals, cam_id)
+        return window_results(idx, calib, signals) + (len(idx),)
+    n = len(calib['label'])
+    results = {s: (np.full(n, np.nan), np.full(n, np.nan)) for s in signals}
+    counts = np.zeros(n, dtype=int)
+    rows = 0
+    for sel, idx in window_groups(flow_log, epoch_seconds(calib['start_ts']), epoch_seconds(calib['end_ts']), signals):
+        part, counts[sel] = window_results(idx, {k: v[sel] for k, v in calib.items()}, signals)
+        for s in signals:
+            results[s][0][sel], results[s][1][sel] = part[s]
+        rows += len(idx)
+    return results, counts, rows
+
+
+def fmt(v, spec=None):
+    if np.isnan(v):
+        return 'NA'
+    return format(v, spec) if spec else float(v)
+
+
+def write_calib_integrals(path, calib, results):
+    _, integ = results['mean_roi']
+    with open(path, 'w', newline='') as f:
+        w = csv.writer(f, lineterminator='\n')
+        w.writerow(['label','volume_ml','integral'])
+        for lab, vol, i in zip(calib['label'], calib['volume_ml'], integ):
+            w.writerow([lab, f"{vol:.3f}", fmt(i, '.6f')])
+
+
+def write_calib_integrals_std(path, calib, results, counts):
+    bases, integ = results['std_roi']
+    with open(path, 'w', newline='') as f:
+        w = csv.writer(f, lineterminator='\n')
+        w.writerow(['label','volume_ml','integral_std','baseline_std','samples'])
+        for lab, vol, i, b, n in zip(calib['label'], calib['volume_ml'], integ, bases, counts):
+            if np.isnan(i):
+                w.writerow([lab, f"{vol:.3f}", 'NA', 'NA', n])
+            else:
+                w.writerow([lab, f"{vol:.3f}", f"{i:.6f}", f"{b:.6f}", n])
+
+
+def existing_columns(path, generated):
+    # columns of an existing pump_dataset.csv that this pipeline does not produce, by label;
+    # integral_/baseline_ columns of signals not selected this time are dropped, not kept stale
+    if not os.path.exists(path):
+        return [], {}
+    with open(path, 'r', newline='') as f:
+        r = csv.DictReader(f)
+        keep = [c for c in (r.fieldnames or []) if c not in generated and not c.startswith(('integral_', 'baseline_'))]
+        rows = {row['label']: {c: row.get(c) or '' for c in keep} for row in r}
+    return keep, rows
+
+
+def dataset_rows(calib, results, counts, signals):
+    # (fieldnames, rows) of pump_dataset.csv for one log and its calibration points;
+    # signals without results (not in this log) get no integral_/baseline_ values
+    extra = [s for s in signals if s not in LEGACY_NAMES]
+    fieldnames = BASE_COLUMNS + [f"{k}_{s}" for s in extra for k in ('integral', 'baseline')]
+    n = len(calib['label'])
+    notes = calib.get('notes', [''] * n)
+    start_ts, end_ts = isostamps(calib['start_ts']), isostamps(calib['end_ts'])
+    rows = []
+    for k in range(n):
+        row = {'label': calib['label'][k], 'measured_ml': f"{calib['volume_ml'][k]:.3f}",
+               'start_ts': start_ts[k], 'end_ts': end_ts[k], 'samples': int(counts[k]), 'notes': notes[k]}
+        for s in signals:
+            if s not in results:
+                continue
+            name = LEGACY_NAMES.get(s, s)
+            bases, integ = results[s]
+            row[f"integral_{name}"] = fmt(integ[k])
+            row[f"baseline_{name}"] = float(bases[k])
+        rows.append(row)
+    return fieldnames, rows
+
+
+def write_pump_dataset(path, calib, results, counts, signals):
+    fieldnames, rows = dataset_rows(calib, results, counts, signals)
+    keep, kept = existing_columns(path, fieldnames)
+    for row in rows:
+        row.update(kept.get(row['label'], {c: '' for c in keep}))
+    with open(path, 'w', newline='') as f:
+        w = csv.DictWriter(f, fieldnames=fieldnames + keep, extrasaction='ignore')
+        w.writeheader()
+        w.writerows(rows)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--flow-log', default=FLOW_LOG, help='flow log (.csv, .bin or a flow_store.py directory)')
+    ap.add_argument('--calib', default=CALIB_CSV)
+    ap.add_argument('--signals', default=None, help='comma separated log columns (default: all metric columns)')
+    ap.add_argument('--cam-id', default=None, help='multicam logs: only use rows of this camera')
+    ap.add_argument('--full', action='store_true', help='index the whole log instead of using window_cache.json')
+    args = ap.parse_args()
+
+    calib = read_calib_points(args.calib)
+    signals = args.signals.split(',') if args.signals else signal_columns(flow_log_columns(args.flow_log))
+    for s in ('mean_roi', 'std_roi'):
+        if s not in signals:
+            signals.append(s)      # needed for the two calib_integrals files
+    if args.full or os.path.isdir(args.flow_log):
+        results, counts, rows = log_results(args.flow_log, calib, signals, args.cam_id)
+        print(f"{rows} log rows")
+    else:
+        results, counts = WindowCache().compute(args.flow_log, calib, signals, args.cam_id)
+
+    write_calib_integrals(OUT_MEAN, calib, results)
+    write_calib_integrals_std(OUT_STD, calib, results, counts)
+    write_pump_dataset(PUMP_DATASET, calib, results, counts, signals)
+    print(f"{len(calib['label'])} calibration windows, signals: {','.join(signals)}")
+    print(f"Wrote {OUT_MEAN}, {OUT_STD}, {PUMP_DATASET}")
+
+
+if __name__ == "__main__":
+    main()
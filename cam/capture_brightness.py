@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 import cv2
-import numpy as np
 import sys
 import time
+from metrics import FrameMetrics
 # device (change if your camera is /dev/video1 etc)
 DEVICE = 0
 
@@ -28,16 +28,7 @@ def main():
         print("ERROR: failed to read final frame")
         sys.exit(4)
 
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    h, w = gray.shape
-    y1 = int(h * ROI[0]); y2 = int(h * ROI[1])
-    x1 = int(w * ROI[2]); x2 = int(w * ROI[3])
-    roi = gray[y1:y2, x1:x2]
-
-    mean_all = float(np.mean(gray))
-    mean_roi = float(np.mean(roi))
-    std_all = float(np.std(gray))
-    std_roi = float(np.std(roi))
+    mean_all, std_all, mean_roi, std_roi, w, h = FrameMetrics(ROI).full(frame)
 
     # print compact single-line output for easy logging
     print(f"MEAN_ALL:{mean_all:.2f} STD_ALL:{std_all:.2f} MEAN_ROI:{mean_roi:.2f} STD_ROI:{std_roi:.2f} SIZE:{w}x{h}")
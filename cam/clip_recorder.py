@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+clip_recorder.py
+
+Pre-trigger event clips from an in-memory frame ring buffer.
+
+Every sampled frame is pushed into a rolling buffer of the last PRE_SEC seconds,
+stored downscaled (or as the ROI crop only, optionally JPEG-compressed) to keep
+memory small. When an event opens, the buffered history becomes the start of the
+clip and frames keep accumulating until the event closes; the whole segment is
+then written as one MJPG .avi on a background thread, with a .csv sidecar
+holding the capture timestamp of every frame (frame_source.py replays with it). One encoded clip per pour
+is far cheaper on the SD card than hundreds of separate event JPEGs, and it
+shows the onset of the pour. An open event keeps at most MAX_EVENT_SEC and
+MAX_EVENT_BYTES of stored frames; later frames are dropped (counted in truncated).
+
+usage:
+    clips = EventClipRecorder(pre_sec=5.0, scale=0.5, jpeg_quality=80)
+    clips.push(frame, ts)          # every sample
+    clips.open_event()             # event state machine opens an event
+    clips.close_event(path)        # event closes -> clip (+ path.csv timestamps) written in background
+                                   # clips.start_ts: capture time of the first frame of the open event
+    clips.close()                  # wait for pending clips at shutdown
+"""
+import os, threading
+from collections import deque
+import cv2
+
+PRE_SEC = 5.0           # seconds of history kept before the trigger
+SCALE = 0.5             # downscale factor for stored frames
+MAX_EVENT_SEC = 120.0   # cap on event length kept in memory
+MAX_EVENT_BYTES = 100_000_000   # cap on stored frame bytes of one event (raw 320x240 BGR: ~14 s at 30 fps)
+FOURCC = "MJPG"
+
+
+def timestamps_path(path):
+    # per-frame capture times of a clip: clip_x.avi -> clip_x.csv
+    return os.path.splitext(path)[0] + ".csv"
+
+
+class EventClipRecorder:
+    def __init__(self, pre_sec=PRE_SEC, scale=SCALE, roi=None, jpeg_quality=None, max_event_sec=MAX_EVENT_SEC,
+                 max_event_bytes=MAX_EVENT_BYTES):
+        self.pre_sec = pre_sec
+        self.scale = scale
+        self.roi = roi                  # fractions y1,y2,x1,x2 to keep only the ROI crop
+        self.jpeg_quality = jpeg_quality  # None keeps raw downscaled frames
+        self.max_event_sec = max_event_sec
+        self.max_event_bytes = max_event_bytes
+        self.event_bytes = 0
+        self.ring = deque()             # (ts, stored frame) before the trigger
+        self.event = None               # frames of the open event, pre-trigger history first
+        self.truncated = 0
+        self.threads = []
+
+    def _store(self, frame):
+        if self.roi is not None:
+            h, w = frame.shape[:2]
+            frame = frame[int(h*self.roi[0]):int(h*self.roi[1]), int(w*self.roi[2]):int(w*self.roi[3])]
+        if self.scale != 1.0:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        elif self.jpeg_quality is None:
+            frame = frame.copy()   # don't keep a view into (or the whole of) the capture buffer
+        if self.jpeg_quality is not None:
+            ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            return buf if ok else None
+        return frame
+
+    def push(self, frame, ts):
+        item = self._store(frame)
+        if item is None:
+            return
+        if self.event is not None:
+            if ts - self.event[0][0] <= self.max_event_sec and self.event_bytes + item.nbytes <= self.max_event_bytes:
+                self.event.append((ts, item))
+                self.event_bytes += item.nbytes
+            else:
+                self.truncated += 1
+            return
+        self.ring.append((ts, item))
+        while self.ring and ts - self.ring[0][0] > self.pre_sec:
+            self.ring.popleft()
+
+    @property
+    def recording(self):
+        return self.event is not None
+
+    @property
+    def start_ts(self):
+        return self.event[0][0] if self.event else None
+
+    def open_event(self):
+        if self.event is None:
+            self.event = list(self.ring)
+            self.event_bytes = sum(item.nbytes for _, item in self.event)
+            self.ring.clear()
+
+    def close_event(self, path):
+        # hands the clip to a writer thread; returns False if there was nothing to write
+        frames, self.event = self.event, None
+        self.event_bytes = 0
+        if frames is None or len(frames) < 2:
+            return False
+        t = threading.Thread(target=self._write, args=(path, frames), daemon=True)
+        t.start()
+        self.threads = [x for x in self.threads if x.is_alive()] + [t]
+        return True
+
+    def _write(self, path, frames):
+        # play back at the rate the frames were actually sampled
+        span = frames[-1][0] - frames[0][0]
+        fps = (len(frames) - 1) / span if span > 0 else 4.0
+        out = None
+        for _, item in frames:
+            img = cv2.imdecode(item, cv2.IMREAD_COLOR) if self.jpeg_quality is not None else item
+            if img.ndim == 2:
+                img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+            if out is None:
+                h, w = img.shape[:2]
+                out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*FOURCC), fps, (w, h))
+                if not out.isOpened():
+                    print("ERROR: could not open clip writer for", path)
+                    return
+            out.write(img)
+        out.release()
+        with open(timestamps_path(path), 'w') as f:
+            f.write("ts\n")
+            f.writelines(f"{ts:.6f}\n" for ts, _ in frames)
+        print(f"Wrote clip {path} frames:{len(frames)} fps:{fps:.1f}")
+
+    def close(self):
+        for t in self.threads:
+            t.join()
+        self.threads = []
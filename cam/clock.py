@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+clock.py
+
+Capture timestamps for the sampling loops.
+
+The old nowstr() had 1 s resolution (flow_log.csv already had duplicate
+timestamps at 4 Hz) and time.time() can step when NTP adjusts the clock, which
+corrupts dt. now() is time.monotonic() anchored to UTC once at import: it never
+goes backwards, differences between stamps are exact, and it still reads as UTC
+epoch seconds. isostamp() formats with microseconds; datetime.fromisoformat()
+in the offline scripts parses it unchanged.
+"""
+import time
+from datetime import datetime
+
+_UTC0 = time.time()
+_MONO0 = time.monotonic()
+
+
+def now():
+    return _UTC0 + (time.monotonic() - _MONO0)
+
+
+def isostamp(t):
+    return datetime.utcfromtimestamp(t).isoformat(timespec='microseconds') + "Z"
@@ -1,28 +1,18 @@
 #!/usr/bin/env python3
-import csv
-from datetime import datetime
-import numpy as np
+from log_reader import read_calib_points, epoch_seconds
+from integral_index import load_window_indexes
 
-def parse(s): return datetime.fromisoformat(s.replace("Z",""))
+FLOW_LOG = "flow_log.csv"   # or a flow_store.py segment directory such as "flow_log"
 
-rows=[]
-with open("flow_log.csv",'r') as f:
-    r=csv.DictReader(f)
-    for row in r:
-        rows.append({'ts':parse(row['timestamp']),'mean_roi':float(row['mean_roi']),'std_roi':float(row['std_roi'])})
-
-with open("calib_points.csv",'r') as f:
-    r=csv.DictReader(f)
-    print("label,volume_ml,integral_std,baseline_std,samples")
-    for row in r:
-        start=parse(row['start_ts']); end=parse(row['end_ts'])
-        pre=[r2['std_roi'] for r2 in rows if r2['ts'] < start]
-        baseline = float(np.mean(pre)) if pre else 0.0
-        sel=[r2 for r2 in rows if start <= r2['ts'] <= end]
-        if len(sel) < 2:
-            print(f"{row['label']},{row['volume_ml']},NA,NA,{len(sel)}")
-            continue
-        times = np.array([(r2['ts']-sel[0]['ts']).total_seconds() for r2 in sel])
-        vals = np.array([abs(r2['std_roi']-baseline) for r2 in sel])
-        integral = np.trapz(vals, times)
-        print(f"{row['label']},{row['volume_ml']},{integral:.6f},{baseline:.6f},{len(sel)}")
+calib = read_calib_points("calib_points.csv")
+starts, ends = epoch_seconds(calib['start_ts']), epoch_seconds(calib['end_ts'])
+idxs = load_window_indexes(FLOW_LOG, starts, ends)
+print("label,volume_ml,integral_std,baseline_std,samples")
+for label, vol, start, end, idx in zip(calib['label'], calib['volume_ml'], starts, ends, idxs):
+    baseline = idx.baseline('std_roi', start)
+    integral = idx.integral('std_roi', start, end, baseline)
+    samples = idx.count(start, end)
+    if integral is None:
+        print(f"{label},{vol:.3f},NA,NA,{samples}")
+        continue
+    print(f"{label},{vol:.3f},{integral:.6f},{baseline:.6f},{samples}")
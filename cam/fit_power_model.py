@@ -1,26 +1,19 @@
 #!/usr/bin/env python3
 import csv, numpy as np, sys
-# read pump_dataset.csv
-labels=[]; flows=[]; volts=[]; currents=[]; rpms=[]
-with open('pump_dataset.csv','r') as f:
-    r=csv.DictReader(f)
-    for row in r:
-        try:
-            vol_ml = float(row['measured_ml'])
-            # compute duration from start/end if available
-            from datetime import datetime
-            start = datetime.fromisoformat(row['start_ts'].replace("Z",""))
-            end = datetime.fromisoformat(row['end_ts'].replace("Z",""))
-            dur = (end - start).total_seconds()
-            if dur <= 0: continue
-            flow = vol_ml / dur  # ml/s
-            V = float(row.get('voltage_V','nan'))
-            I = float(row.get('current_A','nan'))
-            rpm = float(row.get('rpm','nan')) if row.get('rpm') else np.nan
-            if np.isnan(V) or np.isnan(I): continue
-            labels.append(row['label']); flows.append(flow); volts.append(V); currents.append(I); rpms.append(rpm)
-        except Exception as e:
-            continue
+from log_reader import read_pump_dataset, seconds
+from robust_fit import irls, design
+
+FIT_LOSS = 'ols'     # 'ols', 'huber' or 'tukey' (robust_fit.py)
+# read pump_dataset.csv (typed columns, log_reader.py)
+ds = read_pump_dataset('pump_dataset.csv')
+missing = np.full(len(ds['label']), np.nan)
+# duration from start/end; rows without a valid duration or voltage/current are skipped
+dur = seconds(ds['end_ts'] - ds['start_ts'])
+V_all = ds.get('voltage_V', missing); I_all = ds.get('current_A', missing)
+ok = (dur > 0) & ~np.isnan(ds['measured_ml']) & ~np.isnan(V_all) & ~np.isnan(I_all)
+labels = list(ds['label'][ok])
+flows = ds['measured_ml'][ok] / dur[ok]  # ml/s
+volts = V_all[ok]; currents = I_all[ok]; rpms = ds.get('rpm', missing)[ok]
 
 if len(flows) < 2:
     print("Need at least 2 runs with voltage/current to fit.")
@@ -31,19 +24,17 @@ P = volts * currents  # electrical power in W
 
 # Try two models and pick the better (by R2)
 # Model A: P = a * flow + b
-X1 = np.vstack([flows, np.ones_like(flows)]).T
-a1,b1 = np.linalg.lstsq(X1, P, rcond=None)[0]
+fit1 = irls(design(flows), P, FIT_LOSS)
+a1,b1 = fit1.coef
 pred1 = a1*flows + b1
-ss_res1 = ((P - pred1)**2).sum(); ss_tot = ((P - P.mean())**2).sum()
-r21 = 1 - ss_res1/ss_tot if ss_tot>0 else 0.0
+r21 = fit1.r2
 
 # Model B: P = a*flow + c*rpm + b  (use rpm only if available)
 if not np.all(np.isnan(rpms)):
-    X2 = np.vstack([flows, rpms, np.ones_like(flows)]).T
-    a2,c2,b2 = np.linalg.lstsq(X2, P, rcond=None)[0]
+    fit2 = irls(design(flows, rpms), P, FIT_LOSS)
+    a2,c2,b2 = fit2.coef
     pred2 = a2*flows + c2*rpms + b2
-    ss_res2 = ((P - pred2)**2).sum()
-    r22 = 1 - ss_res2/ss_tot if ss_tot>0 else 0.0
+    r22 = fit2.r2
 else:
     r22 = -1.0
 
@@ -52,10 +43,12 @@ if r22 > r21:
     model = 'flow_rpm'
     coeffs = (a2,c2,b2)
     r2 = r22
+    fit = fit2
 else:
     model = 'flow_only'
     coeffs = (a1,b1)
     r2 = r21
+    fit = fit1
 
 # write model
 with open('pump_power_model.txt','w') as f:
@@ -68,6 +61,7 @@ with open('pump_power_model.txt','w') as f:
         f.write(f"a_rpm={coeffs[1]:.6f}\n")
         f.write(f"b={coeffs[2]:.6f}\n")
     f.write(f"R2={r2:.6f}\n")
+    f.write("stderr=" + ",".join(f"{s:.6f}" for s in fit.stderr) + f"\nloss={FIT_LOSS}\n")
     f.write("data_rows:\n")
     for lab,flow,V,I,rpm,pred in zip(labels,flows,volts,currents,rpms,(pred2 if model=='flow_rpm' else pred1)):
         f.write(f"{lab},flow_ml_s={flow:.6f},V={V:.3f},I={I:.3f},P_meas={V*I:.3f},P_pred={pred:.3f}\n")
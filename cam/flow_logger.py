@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+flow_logger.py
+
+Buffered flow_log.csv writer.
+
+Keeps one file handle open and batches rows in memory instead of reopening the
+log and building a csv.writer for every sample. Rows are flushed when the batch
+reaches FLUSH_ROWS or FLUSH_SEC has passed since the last flush, and on close().
+close() is also registered with atexit, so Ctrl-C / sys.exit keep the tail of
+the buffer.
+
+fsync policy (the SD card is the slow part, pick how often to force it):
+  'never'  - leave it to the OS page cache
+  'rotate' - fsync when a file is closed or rotated (default)
+  'flush'  - fsync after every batch
+
+Rotation (off by default, so flow_log.csv keeps growing like before):
+  rotate_bytes - start a new file once the current one reaches this size
+  rotate_daily - start a new file when the UTC day changes
+The closed file is renamed to <name>_<opened UTC time>.csv. An existing log
+whose header differs from the requested one (e.g. extra ROI columns were
+configured) is moved aside the same way before the new header is written.
+"""
+import csv, os, time, atexit
+from datetime import datetime
+
+FLOW_HEADER = ["timestamp","mean_all","std_all","mean_roi","std_roi","w","h","event_flag"]
+FLUSH_ROWS = 40         # rows per batch (10 s at 4 Hz)
+FLUSH_SEC = 5.0         # max seconds a row may sit in memory
+FSYNC_POLICIES = ('never', 'rotate', 'flush')
+
+
+class FlowLogWriter:
+    def __init__(self, path, header=FLOW_HEADER, flush_rows=FLUSH_ROWS, flush_sec=FLUSH_SEC,
+                 fsync='rotate', rotate_bytes=None, rotate_daily=False):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        self.path = path
+        self.header = list(header)
+        self.flush_rows = flush_rows
+        self.flush_sec = flush_sec
+        self.fsync = fsync
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+        self.rows = []
+        self.f = None
+        self._open()
+        atexit.register(self.close)
+
+    def _open(self):
+        new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        if not new and self._existing_header() != self.header:
+            self._move_aside(datetime.utcfromtimestamp(os.path.getmtime(self.path)))
+            new = True
+        self.f = open(self.path, 'a', newline='')
+        self.w = csv.writer(self.f)
+        if new:
+            self.w.writerow(self.header)
+        self.opened = datetime.utcnow()
+        self.last_flush = time.monotonic()
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.flush_rows or time.monotonic() - self.last_flush >= self.flush_sec:
+            self.flush()
+
+    def flush(self):
+        if self.f is None:
+            return
+        if self.rows:
+            if self._should_rotate():
+                self._rotate()
+            self.w.writerows(self.rows)
+            self.rows.clear()
+        self.f.flush()
+        if self.fsync == 'flush':
+            os.fsync(self.f.fileno())
+        self.last_flush = time.monotonic()
+
+    def _should_rotate(self):
+        if self.rotate_daily and datetime.utcnow().date() != self.opened.date():
+            return True
+        return self.rotate_bytes is not None and self.f.tell() >= self.rotate_bytes
+
+    def _existing_header(self):
+        with open(self.path, 'r', newline='') as f:
+            return next(csv.reader(f), [])
+
+    def _rotate(self):
+        self._close_file()
+        self._move_aside(self.opened)
+        self._open()
+
+    def _move_aside(self, stamp):
+        root, ext = os.path.splitext(self.path)
+        dest = f"{root}_{stamp.strftime('%Y%m%dT%H%M%SZ')}{ext}"
+        n = 1
+        while os.path.exists(dest):
+            dest = f"{root}_{stamp.strftime('%Y%m%dT%H%M%SZ')}_{n}{ext}"
+            n += 1
+        os.replace(self.path, dest)
+        print("Moved", self.path, "to", dest)
+
+    def _close_file(self):
+        self.f.flush()
+        if self.fsync != 'never':
+            os.fsync(self.f.fileno())
+        self.f.close()
+        self.f = None
+
+    def close(self):
+        if self.f is None:
+            return
+        self.flush()
+        self._close_file()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
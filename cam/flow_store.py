@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+flow_store.py
+
+Time-partitioned flow log: one CSV segment per UTC day (or hour) in a directory,
+with manifest.json describing every segment.
+
+flow_log.csv is one ever-growing file and every consumer parses all of it, even
+for a 12-second calibration window. SegmentedFlowLog has the FlowLogWriter
+interface (write / flush / close) but routes each row by its timestamp to
+flow_log/2025-11-25.csv (partition='day') or flow_log/2025-11-25T13.csv
+(partition='hour'). After every flush the manifest is rewritten (atomically)
+with, per segment file:
+
+    start, end      first/last sample time (epoch seconds)
+    rows, bytes     row count and file size the stats describe
+    columns         the segment's header
+    min, max, sum   per numeric column over its non-NaN values, count = how many
+                    there are; last = value in the last row (null for NaN)
+
+Readers pick segments from the manifest and open only those overlapping a time
+range. The baseline of a window (mean of all samples before its start) needs
+the older segments only through their row counts and sums, so window_index()
+builds an IntegralIndex over the overlapping segments with the earlier history
+folded into its prefix; the trapezoid sums start at 0 on the first loaded
+segment, which does not matter because integrals are differences. A column
+that an older segment lacks, or NaN cells in it, only reduce that column's
+count, so they do not turn later baselines into NaN. For many calibration
+windows, window_groups() clusters them by time (windows less than CLUSTER_GAP
+apart, and clusters sharing a segment) and builds one such index per cluster,
+so a months-long campaign reads the segments around its windows once each
+rather than everything between the first and the last one.
+
+A segment whose header does not match the configured columns is left alone and
+the rows go to 2025-11-25_1.csv etc. split copies an old flow_log.csv with its
+legacy "640x480" size column split into w,h (log_reader.split_legacy_size). A segment that is larger than its manifest
+entry (crash between the segment flush and the manifest write) is rescanned
+when the writer reopens it; readers treat it as open-ended.
+
+log_reader.read_flow_log() and integral_index.load_flow_index() accept the
+directory in place of a CSV path.
+
+usage:
+    log = SegmentedFlowLog("flow_log", header=FLOW_HEADER, partition='day')
+    log.write([ts, ...]); log.close()
+
+    table = read_segments("flow_log", start, end)           # epoch seconds, None = open
+    idx = window_index("flow_log", start, end, ('mean_roi',))
+    for sel, idx in window_groups("flow_log", starts, ends): ...   # sel: indices of the windows idx answers
+    python3 flow_store.py split flow_log.csv flow_log [day|hour]   # partition an existing log
+    python3 flow_store.py rebuild flow_log                         # rescan segments, rewrite manifest
+    python3 flow_store.py flow_log [START_TS END_TS]               # list (overlapping) segments
+"""
+import os, sys, csv, json, time, atexit
+import numpy as np
+from flow_logger import FlowLogWriter, FLOW_HEADER, FLUSH_ROWS, FLUSH_SEC, FSYNC_POLICIES
+from itertools import islice
+from log_reader import read_flow_log, parse_times, epoch_seconds, split_legacy_size, TIME_COLS, TEXT_COLS
+from integral_index import IntegralIndex, METRICS
+
+STORE_DIR = "flow_log"
+MANIFEST = "manifest.json"
+PARTITIONS = {'day': 10, 'hour': 13}   # length of the ISO timestamp prefix that names a segment
+CLUSTER_GAP = 3600.0   # s: calibration windows closer than this are answered from one segment read
+
+
+def _stat_columns(header):
+    return [(c, name) for c, name in enumerate(header) if name not in TIME_COLS and name not in TEXT_COLS]
+
+
+def _float(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _new_entry(header):
+    return {'start': None, 'end': None, 'rows': 0, 'bytes': 0, 'columns': list(header),
+            'min': {}, 'max': {}, 'sum': {}, 'count': {}, 'last': {}}
+
+
+def _add_stats(entry, ts, columns):
+    # fold a batch (ts: epoch seconds, columns: name -> float array) into a manifest entry
+    entry['rows'] += len(ts)
+    if len(ts) and not np.all(np.isnan(ts)):
+        lo, hi = float(np.nanmin(ts)), float(np.nanmax(ts))
+        entry['start'] = lo if entry['start'] is None else min(entry['start'], lo)
+        entry['end'] = hi if entry['end'] is None else max(entry['end'], hi)
+    counts = entry.setdefault('count', {})
+    for name, v in columns.items():
+        if not len(v):
+            continue
+        ok = ~np.isnan(v)
+        entry['sum'][name] = entry['sum'].get(name, 0.0) + float(np.sum(v[ok]))
+        counts[name] = counts.get(name, 0) + int(np.count_nonzero(ok))
+        entry['last'][name] = float(v[-1]) if ok[-1] else None
+        if ok.any():
+            lo, hi = float(np.nanmin(v)), float(np.nanmax(v))
+            entry['min'][name] = min(entry['min'].get(name, lo), lo)
+            entry['max'][name] = max(entry['max'].get(name, hi), hi)
+
+
+def scan_segment(path):
+    # manifest entry of a segment file, from its contents
+    with open(path, 'r', newline='') as f:
+        header = next(csv.reader(f), [])
+    table = read_flow_log(path)
+    entry = _new_entry(header)
+    _add_stats(entry, epoch_seconds(table['timestamp']),
+               {name: table[name] for _, name in _stat_columns(header) if name in table})
+    entry['bytes'] = os.path.getsize(path)
+    return entry
+
+
+def load_manifest(directory=STORE_DIR):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'partition': None, 'segments': {}}
+
+
+def _json_safe(v):
+    # NaN/inf -> None, so manifest.json stays valid JSON
+    if isinstance(v, dict):
+        return {k: _json_safe(x) for k, x in v.items()}
+    if isinstance(v, list):
+        return [_json_safe(x) for x in v]
+    if isinstance(v, float) and not np.isfinite(v):
+        return None
+    return v
+
+
+def save_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(_json_safe(manifest), f, indent=1, sort_keys=True, allow_nan=False)
+    os.replace(tmp, path)
+
+
+def rebuild_manifest(directory=STORE_DIR):
+    manifest = load_manifest(directory)
+    manifest['segments'] = {name: scan_segment(os.path.join(directory, name))
+                            for name in sorted(os.listdir(directory)) if name.endswith('.csv')}
+    save_manifest(directory, manifest)
+    return manifest
+
+
+class SegmentedFlowLog:
+    def __init__(self, directory=STORE_DIR, header=FLOW_HEADER, partition='day', flush_rows=FLUSH_ROWS,
+                 flush_sec=FLUSH_SEC, fsync='rotate'):
+        if partition not in PARTITIONS:
+            raise ValueError(f"partition must be one of {tuple(PARTITIONS)}, got {partition!r}")
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.header = list(header)
+        self.partition = partition
+        self.flush_rows = flush_rows
+        self.flush_sec = flush_sec
+        self.fsync = fsync
+        self.stat_cols = _stat_columns(self.header)
+        self.manifest = load_manifest(directory)
+        self.manifest['partition'] = partition
+        self.rows = []
+        self.key = None         # period of the open segment
+        self.name = None
+        self.seg = None         # FlowLogWriter of the open segment
+        self.closed = False
+        self.last_flush = time.monotonic()
+        atexit.register(self.close)
+
+    def _segment_name(self, key):
+        # key.csv, or key_1.csv, ... when an existing segment has other columns
+        n = 0
+        while True:
+            name = f"{key}.csv" if n == 0 else f"{key}_{n}.csv"
+            path = os.path.join(self.directory, name)
+            if not os.path.exists(path) or os.path.getsize(path) == 0:
+                return name
+            with open(path, 'r', newline='') as f:
+                if next(csv.reader(f), []) == self.header:
+                    return name
+            n += 1
+
+    def _open(self, key):
+        if self.seg is not None:
+            self.seg.close()
+        self.key = key
+        self.name = self._segment_name(key)
+        path = os.path.join(self.directory, self.name)
+        entry = self.manifest['segments'].get(self.name)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            if entry is None or entry['bytes'] != os.path.getsize(path):
+                print("Rescanning segment", path)
+                self.manifest['segments'][self.name] = scan_segment(path)
+        else:
+            self.manifest['segments'][self.name] = _new_entry(self.header)
+        # batching happens here; the segment writer only writes what flush() hands it
+        self.seg = FlowLogWriter(path, header=self.header, flush_rows=float('inf'), flush_sec=float('inf'),
+                                 fsync=self.fsync)
+        print("Writing flow log segment", path)
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.flush_rows or time.monotonic() - self.last_flush >= self.flush_sec:
+            self.flush()
+
+    def flush(self):
+        if self.closed:
+            return
+        n = PARTITIONS[self.partition]
+        while self.rows:
+            # the leading run of rows that falls into one segment
+            key = str(self.rows[0][0])[:n]
+            k = 1
+            while k < len(self.rows) and str(self.rows[k][0])[:n] == key:
+                k += 1
+            batch, self.rows = self.rows[:k], self.rows[k:]
+            if key != self.key:
+                self._open(key)
+            for row in batch:
+                self.seg.write(row)
+            self.seg.flush()
+            entry = self.manifest['segments'][self.name]
+            _add_stats(entry, epoch_seconds(parse_times([str(r[0]) for r in batch])),
+                       {name: np.array([_float(r[c]) if c < len(r) else np.nan for r in batch])
+                        for c, name in self.stat_cols})
+            entry['bytes'] = os.fstat(self.seg.f.fileno()).st_size
+            save_manifest(self.directory, self.manifest)
+        if self.seg is not None:
+            self.seg.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        if self.seg is not None:
+            self.seg.close()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def segments(directory=STORE_DIR, start=None, end=None):
+    # manifest entries (with their 'file') overlapping [start, end], by start time; None = open bound
+    out = []
+    for name, e in load_manifest(directory).get('segments', {}).items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path) or e['start'] is None:
+            continue
+        e = dict(e, file=name)
+        if os.path.getsize(path) != e['bytes']:
+            e['end'] = float('inf')      # being written or not yet in the manifest
+        if (end is None or e['start'] <= end) and (start is None or e['end'] >= start):
+            out.append(e)
+    return sorted(out, key=lambda e: (e['start'], e['file']))
+
+
+def columns(directory=STORE_DIR):
+    # union of the segment headers, in first-seen order
+    names = []
+    for e in segments(directory):
+        names += [c for c in e['columns'] if c not in names]
+    return names
+
+
+def _concat(tables):
+    names = []
+    for t in tables:
+        names += [c for c in t if c not in names]
+    out = {}
+    for name in names:
+        parts = []
+        for t in tables:
+            n = len(t['timestamp'])
+            if name in t:
+                parts.append(t[name])
+            elif name in TEXT_COLS:
+                parts.append(np.full(n, '', dtype=str))
+            else:
+                parts.append(np.full(n, np.nan))
+        out[name] = np.concatenate(parts) if parts else np.zeros(0)
+    return out
+
+
+def read_segments(directory=STORE_DIR, start=None, end=None):
+    # flow log columns of the segments overlapping [start, end] (whole segments, not trimmed)
+    tables = [read_flow_log(os.path.join(directory, e['file'])) for e in segments(directory, start, end)]
+    if not tables:
+        return {'timestamp': np.zeros(0, 'datetime64[us]')}
+    return _concat(tables)
+
+
+def _count(e, m):
+    # non-NaN values of column m in a segment (manifests written before 'count': all rows, if it has m)
+    if 'count' in e:
+        return e['count'].get(m, 0)
+    return e['rows'] if m in e['sum'] else 0
+
+
+def window_index(directory=STORE_DIR, start=None, end=None, metrics=METRICS):
+    # IntegralIndex over the segments overlapping [start, end]; older segments enter as a prefix (count, sums)
+    hit = segments(directory, start, end)
+    files = {e['file'] for e in hit}
+    before = [e for e in segments(directory, None, start) if e['file'] not in files] if start is not None else []
+    table = read_segments(directory, start, end)
+    prefix = None
+    if before:
+        latest = max(before, key=lambda e: e['end'])
+        prefix = {'n': sum(e['rows'] for e in before), 'ts': latest['end'],
+                  'sums': {m: [sum(_float(e['sum'].get(m)) for e in before if _count(e, m)), 0.0,
+                               latest['last'].get(m), sum(_count(e, m) for e in before)] for m in metrics}}
+    return IntegralIndex(epoch_seconds(table['timestamp']),
+                         {m: table.get(m, np.full(len(table['timestamp']), np.nan)) for m in metrics},
+                         prefix=prefix if prefix and prefix['n'] else None)
+
+
+def window_groups(directory=STORE_DIR, starts=(), ends=(), metrics=METRICS, gap=CLUSTER_GAP):
+    # [(window indices, IntegralIndex)] covering windows [starts[k], ends[k]] (epoch seconds) in clusters;
+    # clusters that touch a common segment are merged, so every segment is read at most once and the
+    # indexes hold distinct rows; windows without a start or end are left out
+    starts, ends = np.asarray(starts, np.float64), np.asarray(ends, np.float64)
+    ok = np.flatnonzero(~np.isnan(starts) & ~np.isnan(ends))
+    ok = ok[np.argsort(starts[ok], kind='stable')]
+    if not len(ok):
+        return []
+    reach = np.maximum.accumulate(ends[ok])
+    segs = segments(directory)
+    groups = []     # [window indices, start, end, segment files]
+    for sel in np.split(ok, np.flatnonzero(starts[ok][1:] - reach[:-1] > gap) + 1):
+        lo, hi = starts[sel].min(), ends[sel].max()
+        files = {e['file'] for e in segs if e['start'] <= hi and e['end'] >= lo}
+        if groups and groups[-1][3] & files:
+            last = groups[-1]
+            last[0], last[2], last[3] = np.concatenate((last[0], sel)), max(last[2], hi), last[3] | files
+        else:
+            groups.append([sel, lo, hi, files])
+    return [(sel, window_index(directory, lo, hi, metrics)) for sel, lo, hi, _ in groups]
+
+
+def split_log(src, directory=STORE_DIR, partition='day', chunk=100000):
+    # copy an existing CSV flow log into segments; legacy "WxH" size cells become w,h, other rows are unchanged
+    with open(src, 'r', newline='') as f:
+        header = next(csv.reader([f.readline()]), [])
+        with SegmentedFlowLog(directory, header, partition, flush_rows=chunk, flush_sec=float('inf')) as log:
+            while True:
+                lines = [line.rstrip('\r\n') for line in islice(f, chunk)]
+                if not lines:
+                    break
+                lines = [line for line in lines if line.strip()]
+                if lines and 'w' in header and 'h' in header:
+                    lines = split_legacy_size(np.array(lines, dtype=str), header).tolist()
+                for row in csv.reader(lines):
+                    log.write(row)
+
+
+def main():
+    args = sys.argv[1:]
+    if len(args) in (3, 4) and args[0] == 'split':
+        split_log(args[1], args[2], args[3] if len(args) > 3 else 'day')
+        print("Wrote", os.path.join(args[2], MANIFEST))
+    elif len(args) == 2 and args[0] == 'rebuild':
+        rebuild_manifest(args[1])
+        print("Wrote", os.path.join(args[1], MANIFEST))
+    elif len(args) in (1, 3) and args[0] not in ('split', 'rebuild'):
+        start, end = epoch_seconds(parse_times(args[1:])) if len(args) == 3 else (None, None)
+        for e in segments(args[0], start, end):
+            print(f"{e['file']}: {e['rows']} rows, {e['start']:.3f} .. {e['end']:.3f}")
+    else:
+        print("Usage: flow_store.py split FLOW_LOG.csv DIR [day|hour] | rebuild DIR | DIR [START_TS END_TS]")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+frame_source.py
+
+Pluggable frame sources for the sampling loops: live camera, recorded video
+file or a directory of images (snapshots/, events/), all behind the grabber
+interface (read / latest / color / pace / warmup / stats / release).
+
+open_source(DEVICE) picks the implementation:
+  0, "/dev/video1", "http://...:8080/?action=stream"  -> live LatestFrameGrabber
+  "clips/clip_auto1_....avi" (any file)               -> replay of a video file
+  "snapshots/" (a directory)                          -> replay of *.jpg / *.png
+
+Replay is deterministic: every frame is delivered in order with its original
+timestamp (video: the per-frame capture times in the .csv sidecar that
+clip_recorder.py writes next to each clip, else the start time from the file
+name or mtime + CAP_PROP_POS_MSEC, which assumes a constant frame rate; images:
+the %Y%m%dT%H%M%SZ stamp in the file name, else 1/fps steps). The loops wait
+with cap.pace(interval, t0) instead of time.sleep(); live sources sleep, a
+replay skips ahead to the first frame `interval` seconds of recording time
+later and returns at once. Runs are therefore reproducible and as fast as the
+pipeline can go; stats() reports the frames per second it reached. Set
+realtime=True to play back at the original speed instead.
+"""
+import glob, os, re, time
+from datetime import datetime
+import cv2
+from grabber import open_grabber
+from clip_recorder import timestamps_path
+
+IMAGE_FPS = 4.0          # spacing for images without a timestamp in the name
+IMAGE_EXTS = ("*.jpg", "*.jpeg", "*.png")
+STAMP_RE = re.compile(r"(\d{8}T\d{6})Z")
+
+
+def name_stamp(path):
+    # UTC epoch seconds of the first %Y%m%dT%H%M%SZ stamp in the file name, else None
+    m = STAMP_RE.search(os.path.basename(path))
+    if not m:
+        return None
+    return (datetime.strptime(m.group(1), "%Y%m%dT%H%M%S") - datetime(1970, 1, 1)).total_seconds()
+
+
+def read_timestamps(path):
+    # capture times from the clip's .csv sidecar (clip_recorder.py), else None
+    side = timestamps_path(path)
+    if not os.path.isfile(side):
+        return None
+    with open(side) as f:
+        next(f, None)
+        return [float(line) for line in f if line.strip()]
+
+
+class VideoFileFrames:
+    # (frame, ts) for each frame of a recorded video
+    def __init__(self, path):
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        start = name_stamp(path)
+        self.start = start if start is not None else os.path.getmtime(path)
+        self.times = read_timestamps(path)
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def __iter__(self):
+        k = 0
+        while True:
+            ok, frame = self.cap.read()
+            if not ok:
+                return
+            if self.times is not None and k < len(self.times):
+                yield frame, self.times[k]
+            else:
+                yield frame, self.start + self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            k += 1
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageDirFrames:
+    # (frame, ts) for each image of a directory, in name order
+    def __init__(self, folder, fps=IMAGE_FPS):
+        self.files = sorted(p for ext in IMAGE_EXTS for p in glob.glob(os.path.join(folder, ext)))
+        self.fps = fps
+
+    def isOpened(self):
+        return bool(self.files)
+
+    def __iter__(self):
+        last = None
+        for p in self.files:
+            frame = cv2.imread(p, cv2.IMREAD_COLOR)
+            if frame is None:
+                continue
+            ts = name_stamp(p)
+            if ts is None or (last is not None and ts <= last):
+                # no stamp, or several images within one second of stamp resolution
+                ts = (last + 1.0/self.fps) if last is not None else (ts or 0.0)
+            last = ts
+            yield frame, ts
+
+    def release(self):
+        pass
+
+
+class ReplaySource:
+    def __init__(self, frames, luma=None, realtime=False):
+        self.frames = frames
+        self.it = iter(frames)
+        self.luma = luma
+        self.realtime = realtime
+        self.skipped = 0        # frames passed over by pace()
+        self.delivered = 0
+        self._next_ts = None
+        self._last = None       # (frame, bgr, ts) last returned by read()
+        self._seq = 0
+        self._wall0 = None
+        self._wall1 = None      # wall time the replay ran out
+        self._ts0 = None
+
+    def isOpened(self):
+        return self.frames.isOpened()
+
+    def _next(self):
+        for bgr, ts in self.it:
+            self._seq += 1
+            if self._next_ts is not None and ts < self._next_ts:
+                self.skipped += 1
+                continue
+            return bgr, ts
+        return None
+
+    def read(self, timeout=None):
+        item = self._next()
+        if item is None:
+            if self._wall1 is None:
+                self._wall1 = time.time()
+                print("Replay finished:", self.stats())
+            return False, None, None
+        bgr, ts = item
+        if self._wall0 is None:
+            self._wall0, self._ts0 = time.time(), ts
+        if self.realtime:
+            ahead = (ts - self._ts0) - (time.time() - self._wall0)
+            if ahead > 0:
+                time.sleep(ahead)
+        frame = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY) if self.luma else bgr
+        self._last = (frame, bgr, ts)
+        self.delivered += 1
+        return True, frame, ts
+
+    def latest(self):
+        if self._last is None:
+            return None
+        return self._last[0], self._last[2], self._seq
+
+    def color(self):
+        return None if self._last is None else self._last[1]
+
+    def pace(self, interval, t0=None):
+        # next read() returns the first frame at least `interval` of recording time later
+        if self._last is not None:
+            self._next_ts = self._last[2] + interval
+
+    def warmup(self, frames=5):
+        # nothing to settle in a recording; every frame is replayed
+        pass
+
+    def stats(self):
+        if self._wall0 is None:
+            return "frames replayed:0"
+        wall = (self._wall1 or time.time()) - self._wall0
+        fps = self.delivered / wall if wall > 0 else 0.0
+        return f"frames replayed:{self.delivered} skipped:{self.skipped} wall:{wall:.2f}s ({fps:.1f} fps)"
+
+    def get(self, prop):
+        return 0.0
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        self.frames.release()
+
+
+def open_source(device=0, luma=None, size=None, realtime=False):
+    if isinstance(device, str) and os.path.isdir(device):
+        return ReplaySource(ImageDirFrames(device), luma=luma, realtime=realtime)
+    if isinstance(device, str) and os.path.isfile(device):
+        return ReplaySource(VideoFileFrames(device), luma=luma, realtime=realtime)
+    return open_grabber(device, luma=luma, size=size)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+grabber.py
+
+Threaded latest-frame grabber shared by the sampling loops.
+
+cv2.VideoCapture.read() blocks and V4L2 keeps a queue of old frames, so a loop
+that reads every INTERVAL seconds integrates frames that are several captures
+stale. LatestFrameGrabber runs the capture on its own thread and keeps only the
+newest frames (with their clock.now() capture timestamps) in a small ring
+buffer, so the consumer always gets the freshest frame and never waits on the
+camera.
+
+Luma mode (luma='YUYV' or 'GREY') asks the UVC device for raw YUYV/GREY and
+turns off OpenCV's BGR conversion; frames handed out are then the 2D Y plane,
+which is all the metrics use, so neither the BGR decode nor cvtColor runs per
+frame. color() still gives a BGR image of the last read() frame for event
+snapshots. A driver that ignores the format request just delivers BGR, which
+is converted as before. An http URL as device reads the mjpg-streamer feed
+instead of the camera (mjpeg.py). size_for_roi() picks the smallest common capture size
+whose ROI crop still has min_px pixels on each side.
+
+usage:
+    cap = LatestFrameGrabber(DEVICE).start()
+    ret, frame, ts = cap.read()      # newest frame not yet consumed
+    item = cap.latest()              # non-blocking: (frame, ts, seq) or None
+    img = cap.color()                # BGR of the frame last returned by read()
+    cap.pace(INTERVAL, t0)           # sleep out the rest of the sampling interval
+    cap.warmup()                     # let exposure settle: drop the first few frames
+    cap.release()
+"""
+import threading, time
+import clock
+from collections import deque
+import cv2
+from mjpeg import open_capture
+
+RING_SIZE = 2            # newest frames kept; older ones are dropped
+READ_TIMEOUT = 2.0       # seconds read() waits for a fresh frame before failing
+MAX_READ_ERRORS = 50     # consecutive failed cap.read() calls before giving up
+# common UVC modes, smallest first
+UVC_SIZES = [(160,120), (176,144), (320,240), (352,288), (640,480), (800,600), (1280,720), (1920,1080)]
+
+
+def size_for_roi(roi, min_px, sizes=UVC_SIZES):
+    # smallest (w, h) whose ROI (fractions y1,y2,x1,x2) is at least min_px on each side
+    for w, h in sizes:
+        if int(h*roi[1]) - int(h*roi[0]) >= min_px and int(w*roi[3]) - int(w*roi[2]) >= min_px:
+            return w, h
+    return sizes[-1]
+
+
+class LatestFrameGrabber:
+    def __init__(self, device=0, ring_size=RING_SIZE, cap=None, luma=None, size=None):
+        self.device = device
+        self.cap = cap if cap is not None else open_capture(device)
+        # ask the driver to keep as few queued buffers as possible (not all backends honour it)
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        if size is not None:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, size[0])
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, size[1])
+        self.luma = luma
+        if luma:
+            self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*luma))
+            self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self._last_raw = None   # raw buffer behind the frame last returned by read()
+        self._ring = deque(maxlen=ring_size)
+        self._cond = threading.Condition()
+        self._seq = 0           # sequence number of the newest captured frame
+        self._consumed = 0      # sequence number last handed out by read()
+        self.skipped = 0        # frames captured but never handed out by read()
+        self._running = False
+        self._failed = False
+        self._thread = None
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"grabber-{self.device}", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        errors = 0
+        while self._running:
+            ok, frame = self.cap.read()
+            ts = clock.now()
+            if not ok:
+                errors += 1
+                if errors >= MAX_READ_ERRORS:
+                    with self._cond:
+                        self._failed = True
+                        self._cond.notify_all()
+                    break
+                time.sleep(0.01)
+                continue
+            errors = 0
+            raw = frame
+            if self.luma:
+                frame = self._y_plane(frame)
+            with self._cond:
+                self._seq += 1
+                self._ring.append((frame, ts, self._seq, raw))
+                self._cond.notify_all()
+
+    def _y_plane(self, raw):
+        # raw YUYV comes as (h, w, 2) or as one row of bytes depending on the backend
+        h, w = self.height, self.width
+        if raw.ndim == 2 and raw.shape[0] == 1 and h and w:
+            if raw.size == h*w*2:
+                raw = raw.reshape(h, w, 2)
+            elif raw.size == h*w:
+                return raw.reshape(h, w)
+        if raw.ndim == 3 and raw.shape[2] == 2:
+            return cv2.extractChannel(raw, 0)
+        if raw.ndim == 3 and raw.shape[2] == 3:
+            return cv2.cvtColor(raw, cv2.COLOR_BGR2GRAY)   # driver ignored the format request
+        return raw.reshape(raw.shape[:2])
+
+    def latest(self):
+        # newest (frame, ts, seq) without blocking; None before the first frame
+        with self._cond:
+            return self._ring[-1][:3] if self._ring else None
+
+    def read(self, timeout=READ_TIMEOUT):
+        # newest frame that has not been returned before; waits only if the
+        # consumer is faster than the camera. Returns (ok, frame, ts).
+        deadline = time.time() + timeout
+        with self._cond:
+            while not self._ring or self._ring[-1][2] == self._consumed:
+                remaining = deadline - time.time()
+                if self._failed or not self._running or remaining <= 0:
+                    return False, None, None
+                self._cond.wait(remaining)
+            frame, ts, seq, raw = self._ring[-1]
+            if self._consumed:
+                self.skipped += seq - self._consumed - 1
+            self._consumed = seq
+            self._last_raw = (frame, raw)
+            return True, frame, ts
+
+    def color(self):
+        # BGR image of the frame last returned by read() (converted only when asked for)
+        if self._last_raw is None:
+            return None
+        frame, raw = self._last_raw
+        if frame.ndim == 3:
+            return frame
+        if raw is not frame and raw.ndim == 3 and raw.shape[2] == 3:
+            return raw
+        if raw.size == frame.size * 2:
+            return cv2.cvtColor(raw.reshape(frame.shape + (2,)), cv2.COLOR_YUV2BGR_YUYV)
+        return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)   # GREY camera, no colour to recover
+
+    def pace(self, interval, t0=None):
+        # wait out the rest of `interval` since t0 (loop start); replay sources skip ahead instead
+        to_sleep = interval - (time.time() - t0) if t0 is not None else interval
+        if to_sleep > 0:
+            time.sleep(to_sleep)
+
+    def warmup(self, frames=5):
+        # discard the first frames while the camera's exposure settles
+        for _ in range(frames):
+            self.read()
+            time.sleep(0.05)
+
+    def stats(self):
+        return f"frames captured:{self._seq} skipped:{self.skipped}"
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def set(self, prop, value):
+        return self.cap.set(prop, value)
+
+    def release(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self.cap.release()
+
+
+def open_grabber(device=0, luma=None, size=None):
+    cap = LatestFrameGrabber(device, luma=luma, size=size)
+    if not cap.isOpened():
+        return cap
+    return cap.start()
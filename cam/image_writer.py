@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+image_writer.py
+
+Bounded background writer for event and snapshot JPEGs.
+
+frame.copy(), annotate_image() and cv2.imwrite() used to run inline in the
+sampling loop; JPEG-encoding a 640x480 frame on a Pi can eat most of the 0.25 s
+budget. AsyncImageWriter takes the frame plus its annotation text and does the
+copy, drawing and encoding on worker threads (OpenCV releases the GIL while it
+draws and encodes).
+
+The queue is bounded. When it is full a frame is dropped instead of stalling
+the loop:
+  'drop_new'    - the incoming frame is dropped (keeps the start of an event)
+  'drop_oldest' - the oldest queued frame is dropped (keeps the newest frames)
+`dropped` counts every frame lost this way.
+
+The submitted frame is only read, never modified, so the caller must not draw
+on it afterwards (frames from grabber.py are fresh arrays per capture).
+"""
+import threading, queue
+import cv2
+
+QUEUE_SIZE = 8
+WORKERS = 1
+JPEG_QUALITY = 90
+DROP_POLICIES = ('drop_new', 'drop_oldest')
+
+
+def annotate_image(img, text_lines, scale=0.6, color=(255,255,255), thickness=1):
+    y = 20
+    for line in text_lines:
+        cv2.putText(img, line, (10, y), cv2.FONT_HERSHEY_SIMPLEX, scale, color, thickness, cv2.LINE_AA)
+        y += int(20 * scale * 1.6)
+    return img
+
+
+class AsyncImageWriter:
+    def __init__(self, workers=WORKERS, queue_size=QUEUE_SIZE, policy='drop_new', jpeg_quality=JPEG_QUALITY):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"policy must be one of {DROP_POLICIES}, got {policy!r}")
+        self.policy = policy
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self.q = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.threads = [threading.Thread(target=self._run, name=f"imgwriter-{i}", daemon=True) for i in range(workers)]
+        for t in self.threads:
+            t.start()
+
+    def submit(self, frame, path, text_lines=None, scale=0.6, color=(255,255,255), thickness=1):
+        # returns False if this frame was dropped
+        job = (frame, path, text_lines, scale, color, thickness)
+        try:
+            self.q.put_nowait(job)
+            return True
+        except queue.Full:
+            pass
+        if self.policy == 'drop_new':
+            self._count_drop()
+            return False
+        try:
+            self.q.get_nowait()
+            self.q.task_done()
+            self._count_drop()
+        except queue.Empty:
+            pass
+        try:
+            self.q.put_nowait(job)
+            return True
+        except queue.Full:
+            self._count_drop()
+            return False
+
+    def _count_drop(self):
+        with self.lock:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            job = self.q.get()
+            try:
+                if job is None:
+                    return
+                frame, path, text_lines, scale, color, thickness = job
+                img = frame
+                if text_lines:
+                    img = annotate_image(frame.copy(), text_lines, scale=scale, color=color, thickness=thickness)
+                ok = cv2.imwrite(path, img, self.params)
+                with self.lock:
+                    if ok:
+                        self.written += 1
+                    else:
+                        self.failed += 1
+            finally:
+                self.q.task_done()
+
+    def close(self):
+        # write out everything still queued, then stop the workers
+        if not self.threads:
+            return
+        for _ in self.threads:
+            self.q.put(None)
+        for t in self.threads:
+            t.join()
+        self.threads = []
+
+    def stats(self):
+        return f"images written:{self.written} dropped:{self.dropped} failed:{self.failed}"
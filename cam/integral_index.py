@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+integral_index.py
+
+Prefix-sum index over a flow log for calibration-window queries.
+
+The calibration scripts used to scan the whole log with list comprehensions for
+every calibration point: one pass for the baseline (mean of everything before
+start) and one for the samples inside [start, end]. IntegralIndex is built once
+over the sorted timestamps and keeps, per metric,
+
+  - the cumulative sum and count of the values   -> baseline before `start`
+  - the cumulative trapezoid sum                 -> integral over [start, end]
+  - per-block min/max                            -> sign check for |v - baseline|
+
+so a window is two np.searchsorted calls plus O(1) arithmetic. The integral of
+|v - baseline| equals +/-(trapezoid(v) - baseline * duration) when all samples in
+the window lie on one side of the baseline, which is the usual case for a pour;
+windows that cross the baseline fall back to a trapezoid over the slice, so the
+results are identical to the old per-window scan.
+
+NaN values (a column missing from older rows or segments, an 'NA' cell) stay
+local, as in the per-window scan: baselines average the non-NaN samples, and
+only windows with a NaN sample inside get a nan integral. The cumulative sums
+skip them and a running count of NaN trapezoid steps marks the windows.
+
+The array forms (baselines / integrals / counts) answer all calibration windows
+at once: the binary searches and prefix differences are vectorized, and the
+one-side test uses np.minimum/maximum.reduceat over the windows.
+
+An index can continue another one: state(k) is the running sums after the first
+k samples (count, last timestamp, and per metric the value sum, trapezoid sum,
+last value and count of non-NaN values), and IntegralIndex(ts, metrics, prefix=state) indexes only the
+samples after it while baselines still average over everything before `start`.
+The sums carry on exactly as if the whole log had been indexed, so an index
+over the rows appended since a checkpoint gives the same numbers.
+
+usage:
+    idx = load_flow_index("flow_log.csv")     # or "flow_log.bin", loaded by log_reader.py
+    idx = load_flow_index("flow_log", start=start, end=end)   # segment directory: only overlapping segments
+    idxs = load_window_indexes("flow_log", starts, ends)      # index per window; segments read per cluster of windows
+    start, end = parse_ts(row['start_ts']), parse_ts(row['end_ts'])
+    base = idx.baseline('mean_roi', start)
+    integral = idx.integral('mean_roi', start, end, base)   # None if < 2 samples
+
+    bases = idx.baselines('mean_roi', starts)                # starts/ends: epoch second arrays
+    integrals = idx.integrals('mean_roi', starts, ends, bases)   # nan where < 2 samples
+
+    state = idx.state(len(idx))                               # JSON-able checkpoint
+    more = IntegralIndex(new_ts, new_metrics, prefix=state)  # rows appended after it
+"""
+import os, warnings
+import numpy as np
+from log_reader import read_flow_log, parse_times, epoch_seconds
+
+FLOW_LOG = "flow_log.csv"
+METRICS = ('mean_roi', 'std_roi')
+BLOCK = 256          # samples per min/max block
+# np.trapz was renamed np.trapezoid in numpy 2.0 and later removed
+trapz = np.trapezoid if hasattr(np, 'trapezoid') else np.trapz
+
+
+def parse_ts(s):
+    # ISO timestamp with trailing Z -> UTC epoch seconds
+    return float(epoch_seconds(parse_times([s]))[0])
+
+
+class IntegralIndex:
+    def __init__(self, ts, metrics, prefix=None):
+        ts = np.asarray(ts, np.float64)
+        order = None
+        if len(ts) > 1 and np.any(np.diff(ts) < 0):
+            order = np.argsort(ts, kind='stable')   # rotated/merged logs may be out of order
+            ts = ts[order]
+        self.ts = ts
+        self.prefix = prefix
+        self.n0 = prefix['n'] if prefix else 0      # samples before ts[0], summarized by prefix
+        self.values = {}
+        self._csum = {}
+        self._ccount = {}       # non-NaN values up to each sample
+        self._ctrap = {}
+        self._cbad = {}         # trapezoid steps with a NaN end up to each sample
+        self._bmin = {}
+        self._bmax = {}
+        dt = np.diff(ts)
+        for name, v in metrics.items():
+            v = np.asarray(v, np.float64)
+            if order is not None:
+                v = v[order]
+            self.values[name] = v
+            ok = ~np.isnan(v)
+            if prefix and prefix['n']:
+                sums = prefix['sums'][name]
+                csum0, ctrap0, last = sums[:3]
+                count0 = sums[3] if len(sums) > 3 else prefix['n']   # states written before the count
+                tt = np.concatenate(([prefix['ts']], ts))
+                vv = np.concatenate(([np.nan if last is None else last], v))
+                steps = (vv[:-1] + vv[1:]) * 0.5 * np.diff(tt)
+                bad = np.isnan(steps)
+                self._csum[name] = np.cumsum(np.concatenate(([csum0], np.where(ok, v, 0.0))))
+                self._ccount[name] = np.cumsum(np.concatenate(([count0], ok)))
+                self._ctrap[name] = np.cumsum(np.concatenate(([ctrap0], np.where(bad, 0.0, steps))))[1:]
+                self._cbad[name] = np.cumsum(bad)
+            else:
+                steps = (v[:-1] + v[1:]) * 0.5 * dt
+                bad = np.isnan(steps)
+                self._csum[name] = np.concatenate(([0.0], np.cumsum(np.where(ok, v, 0.0))))
+                self._ccount[name] = np.concatenate(([0], np.cumsum(ok)))
+                self._ctrap[name] = np.concatenate(([0.0], np.cumsum(np.where(bad, 0.0, steps))))
+                self._cbad[name] = np.concatenate(([0], np.cumsum(bad)))
+            nb = -(-len(v) // BLOCK)
+            padded = np.full(nb * BLOCK, np.nan)
+            padded[:len(v)] = v
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')     # all-NaN blocks stay NaN
+                self._bmin[name] = np.nanmin(padded.reshape(nb, BLOCK), axis=1) if nb else padded
+                self._bmax[name] = np.nanmax(padded.reshape(nb, BLOCK), axis=1) if nb else padded
+
+    def __len__(self):
+        return len(self.ts)
+
+    def window(self, start, end):
+        # index range [i, j) of the samples with start <= ts <= end
+        return int(np.searchsorted(self.ts, start, 'left')), int(np.searchsorted(self.ts, end, 'right'))
+
+    def count(self, start, end):
+        i, j = self.window(start, end)
+        return max(j - i, 0)
+
+    def baseline(self, name, start):
+        # mean of the non-NaN samples before start (0.0 if there are no samples, nan if all are NaN)
+        i = int(np.searchsorted(self.ts, start, 'left'))
+        n = int(self._ccount[name][i])
+        if n:
+            return float(self._csum[name][i] / n)
+        return float('nan') if self.n0 + i else 0.0
+
+    def _minmax(self, name, i, j):
+        v = self.values[name]
+        if j - i <= 2 * BLOCK:
+            s = v[i:j]
+            return s.min(), s.max()
+        b0, b1 = -(-i // BLOCK), j // BLOCK     # whole blocks inside [i, j)
+        parts_min = [v[i:b0*BLOCK].min() if i < b0*BLOCK else np.inf,
+                     self._bmin[name][b0:b1].min(),
+                     v[b1*BLOCK:j].min() if b1*BLOCK < j else np.inf]
+        parts_max = [v[i:b0*BLOCK].max() if i < b0*BLOCK else -np.inf,
+                     self._bmax[name][b0:b1].max(),
+                     v[b1*BLOCK:j].max() if b1*BLOCK < j else -np.inf]
+        return min(parts_min), max(parts_max)
+
+    def integral(self, name, start, end, baseline=0.0):
+        # trapezoid integral of |value - baseline| over [start, end]; None with fewer than 2 samples
+        i, j = self.window(start, end)
+        if j - i < 2:
+            return None
+        if self._cbad[name][j-1] != self._cbad[name][i]:
+            return float('nan')     # a NaN sample inside the window
+        lo, hi = self._minmax(name, i, j)
+        if lo >= baseline or hi <= baseline:
+            raw = self._ctrap[name][j-1] - self._ctrap[name][i] - baseline * (self.ts[j-1] - self.ts[i])
+            return float(abs(raw))
+        # window crosses the baseline: exact trapezoid over the slice
+        return float(trapz(np.abs(self.values[name][i:j] - baseline), self.ts[i:j] - self.ts[i]))
+
+    def counts(self, starts, ends):
+        i = np.searchsorted(self.ts, starts, 'left')
+        j = np.searchsorted(self.ts, ends, 'right')
+        return np.maximum(j - i, 0)
+
+    def baselines(self, name, starts):
+        i = np.searchsorted(self.ts, starts, 'left')
+        n = self._ccount[name][i]
+        return np.where(n > 0, self._csum[name][i] / np.maximum(n, 1), np.where(self.n0 + i > 0, np.nan, 0.0))
+
+    def integrals(self, name, starts, ends, baselines):
+        # integral() for arrays of windows; nan where a window has fewer than 2 samples
+        starts, ends = np.asarray(starts, np.float64), np.asarray(ends, np.float64)
+        baselines = np.broadcast_to(np.asarray(baselines, np.float64), starts.shape)
+        i = np.searchsorted(self.ts, starts, 'left')
+        j = np.searchsorted(self.ts, ends, 'right')
+        out = np.full(starts.shape, np.nan)
+        ok = np.flatnonzero(j - i >= 2)
+        if not len(ok):
+            return out
+        i, j, b = i[ok], j[ok], baselines[ok]
+        v = self.values[name]
+        # reduceat over [i, j) pairs; the appended element keeps j == len(v) a valid index
+        ext = np.append(v, 0.0)
+        bounds = np.stack([i, j], axis=1).ravel()
+        lo = np.minimum.reduceat(ext, bounds)[::2]
+        hi = np.maximum.reduceat(ext, bounds)[::2]
+        raw = self._ctrap[name][j-1] - self._ctrap[name][i] - b * (self.ts[j-1] - self.ts[i])
+        res = np.abs(raw)
+        # windows crossing the baseline: exact trapezoid over the slice
+        for k in np.flatnonzero((lo < b) & (hi > b)):
+            s = slice(i[k], j[k])
+            res[k] = trapz(np.abs(v[s] - b[k]), self.ts[s] - self.ts[i[k]])
+        res[self._cbad[name][j-1] != self._cbad[name][i]] = np.nan    # a NaN sample inside the window
+        out[ok] = res
+        return out
+
+    def state(self, k):
+        # running sums after the first k samples of this index, to continue from with prefix=
+        if k == 0:
+            return self.prefix or {'n': 0, 'ts': None, 'sums': {name: [0.0, 0.0, None, 0] for name in self.values}}
+        return {'n': self.n0 + k, 'ts': float(self.ts[k-1]),
+                'sums': {name: [float(self._csum[name][k]), float(self._ctrap[name][k-1]),
+                                None if np.isnan(v[k-1]) else float(v[k-1]), int(self._ccount[name][k])]
+                         for name, v in self.values.items()}}
+
+
+def load_flow_index(path=FLOW_LOG, metrics=METRICS, start=None, end=None):
+    # start/end (epoch seconds) only matter for a flow_store.py directory: load just the segments that overlap
+    if os.path.isdir(path):
+        from flow_store import window_index
+        return window_index(path, start, end, metrics)
+    log = read_flow_log(path)
+    return IntegralIndex(epoch_seconds(log['timestamp']), {m: log[m] for m in metrics})
+
+
+def load_window_indexes(path=FLOW_LOG, starts=(), ends=(), metrics=METRICS):
+    # an index able to answer each window [starts[k], ends[k]]: the one index of a file, or for a
+    # flow_store.py directory one per cluster of nearby windows (flow_store.window_groups); an empty
+    # index for windows without a start or end
+    if not os.path.isdir(path):
+        return [load_flow_index(path, metrics)] * len(starts)
+    from flow_store import window_groups
+    empty = IntegralIndex(np.zeros(0), {m: np.zeros(0) for m in metrics})
+    out = [empty] * len(starts)
+    for sel, idx in window_groups(path, starts, ends, metrics):
+        for k in sel:
+            out[k] = idx
+    return out
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+log_reader.py
+
+Bulk loaders for the offline tools: flow_log.csv (or .bin), calib_points.csv,
+pump_dataset.csv and calib_integrals.csv straight into typed NumPy columns.
+
+The scripts used to build a list of dicts with one
+datetime.fromisoformat(s.replace("Z","")) per row and convert times back with
+total_seconds() per row. Here a file is read as a dict of column arrays:
+timestamp columns as datetime64[us], label/note/cam_id columns as str, every
+other column as float64 ('' and 'NA' become nan).
+
+Well-formed files go through np.loadtxt with a structured dtype (C parser, about
+a second per million flow-log rows). Flow logs that mix in rows of older loggers
+- the frame size written as one "640x480" column, or fewer metric columns - stay
+on that path: the "WxH" cells are split into w,h on the whole file at once and
+the lines are loaded with one loadtxt call per field count, missing columns
+left nan. Files it still cannot take - calib_points.csv lines with extra note
+fields, 'NA' or empty cells, quoted commas - are read with csv.reader instead:
+short rows are padded with '', extra fields are dropped.
+
+read_flow_log_from() reads only the rows after a byte offset and returns the
+byte offset after each row, for tools that keep a checkpoint of how far into an
+append-only log they have got (window_cache.py). A partial last line, left by a
+logger in the middle of a write, is not returned.
+
+usage:
+    log = read_flow_log("flow_log.csv")        # or "flow_log.bin" (binlog.py), or "flow_log" (flow_store.py)
+    log['timestamp'], log['mean_roi'], epoch_seconds(log['timestamp'])
+    calib = read_calib_points()                # label, volume_ml, start_ts, end_ts
+    seconds(calib['end_ts'] - calib['start_ts'])
+    new, ends = read_flow_log_from("flow_log.csv", offset)   # rows after `offset`; ends[-1] is the next offset
+"""
+import os, csv, warnings
+import numpy as np
+
+FLOW_LOG = "flow_log.csv"
+CALIB_CSV = "calib_points.csv"
+PUMP_DATASET = "pump_dataset.csv"
+TIME_COLS = ('timestamp', 'start_ts', 'end_ts', 'ts')
+TEXT_COLS = ('label', 'notes', 'note', 'cam_id')
+NA = ('', 'NA', 'nan')
+TS_WIDTH = 40        # max characters of a timestamp cell on the loadtxt path
+
+
+def parse_times(strings):
+    # ISO strings with or without trailing Z -> datetime64[us]; unparsable -> NaT
+    a = np.char.rstrip(np.asarray(strings, dtype=str), 'Z')
+    try:
+        return a.astype('datetime64[us]')
+    except ValueError:
+        out = np.full(len(a), np.datetime64('NaT'), 'datetime64[us]')
+        for i, s in enumerate(a):
+            try:
+                out[i] = np.datetime64(s, 'us')
+            except ValueError:
+                pass
+        return out
+
+
+def epoch_seconds(t):
+    # datetime64 -> float64 UTC epoch seconds (NaT -> nan)
+    t = np.asarray(t, 'datetime64[us]')
+    out = t.astype(np.int64) / 1e6
+    return np.where(np.isnat(t), np.nan, out)
+
+
+def seconds(td):
+    # timedelta64 -> float64 seconds (NaT -> nan)
+    td = np.asarray(td, 'timedelta64[us]')
+    return np.where(np.isnat(td), np.nan, td.astype(np.int64) / 1e6)
+
+
+def isostamps(t):
+    # datetime64[us] -> ISO strings with Z, whole seconds when no value has a fraction
+    t = np.asarray(t, 'datetime64[us]')
+    unit = 's' if not np.any(t.astype(np.int64) % 1_000_000) else 'us'
+    return np.char.add(np.datetime_as_string(t, unit=unit), 'Z')
+
+
+def _floats(col):
+    try:
+        return np.array(col, dtype=np.float64)
+    except ValueError:
+        out = np.empty(len(col))
+        for i, s in enumerate(col):
+            try:
+                out[i] = np.nan if s.strip() in NA else float(s)
+            except ValueError:
+                out[i] = np.nan
+        return out
+
+
+def _kind(name):
+    return 'time' if name in TIME_COLS else 'text' if name in TEXT_COLS else 'float'
+
+
+def _read_loadtxt(src, header, skiprows=1):
+    # src: a path or a list of lines
+    fields = [(name, 'U%d' % TS_WIDTH if _kind(name) == 'time' else object if _kind(name) == 'text' else 'f8')
+              for name in header]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')     # "input contained no data" on a header-only file
+        recs = np.loadtxt(src, delimiter=',', skiprows=skiprows, dtype=np.dtype(fields), ndmin=1, encoding='utf-8',
+                          quotechar='"')
+    table = {}
+    for name in header:
+        col = recs[name]
+        kind = _kind(name)
+        table[name] = parse_times(col) if kind == 'time' else col.astype(str) if kind == 'text' else col
+    return table
+
+
+def _read_csv(path):
+    with open(path, 'r', newline='') as f:
+        r = csv.reader(f)
+        header = next(r, [])
+        rows = [row for row in r if row]
+    return header, _columns(rows, len(header))
+
+
+def _columns(rows, n):
+    rows = [row[:n] if len(row) >= n else row + [''] * (n - len(row)) for row in rows]
+    return list(zip(*rows)) if rows else [()] * n
+
+
+def read_table(path):
+    # dict of column name -> array, typed by column name (TIME_COLS, TEXT_COLS, else float)
+    with open(path, 'r', newline='') as f:
+        header = next(csv.reader(f), [])
+    try:
+        return _read_loadtxt(path, header)
+    except ValueError:
+        pass
+    header, cols = _read_csv(path)
+    table = {}
+    for name, col in zip(header, cols):
+        kind = _kind(name)
+        if kind == 'time':
+            table[name] = parse_times(col) if col else np.zeros(0, 'datetime64[us]')
+        elif kind == 'text':
+            table[name] = np.array(col, dtype=str)
+        else:
+            table[name] = _floats(col)
+    return table
+
+
+def _bin_table(log):
+    from binlog import timestamps
+    table = {'timestamp': timestamps(log)}
+    for name in log.dtype.names:
+        if name != 'ts':
+            table[name] = np.asarray(log[name], np.float64)
+    return table
+
+
+def split_legacy_size(lines, header):
+    # older loggers wrote the size as one "WxH" column, one field short of w,h: split those cells in place
+    k = header.index('w')
+    short = np.flatnonzero(np.char.count(lines, ',') < len(header) - 1)
+    prefix = np.zeros(len(short), dtype=lines.dtype)
+    rest = lines[short]
+    for _ in range(k):
+        sep = np.char.partition(rest, ',')
+        prefix = np.char.add(prefix, np.char.add(sep[:, 0], sep[:, 1]))
+        rest = sep[:, 2]
+    x, comma = np.char.find(rest, 'x'), np.char.find(rest, ',')
+    legacy = (x >= 0) & ((x < comma) | (comma < 0))
+    lines[short[legacy]] = np.char.add(prefix[legacy], np.char.replace(rest[legacy], 'x', ',', count=1))
+    return lines
+
+
+def _flow_groups(header, lines):
+    # one loadtxt per field count; columns missing from shorter rows are nan/NaT/''
+    lines = np.array(lines, dtype=str)
+    if 'w' in header and 'h' in header:
+        lines = split_legacy_size(lines, header)
+    fields = np.char.count(lines, ',') + 1
+    if np.any(fields > len(header)):
+        raise ValueError("rows with more fields than the header")
+    table = {}
+    for m in np.unique(fields):
+        sel = np.flatnonzero(fields == m)
+        part = _read_loadtxt(lines[sel].tolist(), header[:m], skiprows=0)
+        for name in header:
+            if name not in table:
+                kind = _kind(name)
+                table[name] = np.full(len(lines), np.datetime64('NaT'), 'datetime64[us]') if kind == 'time' \
+                    else np.full(len(lines), '', dtype=object) if kind == 'text' else np.full(len(lines), np.nan)
+            if name in part:
+                table[name][sel] = part[name]
+    return {name: col.astype(str) if _kind(name) == 'text' else col for name, col in table.items()}
+
+
+def _flow_table(header, src, skiprows=1):
+    # src: the log path, or its data lines without the header (skiprows=0)
+    try:
+        return _read_loadtxt(src, header, skiprows)
+    except ValueError:
+        pass
+    if isinstance(src, str):
+        with open(src, 'r', newline='') as f:
+            lines = [line for line in f.read().splitlines()[skiprows:] if line.strip()]
+    else:
+        lines = [line for line in src if line.strip()]
+    if lines and header:
+        try:
+            return _flow_groups(header, lines)
+        except ValueError:
+            pass
+    if isinstance(src, str):
+        header, cols = _read_csv(src)
+    else:
+        cols = _columns([row for row in csv.reader(src) if row], len(header))
+    table = {}
+    for name, col in zip(header, cols):
+        if _kind(name) == 'time':
+            table[name] = parse_times(col) if col else np.zeros(0, 'datetime64[us]')
+        elif _kind(name) == 'text':
+            table[name] = np.array(col, dtype=str)
+        elif name not in ('w', 'h', 'event_flag'):
+            table[name] = _floats(col)
+    if 'w' in header and cols and cols[0]:
+        w, h, ev = (np.array(cols[header.index(c)], dtype=str) for c in ('w', 'h', 'event_flag'))
+        # older loggers wrote the size as one "WxH" column, shifting event_flag left
+        legacy = np.char.find(w, 'x') >= 0
+        parts = np.char.partition(w, 'x')
+        table['w'] = _floats(np.where(legacy, parts[:, 0], w))
+        table['h'] = _floats(np.where(legacy, parts[:, 2], h))
+        table['event_flag'] = _floats(np.where(legacy, h, ev))
+    return table
+
+
+def read_flow_log(path=FLOW_LOG):
+    # flow log columns; 'timestamp' is datetime64[us] for the CSV, the binary log and a segment directory
+    if os.path.isdir(path):
+        from flow_store import read_segments
+        return read_segments(path)
+    if path.endswith('.bin'):
+        from binlog import read_binlog
+        return _bin_table(read_binlog(path))
+    with open(path, 'r', newline='') as f:
+        header = next(csv.reader(f), [])
+    return _flow_table(header, path)
+
+
+def flow_log_columns(path=FLOW_LOG):
+    # column names of a flow log without reading its rows
+    if os.path.isdir(path):
+        from flow_store import columns
+        return columns(path)
+    if path.endswith('.bin'):
+        from binlog import read_header
+        return ['timestamp' if name == 'ts' else name for name in read_header(path)[0].names]
+    with open(path, 'r', newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def read_flow_log_from(path=FLOW_LOG, offset=0):
+    # (columns of the rows after byte `offset`, byte offset after each row); offset 0 = first row
+    if path.endswith('.bin'):
+        from binlog import read_header
+        dtype, data = read_header(path)
+        offset = max(offset, data)
+        n = max(os.path.getsize(path) - offset, 0) // dtype.itemsize
+        log = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(n,)) if n else np.zeros(0, dtype)
+        return _bin_table(log), offset + dtype.itemsize * np.arange(1, n + 1, dtype=np.int64)
+    with open(path, 'rb') as f:
+        head = f.readline()
+        f.seek(max(offset, len(head)))
+        start = f.tell()
+        chunk = f.read()
+    lines = chunk[:chunk.rfind(b'\n') + 1].split(b'\n')[:-1]    # complete lines only
+    ends = start + np.cumsum([len(line) + 1 for line in lines], dtype=np.int64)
+    keep = [k for k, line in enumerate(lines) if line.strip()]
+    header = next(csv.reader([head.decode('utf-8')]), [])
+    text = [lines[k].decode('utf-8').rstrip('\r') for k in keep]
+    return _flow_table(header, text, skiprows=0), ends[keep]
+
+
+def read_calib_points(path=CALIB_CSV):
+    return read_table(path)
+
+
+def read_pump_dataset(path=PUMP_DATASET):
+    return read_table(path)
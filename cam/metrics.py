@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+metrics.py
+
+Shared frame_metrics engine for the camera scripts.
+
+Only the ROI crop is converted to gray (the full frame only when asked for) and
+mean/std come from one cv2.meanStdDev pass instead of separate np.mean/np.std
+passes. Gray and result buffers are allocated once per frame size and reused,
+so no arrays are allocated per frame.
+
+usage:
+    fm = FrameMetrics(ROI)
+    mean_roi, std_roi = fm.roi(frame)
+    mean_all, std_all, mean_roi, std_roi, w, h = fm.full(frame)
+"""
+import numpy as np
+import cv2
+
+ROI = (0.35,0.65,0.35,0.65)  # center box fraction y1,y2,x1,x2
+
+
+def roi_bounds(roi, w, h):
+    # same rounding as the original per-script frame_metrics
+    return int(h*roi[0]), int(h*roi[1]), int(w*roi[2]), int(w*roi[3])
+
+
+class FrameMetrics:
+    def __init__(self, roi=ROI):
+        self.roi_frac = roi
+        self._shape = None
+        self._gray = None        # full-frame gray buffer, allocated on first full()
+        self._roi_gray = None
+        self._mean = np.zeros((1,1), np.float64)
+        self._std = np.zeros((1,1), np.float64)
+
+    def _prepare(self, shape):
+        h, w = shape[:2]
+        self._shape = shape
+        self.w, self.h = w, h
+        self.y1, self.y2, self.x1, self.x2 = roi_bounds(self.roi_frac, w, h)
+        self._roi_gray = np.empty((self.y2-self.y1, self.x2-self.x1), np.uint8)
+        self._gray = None
+
+    def _gray_of(self, img, dst):
+        # frames from the capture are BGR; already-gray frames are used as-is
+        if img.ndim == 2:
+            return img
+        cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=dst)
+        return dst
+
+    def _mean_std(self, gray):
+        cv2.meanStdDev(gray, mean=self._mean, stddev=self._std)
+        return float(self._mean[0,0]), float(self._std[0,0])
+
+    def roi(self, frame):
+        if frame.shape != self._shape:
+            self._prepare(frame.shape)
+        crop = frame[self.y1:self.y2, self.x1:self.x2]
+        return self._mean_std(self._gray_of(crop, self._roi_gray))
+
+    def full(self, frame):
+        if frame.shape != self._shape:
+            self._prepare(frame.shape)
+        if frame.ndim == 2:
+            gray = frame
+        else:
+            if self._gray is None:
+                self._gray = np.empty((self.h, self.w), np.uint8)
+            gray = self._gray_of(frame, self._gray)
+        mean_all, std_all = self._mean_std(gray)
+        # the ROI is a view into the full gray frame, no second conversion needed
+        mean_roi, std_roi = self._mean_std(gray[self.y1:self.y2, self.x1:self.x2])
+        return mean_all, std_all, mean_roi, std_roi, self.w, self.h
+
+
+
+class MultiRoiMetrics:
+    # mean/std for an N x M grid of cells and/or a dict of named ROIs.
+    # grid=(rows, cols) splits `region` (fractions y1,y2,x1,x2) into equal cells and
+    # reduces them all with one reshape; named={'name': (y1,y2,x1,x2), ...} uses one
+    # integral image so every extra ROI costs four lookups.
+    def __init__(self, grid=None, named=None, region=(0.0,1.0,0.0,1.0)):
+        self.grid = grid
+        self.named = dict(named or {})
+        self.region = region
+        self.columns = []
+        if grid:
+            self.columns += [f"r{i}c{j}_{s}" for i in range(grid[0]) for j in range(grid[1]) for s in ("mean","std")]
+        for name in self.named:
+            self.columns += [f"{name}_mean", f"{name}_std"]
+        self._shape = None
+        self.values = np.zeros(len(self.columns), np.float64)
+
+    def _prepare(self, shape):
+        h, w = shape[:2]
+        self._shape = shape
+        self._gray = np.empty((h, w), np.uint8)
+        if self.grid:
+            rows, cols = self.grid
+            y1, y2, x1, x2 = roi_bounds(self.region, w, h)
+            ch, cw = (y2-y1)//rows, (x2-x1)//cols
+            if ch == 0 or cw == 0:
+                raise ValueError(f"grid {self.grid} too fine for a {w}x{h} frame")
+            # trailing pixels that don't fill a whole cell are left out
+            self._gbox = (y1, y1+ch*rows, x1, x1+cw*cols)
+            self._gcells = (rows, ch, cols, cw)
+            self._sq = np.empty((ch*rows, cw*cols), np.uint16)
+            self._s1 = np.empty((rows, cols), np.uint64)
+            self._s2 = np.empty((rows, cols), np.uint64)
+            self._n_grid = ch * cw
+        if self.named:
+            self._isum = np.empty((h+1, w+1), np.float64)
+            self._isq = np.empty((h+1, w+1), np.float64)
+            b = np.array([roi_bounds(r, w, h) for r in self.named.values()])
+            self._ny1, self._ny2, self._nx1, self._nx2 = b[:,0], b[:,1], b[:,2], b[:,3]
+            self._n_named = ((b[:,1]-b[:,0]) * (b[:,3]-b[:,2])).astype(np.float64)
+
+    def __call__(self, frame):
+        # returns [mean, std, mean, std, ...] in the order of self.columns
+        if frame.shape != self._shape:
+            self._prepare(frame.shape)
+        if frame.ndim == 2:
+            gray = frame
+        else:
+            gray = self._gray
+            cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+        k = 0
+        if self.grid:
+            y1, y2, x1, x2 = self._gbox
+            g = gray[y1:y2, x1:x2]
+            np.multiply(g, g, out=self._sq, dtype=np.uint16)
+            np.sum(g.reshape(self._gcells), axis=(1,3), dtype=np.uint64, out=self._s1)
+            np.sum(self._sq.reshape(self._gcells), axis=(1,3), dtype=np.uint64, out=self._s2)
+            mean = self._s1.ravel() / self._n_grid
+            var = np.maximum(self._s2.ravel() / self._n_grid - mean*mean, 0.0)
+            n = mean.size
+            self.values[0:2*n:2] = mean
+            self.values[1:2*n:2] = np.sqrt(var)
+            k = 2*n
+        if self.named:
+            cv2.integral2(gray, sum=self._isum, sqsum=self._isq, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+            y1, y2, x1, x2 = self._ny1, self._ny2, self._nx1, self._nx2
+            s1 = self._isum[y2,x2] - self._isum[y1,x2] - self._isum[y2,x1] + self._isum[y1,x1]
+            s2 = self._isq[y2,x2] - self._isq[y1,x2] - self._isq[y2,x1] + self._isq[y1,x1]
+            mean = s1 / self._n_named
+            self.values[k::2] = mean
+            self.values[k+1::2] = np.sqrt(np.maximum(s2 / self._n_named - mean*mean, 0.0))
+        return self.values
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+mjpeg.py
+
+Frame source for the mjpg-streamer HTTP feed (output_http.so, ?action=stream).
+
+/dev/video0 can only be opened by one process, so while mjpg_streamer runs the
+scripts could not use the camera, and two scripts could not run at once.
+MjpegCapture keeps one persistent HTTP connection to the multipart stream and
+behaves like a cv2.VideoCapture (read/get/set/isOpened/release), so the
+grabber and the multicam workers use it when DEVICE is a URL:
+
+    DEVICE = "http://localhost:8080/?action=stream"
+
+JPEGs are decoded with IMREAD_REDUCED_* (the DCT is scaled down inside the
+decoder, a fraction of the cost of a full decode plus resize). The factor is
+the largest of 2/4/8 that still gives at least the size requested with
+CAP_PROP_FRAME_WIDTH/HEIGHT (open_grabber(size=...)); without a request the
+full size is decoded. Turning off CAP_PROP_CONVERT_RGB (luma mode) decodes
+straight to grayscale.
+
+A dropped connection makes read() fail once; the next read() reconnects.
+mjpeg_standin.py serves recorded JPEGs the same way for testing without a Pi.
+"""
+import time
+import urllib.request
+import numpy as np
+import cv2
+
+TIMEOUT = 5.0           # seconds to wait on the socket
+RECONNECT_SEC = 1.0     # pause after a failed connect
+FACTORS = (8, 4, 2)
+FLAGS = {  # factor -> (colour flag, gray flag)
+    1: (cv2.IMREAD_COLOR, cv2.IMREAD_GRAYSCALE),
+    2: (cv2.IMREAD_REDUCED_COLOR_2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+    4: (cv2.IMREAD_REDUCED_COLOR_4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    8: (cv2.IMREAD_REDUCED_COLOR_8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+}
+
+
+def is_url(device):
+    return isinstance(device, str) and device.startswith(("http://", "https://"))
+
+
+class MjpegCapture:
+    def __init__(self, url, reduce=None, gray=False, timeout=TIMEOUT):
+        self.url = url
+        self.reduce = reduce    # None: pick from the requested size on the first frame
+        self.gray = gray
+        self.timeout = timeout
+        self.size = None        # requested (w, h)
+        self.w = self.h = 0     # size of the decoded frames
+        self.resp = None
+        self._connect()
+
+    def _connect(self):
+        try:
+            self.resp = urllib.request.urlopen(self.url, timeout=self.timeout)
+        except OSError as e:
+            print("MJPEG connect failed:", self.url, e)
+            self.resp = None
+
+    def isOpened(self):
+        return self.resp is not None
+
+    def _next_jpeg(self):
+        # skip boundary and part headers, then read exactly Content-Length bytes
+        length = None
+        while True:
+            line = self.resp.readline()
+            if not line:
+                raise EOFError("stream closed")
+            line = line.strip()
+            if line[:15].lower() == b"content-length:":
+                length = int(line[15:])
+            elif not line and length is not None:
+                break
+        data = self.resp.read(length)
+        if len(data) < length:
+            raise EOFError("short JPEG")
+        return data
+
+    def _pick_reduce(self, buf):
+        if self.size is None:
+            return 1
+        # one full-size header probe on the first frame
+        img = cv2.imdecode(buf, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            return 1
+        h, w = img.shape
+        for f in FACTORS:
+            if w // f >= self.size[0] and h // f >= self.size[1]:
+                return f
+        return 1
+
+    def read(self, image=None):
+        if self.resp is None:
+            self._connect()
+            if self.resp is None:
+                time.sleep(RECONNECT_SEC)
+                return False, None
+        try:
+            data = self._next_jpeg()
+        except (OSError, EOFError, ValueError) as e:
+            print("MJPEG stream error:", e)
+            self.resp.close()
+            self.resp = None
+            return False, None
+        buf = np.frombuffer(data, np.uint8)
+        if self.reduce is None:
+            self.reduce = self._pick_reduce(buf)
+        frame = cv2.imdecode(buf, FLAGS[self.reduce][1 if self.gray else 0])
+        if frame is None:
+            return False, None
+        self.h, self.w = frame.shape[:2]
+        if image is not None and image.shape == frame.shape:
+            image[...] = frame
+            return True, image
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.w)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.h)
+        return 0.0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self.size = (int(value), self.size[1] if self.size else 0)
+        elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self.size = (self.size[0] if self.size else 0, int(value))
+        elif prop == cv2.CAP_PROP_CONVERT_RGB:
+            self.gray = not value
+        else:
+            return False
+        return True
+
+    def release(self):
+        if self.resp is not None:
+            self.resp.close()
+            self.resp = None
+
+
+def open_capture(device):
+    # cv2.VideoCapture for a device index/path, MjpegCapture for an http URL
+    if is_url(device):
+        return MjpegCapture(device)
+    return cv2.VideoCapture(device)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+mjpeg_standin.py
+
+Local stand-in for mjpg-streamer: serves recorded JPEGs (snapshots/ by default)
+in a loop as a multipart MJPEG stream, in the same format as output_http.so.
+
+    python3 mjpeg_standin.py [DIR] [--port 8080] [--fps 15]
+
+Then point a script at it, e.g. DEVICE = "http://localhost:8080/?action=stream".
+?action=snapshot returns a single JPEG. Each client gets its own stream.
+"""
+import argparse, glob, os, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BOUNDARY = "boundarydonotcross"
+
+
+def load_jpegs(folder):
+    files = sorted(glob.glob(os.path.join(folder, "*.jpg")))
+    if not files:
+        raise SystemExit(f"no .jpg files in {folder}")
+    frames = []
+    for p in files:
+        with open(p, 'rb') as f:
+            frames.append(f.read())
+    return frames
+
+
+def make_handler(frames, fps):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if "action=snapshot" in self.path:
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(frames[0])))
+                self.end_headers()
+                self.wfile.write(frames[0])
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", f"multipart/x-mixed-replace;boundary={BOUNDARY}")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            i = 0
+            try:
+                while True:
+                    t0 = time.time()
+                    jpg = frames[i % len(frames)]
+                    self.wfile.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                     f"Content-Length: {len(jpg)}\r\nX-Timestamp: {t0:.6f}\r\n\r\n".encode())
+                    self.wfile.write(jpg)
+                    self.wfile.write(b"\r\n")
+                    i += 1
+                    time.sleep(max(0.0, 1.0/fps - (time.time() - t0)))
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, fmt, *args):
+            print(self.address_string(), fmt % args)
+
+    return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('folder', nargs='?', default="snapshots")
+    ap.add_argument('--port', type=int, default=8080)
+    ap.add_argument('--fps', type=float, default=15.0)
+    args = ap.parse_args()
+    frames = load_jpegs(args.folder)
+    server = ThreadingHTTPServer(("", args.port), make_handler(frames, args.fps))
+    server.daemon_threads = True
+    print(f"Serving {len(frames)} frames from {args.folder} at {args.fps} fps on http://localhost:{args.port}/?action=stream")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopped by user")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,105 +1,115 @@
 #!/usr/bin/env python3
-import cv2, numpy as np, time, csv, sys, os
+import time, sys, os
 from datetime import datetime
+from grabber import size_for_roi
+from frame_source import open_source
+import clock
+from metrics import FrameMetrics, MultiRoiMetrics
+from flow_logger import FlowLogWriter, FLOW_HEADER
+from flow_store import SegmentedFlowLog
+from binlog import BinaryFlowLog, FLOW_FIELDS
+from image_writer import AsyncImageWriter
+from sampling import AdaptiveRate
+from baseline import OnlineBaseline
 
-DEVICE = 0            # change if your camera is /dev/video1
+DEVICE = 0            # change if your camera is /dev/video1, or "http://localhost:8080/?action=stream" for mjpg-streamer
 INTERVAL = 0.25       # seconds between samples (4 Hz)
+HIGH_RATE = False     # True: process every camera frame (native fps) instead of one per INTERVAL
+ADAPTIVE_RATE = True      # sample every IDLE_INTERVAL while quiet, every frame once the ROI starts to move (sampling.py)
+IDLE_INTERVAL = 1.0       # seconds between samples while quiet (ADAPTIVE_RATE)
+PRE_MEAN_THRESHOLD = 3.0  # |delta_mean| / |delta_std| that switch to full rate, keep below the event thresholds
+PRE_STD_THRESHOLD = 2.0
+RATE_QUIET_SEC = 2.0      # back to IDLE_INTERVAL after this long below the pre-thresholds
 ROI = (0.35,0.65,0.35,0.65)  # center box fraction y1,y2,x1,x2
+LUMA = None           # 'YUYV' or 'GREY': read the camera's Y plane directly, no BGR decode/cvtColor (grabber.py)
+MIN_ROI_PX = None     # e.g. 64: capture at the smallest size whose ROI is still 64 px on each side
+ROI_GRID = None       # e.g. (3,4): also log mean/std of every cell of a 3x4 grid over the frame
+ROI_NAMED = None      # e.g. {'left': (0.3,0.7,0.1,0.4)}: also log mean/std of named ROIs (y1,y2,x1,x2)
 LOGFILE = "flow_log.csv"
+BINLOG = None         # e.g. "flow_log.bin" to also write fixed-width binary records (binlog.py)
 SAVE_ON_EVENT = True
+IMAGE_QUEUE = 8          # event/snapshot frames waiting to be encoded; more are dropped (image_writer.py)
+IMAGE_DROP_POLICY = 'drop_new'  # or 'drop_oldest'
 EVENT_DIR = "events"
 MEAN_THRESHOLD = 8.0   # delta above baseline mean to flag event (adjustable)
 STD_THRESHOLD = 6.0    # delta above baseline std to flag event
-BASELINE_SAMPLES = 20  # samples to compute baseline at start
-
-def nowstr():
-    return datetime.utcnow().isoformat(timespec='seconds') + "Z"
+BASELINE_SAMPLES = 20  # samples averaged before the baseline switches to drift tracking
+BASELINE_TAU = 300.0   # s: baseline follows lighting drift while no event (baseline.py); None freezes it after BASELINE_SAMPLES
+LOG_FSYNC = 'rotate'      # flow log fsync policy: 'never', 'rotate' or 'flush' (see flow_logger.py)
+LOG_ROTATE_BYTES = None   # e.g. 50_000_000 to start a new flow log every ~50 MB
+LOG_ROTATE_DAILY = False  # start a new flow log each UTC day
+LOG_PARTITION = None      # 'day' or 'hour': write LOG_DIR/<period>.csv segments + manifest.json instead of LOGFILE (flow_store.py)
+LOG_DIR = "flow_log"
 
 def open_cam():
-    cap = cv2.VideoCapture(DEVICE)
+    cap = open_source(DEVICE, luma=LUMA, size=size_for_roi(ROI, MIN_ROI_PX) if MIN_ROI_PX else None)
     if not cap.isOpened():
         print("ERROR: camera not opened")
         sys.exit(2)
     return cap
 
-def frame_metrics(frame):
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    h,w = gray.shape
-    y1 = int(h*ROI[0]); y2 = int(h*ROI[1])
-    x1 = int(w*ROI[2]); x2 = int(w*ROI[3])
-    roi = gray[y1:y2, x1:x2]
-    return float(np.mean(gray)), float(np.std(gray)), float(np.mean(roi)), float(np.std(roi)), w, h, gray
+fm = FrameMetrics(ROI)
+multi = MultiRoiMetrics(grid=ROI_GRID, named=ROI_NAMED) if (ROI_GRID or ROI_NAMED) else None
+extra_cols = multi.columns if multi else []
 
 def ensure_dirs():
     if SAVE_ON_EVENT and not os.path.exists(EVENT_DIR):
         os.makedirs(EVENT_DIR, exist_ok=True)
 
-def write_header_if_needed():
-    if not os.path.exists(LOGFILE):
-        with open(LOGFILE,'w',newline='') as f:
-            w = csv.writer(f)
-            w.writerow(["timestamp","mean_all","std_all","mean_roi","std_roi","w","h","event_flag"])
-
 def main():
     ensure_dirs()
-    write_header_if_needed()
     cap = open_cam()
-    # warm up
-    for _ in range(5):
-        cap.read()
-        time.sleep(0.05)
-
-    # baseline
-    baseline_means = []
-    baseline_stds = []
-    print("Collecting baseline samples...")
-    for i in range(BASELINE_SAMPLES):
-        ret, frame = cap.read()
-        if not ret:
-            print("ERROR: failed to read frame during baseline")
-            cap.release()
-            sys.exit(3)
-        mean_all, std_all, mean_roi, std_roi, w, h, _ = frame_metrics(frame)
-        baseline_means.append(mean_roi)
-        baseline_stds.append(std_roi)
-        print(f"BASE {i+1}/{BASELINE_SAMPLES} ROI_MEAN:{mean_roi:.2f} ROI_STD:{std_roi:.2f}")
-        time.sleep(INTERVAL)
+    cap.warmup()
 
-    base_mean = float(np.mean(baseline_means))
-    base_std = float(np.mean(baseline_stds))
-    print(f"BASELINE DONE mean_roi={base_mean:.2f} std_roi={base_std:.2f}")
+    # provisional baseline from the first frame, settles over BASELINE_SAMPLES, then tracks drift
+    baseline = OnlineBaseline(BASELINE_SAMPLES, BASELINE_TAU)
     print("Starting monitoring loop. Press Ctrl-C to stop.")
 
+    if LOG_PARTITION:
+        log = SegmentedFlowLog(LOG_DIR, header=FLOW_HEADER + extra_cols, partition=LOG_PARTITION, fsync=LOG_FSYNC)
+    else:
+        log = FlowLogWriter(LOGFILE, header=FLOW_HEADER + extra_cols, fsync=LOG_FSYNC, rotate_bytes=LOG_ROTATE_BYTES, rotate_daily=LOG_ROTATE_DAILY)
+    binlog = BinaryFlowLog(BINLOG, fields=FLOW_FIELDS + [(c,'<f4') for c in extra_cols]) if BINLOG else None
+    writer = AsyncImageWriter(queue_size=IMAGE_QUEUE, policy=IMAGE_DROP_POLICY)
+    rate = AdaptiveRate(IDLE_INTERVAL, 0.0, (PRE_MEAN_THRESHOLD, PRE_STD_THRESHOLD), RATE_QUIET_SEC)
     try:
         while True:
             t0 = time.time()
-            ret, frame = cap.read()
+            ret, frame, frame_ts = cap.read()
             if not ret:
                 print("ERROR: failed to read frame")
                 break
-            mean_all, std_all, mean_roi, std_roi, w, h, gray = frame_metrics(frame)
+            mean_all, std_all, mean_roi, std_roi, w, h = fm.full(frame)
+            extra = multi(frame) if multi else ()
+            base_mean, base_std = baseline.get(mean_roi, std_roi)
             delta_mean = mean_roi - base_mean
             delta_std = std_roi - base_std
             event = (delta_mean > MEAN_THRESHOLD) or (delta_std > STD_THRESHOLD)
-            ts = nowstr()
+            if baseline.update(frame_ts, mean_roi, std_roi, active=event):
+                print(f"BASELINE DONE mean_roi={baseline.mean[0]:.2f} std_roi={baseline.mean[1]:.2f}")
+            interval = rate.update(frame_ts, delta_mean, delta_std) if ADAPTIVE_RATE else INTERVAL
+            ts = clock.isostamp(frame_ts)
             # print compact line
             print(f"{ts} MEAN_ROI:{mean_roi:.2f} DELTA:{delta_mean:.2f} STD_ROI:{std_roi:.2f} DELTA_STD:{delta_std:.2f} EVENT:{int(event)}")
             # append to CSV
-            with open(LOGFILE,'a',newline='') as f:
-                wcsv = csv.writer(f)
-                wcsv.writerow([ts, f"{mean_all:.2f}", f"{std_all:.2f}", f"{mean_roi:.2f}", f"{std_roi:.2f}", f"{w}x{h}", int(event)])
+            log.write([ts, f"{mean_all:.2f}", f"{std_all:.2f}", f"{mean_roi:.2f}", f"{std_roi:.2f}", w, h, int(event)] + [f"{v:.2f}" for v in extra])
+            if binlog:
+                binlog.write(frame_ts, mean_all, std_all, mean_roi, std_roi, w, h, int(event), *extra)
             # save frame on event
             if event and SAVE_ON_EVENT:
-                fname = f"{EVENT_DIR}/evt_{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.jpg"
-                cv2.imwrite(fname, frame)
+                fname = f"{EVENT_DIR}/evt_{datetime.utcfromtimestamp(frame_ts).strftime('%Y%m%dT%H%M%SZ')}.jpg"
+                writer.submit(cap.color(), fname)
             # sleep to maintain interval
-            elapsed = time.time() - t0
-            to_sleep = INTERVAL - elapsed
-            if to_sleep > 0:
-                time.sleep(to_sleep)
+            cap.pace(0.0 if HIGH_RATE else interval, t0)
     except KeyboardInterrupt:
         print("Stopped by user")
     finally:
+        log.close()
+        if binlog:
+            binlog.close()
+        writer.close()
+        print(writer.stats())
+        print(cap.stats())
         cap.release()
 
 if __name__ == "__main__":
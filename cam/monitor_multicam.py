@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+monitor_multicam.py
+
+monitor_flow.py for several pump outlets at once. Each camera in DEVICES gets
+its own capture process (multicam.py) that decodes into shared memory; metrics,
+event detection and logging run here on the shared frames. Every flow log row
+carries the camera id in a trailing cam_id column.
+
+usage: ./monitor_multicam.py
+"""
+import time, os
+from datetime import datetime
+from multicam import CameraSupervisor
+import clock
+from metrics import FrameMetrics
+from flow_logger import FlowLogWriter, FLOW_HEADER
+from flow_store import SegmentedFlowLog
+from image_writer import AsyncImageWriter
+from sampling import AdaptiveRate
+from baseline import OnlineBaseline
+
+DEVICES = [0, 1]      # /dev/video0, /dev/video1, ... or mjpg-streamer URLs
+WIDTH = 640
+HEIGHT = 480
+INTERVAL = 0.25       # seconds between samples per camera
+HIGH_RATE = False     # True: process every camera frame (native fps) instead of one per INTERVAL
+ADAPTIVE_RATE = True      # sample every IDLE_INTERVAL while quiet, every frame once the ROI starts to move (sampling.py)
+IDLE_INTERVAL = 1.0       # seconds between samples while quiet (ADAPTIVE_RATE)
+PRE_MEAN_THRESHOLD = 3.0  # |delta_mean| / |delta_std| that switch to full rate, keep below the event thresholds
+PRE_STD_THRESHOLD = 2.0
+RATE_QUIET_SEC = 2.0      # back to IDLE_INTERVAL after this long below the pre-thresholds
+ROI = (0.35,0.65,0.35,0.65)
+LOGFILE = "flow_log_multicam.csv"
+LOG_FSYNC = 'rotate'
+LOG_PARTITION = None      # 'day' or 'hour': write LOG_DIR/<period>.csv segments + manifest.json instead of LOGFILE (flow_store.py)
+LOG_DIR = "flow_log_multicam"
+SAVE_ON_EVENT = True
+EVENT_DIR = "events"
+MEAN_THRESHOLD = 8.0
+STD_THRESHOLD = 6.0
+BASELINE_SAMPLES = 20
+BASELINE_TAU = 300.0   # s: baseline follows lighting drift while no event (baseline.py); None freezes it after BASELINE_SAMPLES
+
+def main():
+    if SAVE_ON_EVENT:
+        os.makedirs(EVENT_DIR, exist_ok=True)
+    sup = CameraSupervisor(DEVICES, WIDTH, HEIGHT).start()
+    cams = [{'fm': FrameMetrics(ROI), 'baseline': OnlineBaseline(BASELINE_SAMPLES, BASELINE_TAU), 'due': 0.0,
+             'rate': AdaptiveRate(IDLE_INTERVAL, 0.0, (PRE_MEAN_THRESHOLD, PRE_STD_THRESHOLD), RATE_QUIET_SEC)}
+            for _ in DEVICES]
+    if LOG_PARTITION:
+        log = SegmentedFlowLog(LOG_DIR, header=FLOW_HEADER + ["cam_id"], partition=LOG_PARTITION, fsync=LOG_FSYNC)
+    else:
+        log = FlowLogWriter(LOGFILE, header=FLOW_HEADER + ["cam_id"], fsync=LOG_FSYNC)
+    writer = AsyncImageWriter()
+    print(f"Watching cameras {DEVICES}. Press Ctrl-C to stop.")
+    try:
+        while True:
+            t0 = time.time()
+            for i, dev in enumerate(DEVICES):
+                if sup.failed(i):
+                    raise RuntimeError(f"camera {dev} stopped delivering frames")
+                cam = cams[i]
+                if t0 < cam['due']:
+                    continue   # each camera keeps its own (idle or full) rate
+                item = sup.latest(i)
+                if item is None:
+                    continue
+                frame, frame_ts, seq = item
+                mean_all, std_all, mean_roi, std_roi, w, h = cam['fm'].full(frame)
+                if not sup.intact(i, seq):
+                    continue   # the worker lapped this slot while we measured it
+                cam['due'] = t0 + (0.0 if HIGH_RATE else INTERVAL)
+                baseline = cam['baseline']
+                base_mean, base_std = baseline.get(mean_roi, std_roi)
+                delta_mean = mean_roi - base_mean
+                delta_std = std_roi - base_std
+                event = (delta_mean > MEAN_THRESHOLD) or (delta_std > STD_THRESHOLD)
+                if baseline.update(frame_ts, mean_roi, std_roi, active=event):
+                    print(f"CAM {dev} BASELINE DONE mean_roi={baseline.mean[0]:.2f} std_roi={baseline.mean[1]:.2f}")
+                if ADAPTIVE_RATE and not HIGH_RATE:
+                    cam['due'] = t0 + cam['rate'].update(frame_ts, delta_mean, delta_std)
+                ts = clock.isostamp(frame_ts)
+                print(f"{ts} CAM:{dev} MEAN_ROI:{mean_roi:.2f} DELTA:{delta_mean:.2f} STD_ROI:{std_roi:.2f} DELTA_STD:{delta_std:.2f} EVENT:{int(event)}")
+                log.write([ts, f"{mean_all:.2f}", f"{std_all:.2f}", f"{mean_roi:.2f}", f"{std_roi:.2f}", w, h, int(event), dev])
+                if event and SAVE_ON_EVENT:
+                    fname = f"{EVENT_DIR}/evt_cam{dev}_{datetime.utcfromtimestamp(frame_ts).strftime('%Y%m%dT%H%M%SZ')}.jpg"
+                    # the shared slot is reused by the worker: copy it, then drop the copy if it was overwritten meanwhile
+                    img = frame.copy()
+                    if sup.intact(i, seq):
+                        writer.submit(img, fname)
+            # sleep until the next camera is due; at full rate just don't spin on the shared slots
+            to_sleep = min(c['due'] for c in cams) - time.time()
+            time.sleep(max(to_sleep, 0.005))
+    except KeyboardInterrupt:
+        print("Stopped by user")
+    finally:
+        log.close()
+        writer.close()
+        print(writer.stats())
+        sup.stop()
+
+if __name__ == "__main__":
+    main()
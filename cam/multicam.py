@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+multicam.py
+
+Capture supervisor for several cameras: one worker process per device, frames
+handed over through multiprocessing.shared_memory.
+
+Each worker opens its own cv2.VideoCapture, so JPEG/YUYV decoding for different
+cameras runs on different cores instead of being serialized by the GIL. A worker
+decodes straight into one of NSLOTS frame slots of its shared-memory block and
+then publishes the slot's sequence number and capture timestamp in a small
+shared meta array (seqlock style: the slot's seq is set to -1 while it is being
+written). The consumer (metrics + logging) reads the newest published slot in
+place and calls intact() afterwards to make sure the worker did not lap it.
+
+Frames are fixed at width x height (requested from the driver, resized by the
+worker if the camera delivers something else) so the shared blocks can be
+allocated before the workers start.
+"""
+import time, signal
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+import cv2
+import clock
+from mjpeg import open_capture
+
+NSLOTS = 4
+MAX_READ_ERRORS = 50
+
+# meta layout per camera (float64): [latest_seq, slot_seq * NSLOTS, slot_ts * NSLOTS]
+# latest_seq is set to -1 when the worker gives up on the device
+
+
+def _worker(device, shm, shape, nslots, meta, stop):
+    # Ctrl-C reaches the whole process group; let the supervisor stop us via `stop`
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    frames = np.ndarray((nslots,) + shape, np.uint8, buffer=shm.buf)
+    cap = open_capture(device)
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, shape[1])
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, shape[0])
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    seq = 0
+    errors = 0
+    try:
+        while not stop.value:
+            slot = (seq + 1) % nslots
+            meta[1+slot] = -1
+            ok, frame = cap.read(frames[slot])
+            ts = clock.now()
+            if not ok:
+                errors += 1
+                if errors >= MAX_READ_ERRORS:
+                    meta[0] = -1
+                    break
+                time.sleep(0.01)
+                continue
+            errors = 0
+            if frame.ctypes.data != frames[slot].ctypes.data:
+                # driver delivered another size/format than the slot, copy it in
+                if frame.shape != shape:
+                    frame = cv2.resize(frame, (shape[1], shape[0]))
+                frames[slot] = frame
+            seq += 1
+            meta[1+nslots+slot] = ts
+            meta[1+slot] = seq
+            meta[0] = seq
+    finally:
+        cap.release()
+
+
+class CameraSupervisor:
+    def __init__(self, devices, width=640, height=480, nslots=NSLOTS):
+        self.devices = list(devices)
+        self.shape = (height, width, 3)
+        self.nslots = nslots
+        # fork hands the SharedMemory objects to the workers as-is; they never re-attach
+        # by name, so only this process owns (and unlinks) the blocks
+        self.ctx = mp.get_context('fork')
+        self.stop_flag = self.ctx.RawValue('b', 0)
+        self.cams = []
+
+    def start(self):
+        size = self.nslots * int(np.prod(self.shape))
+        for device in self.devices:
+            shm = shared_memory.SharedMemory(create=True, size=size)
+            meta = self.ctx.RawArray('d', 1 + 2*self.nslots)
+            proc = self.ctx.Process(target=_worker, name=f"cam{device}", daemon=True,
+                                    args=(device, shm, self.shape, self.nslots, meta, self.stop_flag))
+            proc.start()
+            frames = np.ndarray((self.nslots,) + self.shape, np.uint8, buffer=shm.buf)
+            self.cams.append({'device': device, 'shm': shm, 'meta': meta, 'proc': proc, 'frames': frames, 'last': 0})
+        return self
+
+    def latest(self, i):
+        # newest published frame of camera i not returned before: (frame view, ts, seq) or None
+        cam = self.cams[i]
+        meta = cam['meta']
+        seq = int(meta[0])
+        if seq <= cam['last']:
+            return None
+        slot = seq % self.nslots
+        ts = meta[1+self.nslots+slot]
+        if int(meta[1+slot]) != seq:
+            return None
+        cam['last'] = seq
+        return cam['frames'][slot], ts, seq
+
+    def intact(self, i, seq):
+        # True if the slot holding `seq` was not overwritten while it was being used
+        return int(self.cams[i]['meta'][1 + seq % self.nslots]) == seq
+
+    def failed(self, i):
+        cam = self.cams[i]
+        return cam['meta'][0] < 0 or not cam['proc'].is_alive()
+
+    def stop(self):
+        self.stop_flag.value = 1
+        for cam in self.cams:
+            cam['proc'].join(timeout=3.0)
+            if cam['proc'].is_alive():
+                cam['proc'].terminate()
+            cam['frames'] = None
+            cam['shm'].close()
+            cam['shm'].unlink()
+        self.cams = []
@@ -5,16 +5,22 @@ Usage: python3 pid_feedforward.py
 Replace set_voltage(v) with your motor driver code (PWM, DAC, etc).
 """
 import time, sys
-from datetime import datetime
-import cv2
 import math
+from grabber import size_for_roi
+from frame_source import open_source, ReplaySource
+import clock
+from metrics import FrameMetrics
+from baseline import BaselineCache
 
 # --- CONFIG ---
 DEVICE = 0
 INTERVAL = 0.25            # control loop period (s)
 ROI = (0.35,0.65,0.35,0.65) # y1,y2,x1,x2 as fractions of frame
+LUMA = None           # 'YUYV' or 'GREY': read the camera's Y plane directly, no BGR decode/cvtColor (grabber.py)
+MIN_ROI_PX = None     # e.g. 64: capture at the smallest size whose ROI is still 64 px on each side
 BASELINE_SAMPLES = 20
 USE_STD = False            # set True to use std_roi instead of mean_roi
+BASELINE_CACHE = 'baseline_cache.json'  # reuse the saved baseline when the scene still matches (baseline.py); None disables
 TARGET_VOLUME_ML = 25.0    # example target volume
 TARGET_DURATION_S = 10.0   # example duration
 TARGET_FLOW = TARGET_VOLUME_ML / TARGET_DURATION_S  # ml/s
@@ -53,24 +59,18 @@ print(f"Using voltage model: V = {alpha:.6f} * flow_ml_s + {beta:.6f}")
 print(f"Target flow: {TARGET_FLOW:.3f} ml/s")
 
 # --- camera helpers ---
-def frame_metrics(frame):
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    h,w = gray.shape
-    y1 = int(h*ROI[0]); y2 = int(h*ROI[1])
-    x1 = int(w*ROI[2]); x2 = int(w*ROI[3])
-    roi = gray[y1:y2, x1:x2]
-    return float(roi.mean()), float(roi.std())
+fm = FrameMetrics(ROI)
 
 def collect_baseline(cap):
     vals = []
     for _ in range(BASELINE_SAMPLES):
-        ret, frame = cap.read()
+        ret, frame, _ = cap.read()
         if not ret:
             raise RuntimeError("camera read failed during baseline")
-        mean_roi, std_roi = frame_metrics(frame)
+        mean_roi, std_roi = fm.roi(frame)
         vals.append(std_roi if USE_STD else mean_roi)
-        time.sleep(INTERVAL)
-    return sum(vals)/len(vals)
+        cap.pace(INTERVAL)
+    return sum(vals)/len(vals), frame
 
 # --- hardware stub: replace this with your motor driver code ---
 def set_voltage(v):
@@ -100,14 +100,22 @@ if a_cal is None:
 print(f"Using calibration slope (ml per integral unit) = {a_cal:.6e}")
 
 # --- main loop ---
-cap = cv2.VideoCapture(DEVICE)
+cap = open_source(DEVICE, luma=LUMA, size=size_for_roi(ROI, MIN_ROI_PX) if MIN_ROI_PX else None)
 if not cap.isOpened():
     print("ERROR: camera not opened"); sys.exit(2)
-for _ in range(5):
-    cap.read(); time.sleep(0.05)
-
-base = collect_baseline(cap)
-print(f"BASELINE={base:.3f} (using {'STD' if USE_STD else 'MEAN'})")
+cap.warmup()
+
+# pump is still off here: reuse the saved baseline if the scene matches, else collect a new one
+# a replayed recording must not overwrite the live camera's cached baseline
+cache = BaselineCache(BASELINE_CACHE, f"pid_feedforward:{DEVICE}:{'std' if USE_STD else 'mean'}", ROI) if BASELINE_CACHE and not isinstance(cap, ReplaySource) else None
+cached = cache.load(cap, [cap.read()[1] for _ in range(2)]) if cache else None
+if cached:
+    base = cached[0]
+else:
+    base, last_frame = collect_baseline(cap)
+    if cache:
+        cache.save(cap, [last_frame], [base])
+print(f"BASELINE={base:.3f} (using {'STD' if USE_STD else 'MEAN'}{', cached' if cached else ''})")
 
 cumulative_integral = 0.0
 last_ts = None
@@ -121,18 +129,17 @@ print(f"Feedforward V_ff = {v_ff:.3f} V")
 try:
     while True:
         t0 = time.time()
-        ret, frame = cap.read()
+        ret, frame, ts = cap.read()
         if not ret:
             print("camera read failed")
             break
-        mean_roi, std_roi = frame_metrics(frame)
+        mean_roi, std_roi = fm.roi(frame)
         val = std_roi if USE_STD else mean_roi
-        now = datetime.utcnow()
         if last_ts is None:
             dt = 0.0
         else:
-            dt = (now - last_ts).total_seconds()
-        last_ts = now
+            dt = ts - last_ts
+        last_ts = ts
         delta = abs(val - base)
         cumulative_integral += delta * dt
         # convert integral -> ml using a_cal
@@ -142,19 +149,19 @@ try:
         flow_inst = a_cal * delta
         # PID on flow_inst (instantaneous)
         err = TARGET_FLOW - flow_inst
-        integral_err += err * INTERVAL
-        deriv = 0.0 if last_err is None else (err - last_err) / INTERVAL
+        # real spacing of the frames, the loop period slips when the camera stalls
+        step = dt if dt > 0 else INTERVAL
+        integral_err += err * step
+        deriv = 0.0 if last_err is None else (err - last_err) / step
         last_err = err
         v_fb = Kp * err + Ki * integral_err + Kd * deriv
         v_cmd = max(0.0, v_ff + v_fb)
         set_voltage(v_cmd)
-        print(f"{now.isoformat()}Z FLOW_inst:{flow_inst:.3f} TARGET:{TARGET_FLOW:.3f} V_CMD:{v_cmd:.3f}")
-        elapsed = time.time() - t0
-        to_sleep = INTERVAL - elapsed
-        if to_sleep > 0:
-            time.sleep(to_sleep)
+        print(f"{clock.isostamp(ts)} FLOW_inst:{flow_inst:.3f} TARGET:{TARGET_FLOW:.3f} V_CMD:{v_cmd:.3f}")
+        cap.pace(INTERVAL, t0)
 except KeyboardInterrupt:
     set_voltage(0.0)
     print("Stopped by user")
 finally:
+    print(cap.stats())
     cap.release()
@@ -1,78 +1,78 @@
 #!/usr/bin/env python3
-import cv2, numpy as np, time, sys
-from datetime import datetime
+import time, sys
+from grabber import size_for_roi
+from frame_source import open_source
+import clock
+from metrics import FrameMetrics
+from sampling import AdaptiveRate, Integrator
+from baseline import OnlineBaseline
+from signals import FlowSignal
 
 # CONFIG
 DEVICE = 0
 INTERVAL = 0.25
+HIGH_RATE = False     # True: process every camera frame (native fps) instead of one per INTERVAL
+ADAPTIVE_RATE = True  # sample every IDLE_INTERVAL while quiet, every frame once the ROI starts to move (sampling.py)
+IDLE_INTERVAL = 1.0
+PRE_THRESHOLD = 3.0   # |delta| that switches to full rate and holds the baseline
+RATE_QUIET_SEC = 2.0  # back to IDLE_INTERVAL after this long below PRE_THRESHOLD
 ROI = (0.35,0.65,0.35,0.65)
+LUMA = None           # 'YUYV' or 'GREY': read the camera's Y plane directly, no BGR decode/cvtColor (grabber.py)
+MIN_ROI_PX = None     # e.g. 64: capture at the smallest size whose ROI is still 64 px on each side
 BASELINE_SAMPLES = 20
+BASELINE_TAU = 300.0  # s: baseline follows lighting drift while |delta| < PRE_THRESHOLD (baseline.py); None freezes it
 MEAN_THRESHOLD = 0.0   # not used for integration, only for optional event flag
 SLOPE_ML_PER_UNIT = 0.07036   # set to your slope (ml per integral unit)
 USE_ABS = True  # integrate absolute delta to be robust to sign
+SIGNAL = 'brightness'     # 'flow': integrate the optical-flow speed in the ROI instead (signals.py); needs its own SLOPE_ML_PER_UNIT
+FLOW_METHOD = 'dis'       # 'dis' or 'farneback'
+FLOW_BUDGET_MS = 10.0     # per-frame flow budget; the ROI is downscaled further when exceeded
+FLOW_PRE_THRESHOLD = 20.0 # px/s of flow that keeps full rate (idle samples read 0 flow, PRE_THRESHOLD starts it)
 
-def nowstr():
-    return datetime.utcnow().isoformat(timespec='seconds') + "Z"
-
-def frame_metrics(frame):
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    h,w = gray.shape
-    y1 = int(h*ROI[0]); y2 = int(h*ROI[1])
-    x1 = int(w*ROI[2]); x2 = int(w*ROI[3])
-    roi = gray[y1:y2, x1:x2]
-    return float(np.mean(roi)), float(np.std(roi))
-
-def collect_baseline(cap):
-    vals = []
-    for _ in range(BASELINE_SAMPLES):
-        ret, frame = cap.read()
-        if not ret:
-            raise RuntimeError("camera read failed during baseline")
-        mean_roi, std_roi = frame_metrics(frame)
-        vals.append(mean_roi)
-        time.sleep(INTERVAL)
-    return float(np.mean(vals))
+fm = FrameMetrics(ROI)
 
 def main():
-    cap = cv2.VideoCapture(DEVICE)
+    # optional argument: video file or image directory to replay (frame_source.py)
+    cap = open_source(sys.argv[1] if len(sys.argv) > 1 else DEVICE, luma=LUMA, size=size_for_roi(ROI, MIN_ROI_PX) if MIN_ROI_PX else None)
     if not cap.isOpened():
         print("ERROR: camera not opened"); sys.exit(2)
-    for _ in range(5):
-        cap.read(); time.sleep(0.05)
-    base_mean = collect_baseline(cap)
-    print(f"BASELINE mean_roi={base_mean:.3f}")
+    cap.warmup()
+    # provisional baseline from the first frame; settles over BASELINE_SAMPLES, then tracks drift
+    baseline = OnlineBaseline(BASELINE_SAMPLES, BASELINE_TAU)
     print("Press Ctrl-C to stop. Starting integration...")
-    last_ts = None
-    cumulative_integral = 0.0
+    integ = Integrator()
+    rate = AdaptiveRate(IDLE_INTERVAL, 0.0, (PRE_THRESHOLD, FLOW_PRE_THRESHOLD), RATE_QUIET_SEC)
+    flow = FlowSignal(ROI, FLOW_METHOD, budget_ms=FLOW_BUDGET_MS) if SIGNAL == 'flow' else None
     try:
         while True:
             t0 = time.time()
-            ret, frame = cap.read()
+            ret, frame, ts = cap.read()
             if not ret:
                 print("ERROR: failed to read frame"); break
-            mean_roi, std_roi = frame_metrics(frame)
-            ts = datetime.utcnow()
-            if last_ts is None:
-                dt = 0.0
-            else:
-                dt = (ts - last_ts).total_seconds()
-            last_ts = ts
+            mean_roi, std_roi = fm.roi(frame)
+            (base_mean,) = baseline.get(mean_roi)
             delta = mean_roi - base_mean
-            if USE_ABS:
+            if baseline.update(ts, mean_roi, active=abs(delta) > PRE_THRESHOLD):
+                print(f"BASELINE mean_roi={baseline.mean[0]:.3f}")
+            speed = flow.update(frame, ts) if flow else 0.0
+            if flow:
+                val = speed
+            elif USE_ABS:
                 val = abs(delta)
             else:
                 val = delta
-            # integrate using simple Riemann (val * dt)
-            cumulative_integral += val * dt
+            # trapezoid between capture stamps, stays right when the sample rate changes
+            dt = integ.add(val, ts)
+            cumulative_integral = integ.total
             predicted_ml = cumulative_integral * SLOPE_ML_PER_UNIT
-            print(f"{nowstr()} MEAN_ROI:{mean_roi:.3f} DELTA:{delta:.3f} DT:{dt:.3f} INT:{cumulative_integral:.3f} ML:{predicted_ml:.3f}")
-            elapsed = time.time() - t0
-            to_sleep = INTERVAL - elapsed
-            if to_sleep > 0:
-                time.sleep(to_sleep)
+            interval = rate.update(ts, delta, speed) if ADAPTIVE_RATE else INTERVAL
+            flow_col = f" FLOW:{speed:.3f}" if flow else ""
+            print(f"{clock.isostamp(ts)} MEAN_ROI:{mean_roi:.3f} DELTA:{delta:.3f}{flow_col} DT:{dt:.3f} INT:{cumulative_integral:.3f} ML:{predicted_ml:.3f}")
+            cap.pace(0.0 if HIGH_RATE else interval, t0)
     except KeyboardInterrupt:
         print("Stopped by user")
     finally:
+        print(cap.stats())
         cap.release()
 
 if __name__ == '__main__':
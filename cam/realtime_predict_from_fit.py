@@ -1,60 +1,66 @@
 #!/usr/bin/env python3
-import cv2, time, sys
-from datetime import datetime
+import time, sys
+from grabber import size_for_roi
+from frame_source import open_source
+import clock
+from metrics import FrameMetrics
+from sampling import AdaptiveRate, Integrator
+from baseline import OnlineBaseline
+from signals import FlowSignal
 # CONFIG
 DEVICE = 0
 INTERVAL = 0.25
+HIGH_RATE = False     # True: process every camera frame (native fps) instead of one per INTERVAL
+ADAPTIVE_RATE = True  # sample every IDLE_INTERVAL while quiet, every frame once the ROI starts to move (sampling.py)
+IDLE_INTERVAL = 1.0
+PRE_THRESHOLD = 3.0   # |delta| that switches to full rate and holds the baseline
+RATE_QUIET_SEC = 2.0  # back to IDLE_INTERVAL after this long below PRE_THRESHOLD
 ROI = (0.35,0.65,0.35,0.65)
+LUMA = None           # 'YUYV' or 'GREY': read the camera's Y plane directly, no BGR decode/cvtColor (grabber.py)
+MIN_ROI_PX = None     # e.g. 64: capture at the smallest size whose ROI is still 64 px on each side
 BASELINE_SAMPLES = 20
+BASELINE_TAU = 300.0  # s: baseline follows lighting drift while |delta| < PRE_THRESHOLD (baseline.py); None freezes it
 USE_STD = False
+SIGNAL = 'brightness'     # 'flow': integrate the optical-flow speed in the ROI instead (signals.py); needs a fit on flow integrals
+FLOW_METHOD = 'dis'       # 'dis' or 'farneback'
+FLOW_BUDGET_MS = 10.0     # per-frame flow budget; the ROI is downscaled further when exceeded
+FLOW_PRE_THRESHOLD = 20.0 # px/s of flow that keeps full rate (idle samples read 0 flow, PRE_THRESHOLD starts it)
 # read slope/intercept
 a=b=0.0
 with open('calibration_result.txt','r') as f:
     for line in f:
         if line.startswith('slope a='): a = float(line.split('=')[1].strip())
         if line.startswith('intercept b='): b = float(line.split('=')[1].strip())
-def frame_metrics(frame):
-    import numpy as np
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    h,w = gray.shape
-    y1 = int(h*ROI[0]); y2 = int(h*ROI[1])
-    x1 = int(w*ROI[2]); x2 = int(w*ROI[3])
-    roi = gray[y1:y2, x1:x2]
-    return float(roi.mean()), float(roi.std())
-def collect_baseline(cap):
-    vals=[]
-    for _ in range(BASELINE_SAMPLES):
-        ret, frame = cap.read()
-        if not ret: raise RuntimeError("camera read failed")
-        mean_roi, std_roi = frame_metrics(frame)
-        vals.append(std_roi if USE_STD else mean_roi)
-        time.sleep(INTERVAL)
-    return sum(vals)/len(vals)
-cap = cv2.VideoCapture(DEVICE)
+fm = FrameMetrics(ROI)
+cap = open_source(DEVICE, luma=LUMA, size=size_for_roi(ROI, MIN_ROI_PX) if MIN_ROI_PX else None)
 if not cap.isOpened(): print("ERROR: camera not opened"); sys.exit(2)
-for _ in range(5): cap.read(); time.sleep(0.05)
-base = collect_baseline(cap)
-print(f"BASELINE={base:.3f} using {'STD' if USE_STD else 'MEAN'}")
-cumulative = 0.0; last_ts = None
+cap.warmup()
+# provisional baseline from the first frame; settles over BASELINE_SAMPLES, then tracks drift
+baseline = OnlineBaseline(BASELINE_SAMPLES, BASELINE_TAU)
+integ = Integrator()
+rate = AdaptiveRate(IDLE_INTERVAL, 0.0, (PRE_THRESHOLD, FLOW_PRE_THRESHOLD), RATE_QUIET_SEC)
+flow = FlowSignal(ROI, FLOW_METHOD, budget_ms=FLOW_BUDGET_MS) if SIGNAL == 'flow' else None
 try:
     while True:
         t0 = time.time()
-        ret, frame = cap.read()
+        ret, frame, ts = cap.read()
         if not ret: break
-        mean_roi, std_roi = frame_metrics(frame)
+        mean_roi, std_roi = fm.roi(frame)
         val = std_roi if USE_STD else mean_roi
+        (base,) = baseline.get(val)
         delta = abs(val - base)
-        now = datetime.utcnow()
-        if last_ts is None: dt = 0.0
-        else: dt = (now - last_ts).total_seconds()
-        last_ts = now
-        cumulative += delta * dt
+        if baseline.update(ts, val, active=delta > PRE_THRESHOLD):
+            print(f"BASELINE={baseline.mean[0]:.3f} using {'STD' if USE_STD else 'MEAN'}")
+        speed = flow.update(frame, ts) if flow else 0.0
+        dt = integ.add(speed if flow else delta, ts)
+        cumulative = integ.total
+        interval = rate.update(ts, delta, speed) if ADAPTIVE_RATE else INTERVAL
         predicted_ml = a * cumulative + b
-        print(f"{now.isoformat()}Z DELTA:{delta:.3f} DT:{dt:.3f} INT:{cumulative:.3f} ML:{predicted_ml:.3f}")
-        elapsed = time.time() - t0
-        to_sleep = INTERVAL - elapsed
-        if to_sleep > 0: time.sleep(to_sleep)
+        flow_col = f" FLOW:{speed:.3f}" if flow else ""
+        print(f"{clock.isostamp(ts)} DELTA:{delta:.3f}{flow_col} DT:{dt:.3f} INT:{cumulative:.3f} ML:{predicted_ml:.3f}")
+        cap.pace(0.0 if HIGH_RATE else interval, t0)
 except KeyboardInterrupt:
     print("Stopped by user")
 finally:
+    print(cap.stats())
     cap.release()
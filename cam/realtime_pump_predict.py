@@ -1,12 +1,32 @@
 #!/usr/bin/env python3
-import cv2, time, csv
+import time, csv
 from datetime import datetime
+from grabber import size_for_roi
+from frame_source import open_source, ReplaySource
+import clock
+from metrics import FrameMetrics
+from sampling import AdaptiveRate, Integrator
+from baseline import OnlineBaseline, BaselineCache
+from signals import FlowSignal
 
 DEVICE=0
 INTERVAL=0.25
+HIGH_RATE=False   # True: integrate every camera frame instead of one per INTERVAL
+ADAPTIVE_RATE=True   # sample every IDLE_INTERVAL while quiet, every frame once the ROI starts to move (sampling.py)
+IDLE_INTERVAL=1.0
+PRE_THRESHOLD=2.0    # |delta| that switches to full rate and holds the baseline
+RATE_QUIET_SEC=2.0
 ROI=(0.35,0.65,0.35,0.65)
+LUMA=None  # 'YUYV' or 'GREY': read the camera's Y plane directly, no BGR decode/cvtColor (grabber.py)
+MIN_ROI_PX=None  # e.g. 64: capture at the smallest size whose ROI is still 64 px on each side
 BASELINE_SAMPLES=20
+BASELINE_TAU=300.0   # s: baseline follows lighting drift while |delta| < PRE_THRESHOLD (baseline.py); None freezes it
 USE_STD=True
+SIGNAL='brightness'     # 'flow': integrate the optical-flow speed in the ROI instead (signals.py); needs its own calibration
+FLOW_METHOD='dis'       # 'dis' or 'farneback'
+FLOW_BUDGET_MS=10.0     # per-frame flow budget; the ROI is downscaled further when exceeded
+FLOW_PRE_THRESHOLD=20.0 # px/s of flow that keeps full rate (idle samples read 0 flow, PRE_THRESHOLD starts it)
+BASELINE_CACHE='baseline_cache.json'  # reuse the saved baseline when the scene still matches (baseline.py); None disables
 
 # read calibration
 a=b=0.0
@@ -15,51 +35,55 @@ with open('calibration_result.txt','r') as f:
         if line.startswith('slope a='): a=float(line.split('=')[1].strip())
         if line.startswith('intercept b='): b=float(line.split('=')[1].strip())
 
-def frame_metrics(frame):
-    import numpy as np
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    h,w = gray.shape
-    y1=int(h*ROI[0]); y2=int(h*ROI[1]); x1=int(w*ROI[2]); x2=int(w*ROI[3])
-    roi = gray[y1:y2, x1:x2]
-    return float(roi.mean()), float(roi.std())
+fm = FrameMetrics(ROI)
 
-cap=cv2.VideoCapture(DEVICE)
-for _ in range(5): cap.read(); time.sleep(0.05)
-# baseline
-vals=[]
-for _ in range(BASELINE_SAMPLES):
-    ret,frame=cap.read()
-    if not ret: break
-    mean,std = frame_metrics(frame)
-    vals.append(std if USE_STD else mean)
-    time.sleep(INTERVAL)
-baseline = sum(vals)/len(vals) if vals else 0.0
-print("BASELINE", baseline)
+cap=open_source(DEVICE, luma=LUMA, size=size_for_roi(ROI, MIN_ROI_PX) if MIN_ROI_PX else None)
+cap.warmup()
+# provisional baseline from the first frame; settles over BASELINE_SAMPLES, then tracks drift
+baseline=OnlineBaseline(BASELINE_SAMPLES, BASELINE_TAU)
+# a replayed recording must not overwrite the live camera's cached baseline
+cache=BaselineCache(BASELINE_CACHE, f"realtime_pump_predict:{DEVICE}:{'std' if USE_STD else 'mean'}", ROI) if BASELINE_CACHE and not isinstance(cap, ReplaySource) else None
+if cache:
+    cached=cache.load(cap, [cap.read()[1] for _ in range(2)])
+    if cached:
+        baseline.restore(cached)
+        print("BASELINE", baseline.mean[0], "(cached)")
+held=True
 # open log
 fname = f"live_run_{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.csv"
 with open(fname,'w',newline='') as f:
-    w=csv.writer(f); w.writerow(['ts','delta','dt','integral','predicted_ml','note'])
-    integral=0.0; last_ts=None
+    w=csv.writer(f); w.writerow(['ts','delta','dt','integral','predicted_ml','flow_px_s','note'])
+    integ=Integrator()
+    rate=AdaptiveRate(IDLE_INTERVAL, 0.0, (PRE_THRESHOLD, FLOW_PRE_THRESHOLD), RATE_QUIET_SEC)
+    flow=FlowSignal(ROI, FLOW_METHOD, budget_ms=FLOW_BUDGET_MS) if SIGNAL=='flow' else None
+    frame=None
     try:
         while True:
             t0=time.time()
-            ret,frame=cap.read()
+            ret,frame,ts=cap.read()
             if not ret: break
-            mean,std = frame_metrics(frame)
+            mean,std = fm.roi(frame)
             val = std if USE_STD else mean
-            now = datetime.utcnow()
-            dt = (now - last_ts).total_seconds() if last_ts else 0.0
-            last_ts = now
-            delta = abs(val - baseline)
-            integral += delta * dt
+            (base,) = baseline.get(val)
+            delta = abs(val - base)
+            held = delta > PRE_THRESHOLD
+            if baseline.update(ts, val, active=held):
+                print("BASELINE", baseline.mean[0])
+                if cache: cache.save(cap, [frame], baseline.mean)
+            speed = flow.update(frame, ts) if flow else 0.0
+            dt = integ.add(speed if flow else delta, ts)
+            integral = integ.total
+            interval = rate.update(ts, delta, speed) if ADAPTIVE_RATE else INTERVAL
             predicted = a*integral + b
-            w.writerow([now.isoformat()+'Z', f"{delta:.3f}", f"{dt:.3f}", f"{integral:.3f}", f"{predicted:.3f}", ""])
-            print(f"{now.isoformat()}Z INT:{integral:.3f} ML:{predicted:.3f}")
-            elapsed = time.time() - t0
-            to_sleep = INTERVAL - elapsed
-            if to_sleep>0: time.sleep(to_sleep)
+            stamp = clock.isostamp(ts)
+            w.writerow([stamp, f"{delta:.3f}", f"{dt:.3f}", f"{integral:.3f}", f"{predicted:.3f}", f"{speed:.3f}" if flow else "", ""])
+            print(f"{stamp} INT:{integral:.3f} ML:{predicted:.3f}")
+            cap.pace(0.0 if HIGH_RATE else interval, t0)
     except KeyboardInterrupt:
         print("Stopped")
     finally:
+        # store the drift-tracked baseline for the next start, unless we stopped mid-pour
+        if cache and baseline.ready and not held and frame is not None: cache.save(cap, [frame], baseline.mean)
+        print(cap.stats())
         cap.release()
 print("Saved", fname)
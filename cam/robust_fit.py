@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+robust_fit.py
+
+Weighted linear least squares and robust IRLS (Huber, Tukey bisquare) for the
+calibration and power-model fits.
+
+fit_pump_calibration.py built W = np.diag(w) every iteration and multiplied it
+into the design matrix: an N x N allocation and O(N^2) work per step, which
+stops working once thousands of runs or per-frame samples are pooled. Here the
+weights are applied by scaling the rows of X and y by sqrt(w), so a step costs
+O(N p^2) for p coefficients and memory stays O(N p).
+
+Each iteration takes the residuals of the current fit, their robust scale
+(MAD / 0.6745 about the median residual) and u = r / scale, and refits with
+
+    huber   w = min(1, c / |u|)               c = 1.345 by default
+    tukey   w = (1 - (u / c)^2)^2, 0 if |u| > c    c = 4.685 by default, started from the Huber fit
+    ols     w = 1                             one plain least-squares pass
+
+until no coefficient moves by more than tol (relative) or max_iter is reached.
+The result carries the coefficient covariance of the final weighted fit,
+sigma^2 (X' W X)^-1 with sigma^2 = sum(w r^2) / (n - p), and its standard errors.
+
+usage:
+    fit = irls(design(ints), vols, loss='huber')     # design() appends the intercept column
+    a, b = fit.coef; fit.stderr; fit.cov; fit.r2; fit.weights; fit.iterations, fit.converged
+    pred = fit.predict(design(new_ints))
+"""
+import numpy as np
+
+LOSSES = ('ols', 'huber', 'tukey')
+TUNING = {'huber': 1.345, 'tukey': 4.685}   # 95% efficiency at the normal distribution
+MAD_SCALE = 0.6745                          # MAD of a standard normal
+TOL = 1e-8
+MAX_ITER = 100
+
+
+class Fit:
+    def __init__(self, coef, cov, weights, resid, scale, r2, iterations, converged, loss):
+        self.coef = coef
+        self.cov = cov
+        self.stderr = np.sqrt(np.maximum(np.diag(cov), 0.0))
+        self.weights = weights
+        self.resid = resid
+        self.scale = scale
+        self.r2 = r2
+        self.iterations = iterations
+        self.converged = converged
+        self.loss = loss
+
+    def predict(self, X):
+        return np.asarray(X, np.float64) @ self.coef
+
+
+def design(*columns):
+    # [x1, x2, ..., 1] columns for a model with intercept
+    cols = [np.asarray(c, np.float64) for c in columns]
+    return np.column_stack(cols + [np.ones(len(cols[0]) if cols else 0)])
+
+
+def robust_scale(resid):
+    return float(np.median(np.abs(resid - np.median(resid)))) / MAD_SCALE
+
+
+def loss_weights(u, loss, c):
+    a = np.abs(u)
+    if loss == 'huber':
+        return np.where(a <= c, 1.0, c / np.maximum(a, 1e-300))
+    if loss == 'tukey':
+        return np.where(a < c, (1.0 - (u / c) ** 2) ** 2, 0.0)
+    return np.ones_like(u)
+
+
+def _wls(X, y, w):
+    # least squares with rows scaled by sqrt(w)
+    sw = np.sqrt(w)
+    return np.linalg.lstsq(X * sw[:, None], y * sw, rcond=None)[0]
+
+
+def irls(X, y, loss='huber', c=None, tol=TOL, max_iter=MAX_ITER):
+    if loss not in LOSSES:
+        raise ValueError(f"loss must be one of {LOSSES}, got {loss!r}")
+    X = np.asarray(X, np.float64)
+    y = np.asarray(y, np.float64)
+    n, p = X.shape
+    if n < p:
+        raise ValueError(f"need at least {p} points for {p} coefficients, got {n}")
+    c = TUNING.get(loss) if c is None else c
+    w = np.ones(n)
+    coef = _wls(X, y, w)
+    it, converged = 0, True
+    if loss != 'ols':
+        if loss == 'tukey':
+            coef = irls(X, y, 'huber', tol=tol, max_iter=max_iter).coef   # bisquare needs a robust start
+        converged = False
+        for it in range(1, max_iter + 1):
+            resid = y - X @ coef
+            scale = robust_scale(resid)
+            if scale == 0.0:
+                converged = True    # most points fit exactly
+                break
+            w = loss_weights(resid / scale, loss, c)
+            if np.count_nonzero(w) < p:
+                break
+            new = _wls(X, y, w)
+            step = np.max(np.abs(new - coef))
+            coef = new
+            if step <= tol * max(1.0, np.max(np.abs(coef))):
+                converged = True
+                break
+    resid = y - X @ coef
+    dof = max(n - p, 1)
+    sigma2 = float(np.sum(w * resid ** 2)) / dof
+    Xw = X * np.sqrt(w)[:, None]
+    cov = sigma2 * np.linalg.pinv(Xw.T @ Xw)
+    ss_tot = float(np.sum((y - y.mean()) ** 2))
+    r2 = 1.0 - float(np.sum(resid ** 2)) / ss_tot if ss_tot > 0 else 0.0
+    return Fit(coef, cov, w, resid, robust_scale(resid), r2, it, converged, loss)
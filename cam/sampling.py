@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+sampling.py
+
+Event-driven sampling rate for the monitor and predictor loops.
+
+AdaptiveRate samples every idle_interval seconds while the ROI is quiet and
+switches to active_interval (0 = every camera frame) as soon as any |delta|
+crosses its pre-threshold, which is set below the event thresholds so the
+start of a pour is caught at full rate. It drops back to idle_interval after
+quiet_sec without a crossing.
+
+With a changing sample spacing the old val*dt sum is wrong: the first fast
+sample would be weighted by the whole idle gap before it. Integrator uses the
+trapezoid rule on the capture timestamps (the same rule compute_integral.py
+applies offline), so the integral stays consistent across rate changes.
+
+usage:
+    rate = AdaptiveRate(1.0, 0.0, (3.0, 2.0), quiet_sec=2.0)
+    interval = rate.update(frame_ts, delta_mean, delta_std)
+    integ = Integrator(); dt = integ.add(abs(delta), frame_ts); integ.total
+"""
+
+
+class AdaptiveRate:
+    def __init__(self, idle_interval, active_interval=0.0, pre_thresholds=(3.0,), quiet_sec=2.0):
+        self.idle_interval = idle_interval
+        self.active_interval = active_interval
+        self.pre_thresholds = tuple(pre_thresholds)
+        self.quiet_sec = quiet_sec
+        self.last_active = None
+        self.active = False
+
+    def update(self, ts, *deltas):
+        # returns the interval to wait before the next sample
+        if any(abs(d) > th for d, th in zip(deltas, self.pre_thresholds)):
+            self.last_active = ts
+        was = self.active
+        self.active = self.last_active is not None and ts - self.last_active < self.quiet_sec
+        if self.active != was:
+            print("RATE", "full" if self.active else "idle")
+        return self.active_interval if self.active else self.idle_interval
+
+
+class Integrator:
+    def __init__(self):
+        self.total = 0.0
+        self.last_ts = None
+        self.last_val = None
+
+    def add(self, val, ts):
+        # trapezoid step from the previous sample; returns dt (0 for the first sample)
+        dt = 0.0
+        if self.last_ts is not None:
+            dt = ts - self.last_ts
+            self.total += 0.5 * (val + self.last_val) * dt
+        self.last_ts = ts
+        self.last_val = val
+        return dt
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+signals.py
+
+Motion and foreground signals, as alternatives to the brightness delta.
+
+abs(mean_roi - baseline) and abs(std_roi - baseline) are brightness proxies:
+they saturate once the ROI is covered and react to shadows and lighting.
+FlowSignal computes dense optical flow (DIS ultrafast preset, or Farneback)
+between consecutive frames on a downscaled gray ROI and reports the mean motion
+magnitude in ROI pixels per second, which grows with the speed of the stream
+and ignores a uniform brightness change.
+
+The ROI is downscaled to `width` pixels wide before the flow. Each call is
+timed; any call over budget_ms reduces the working width by 25% (down to
+min_width) for the next frame, and it grows back towards `width` once the
+smoothed time stays well under budget, so the loop keeps its frame rate on the
+Pi. The budget is enforced from one frame to the next, not within a frame: the
+call that overruns still returns its result. Magnitudes are scaled back to
+full-resolution ROI pixels so a width change does not step the signal.
+
+Flow is only measured between frames at most max_gap seconds apart. Under
+ADAPTIVE_RATE the idle samples are about a second apart, and a displacement over
+such a gap is not comparable to full-rate flow (it aliases and misses stops), so
+a longer gap restarts the flow from the new frame and returns 0.0; switching to
+full rate is then left to the brightness pre-threshold.
+
+ForegroundFraction keeps an incremental background model (MOG2 or KNN) of the
+gray ROI, downscaled to 32 px wide so it costs about as much as the mean/std
+pass, and returns the fraction of ROI pixels that are foreground. The model is
+created once and updated in place every frame; with learn=False (during an
+event) the frame is classified without being absorbed into the background
+(MOG2; KNN's short-term sample memory still absorbs a static foreground after
+a few frames).
+
+usage:
+    flow = FlowSignal(ROI, method='dis', width=96, budget_ms=10.0)
+    speed = flow.update(frame, frame_ts)     # px/s, 0.0 on the first frame and after a gap > max_gap
+    flow.width, flow.last_ms                 # current working width, cost of the last call
+
+    fg = ForegroundFraction(ROI, method='mog2')
+    frac = fg.update(frame, learn=not in_event)   # 0.0 .. 1.0
+"""
+import time
+import cv2
+from metrics import roi_bounds
+
+FLOW_METHOD = 'dis'      # 'dis' or 'farneback'
+FLOW_WIDTH = 96          # px, working width of the ROI (aspect ratio kept)
+FLOW_MIN_WIDTH = 24
+FLOW_BUDGET_MS = 10.0    # per-frame compute budget
+FLOW_MAX_GAP = 0.5       # s: frames further apart restart the flow instead of measuring across the gap
+SHRINK = 0.75            # width factor applied when over budget
+GROW_BELOW = 0.4         # grow back when the smoothed cost is under this fraction of the budget
+COST_ALPHA = 0.2         # smoothing of the per-call cost (for growing back only)
+FG_METHOD = 'mog2'       # 'mog2' or 'knn'
+FG_WIDTH = 32            # px, working width of the ROI for the background model (raise for thin streams)
+FG_HISTORY = 300         # frames of history in the background model
+
+
+def roi_small_gray(frame, roi, width):
+    # gray ROI crop downscaled to at most `width` px wide; returns (image, full ROI width)
+    y1, y2, x1, x2 = roi_bounds(roi, frame.shape[1], frame.shape[0])
+    crop = frame[y1:y2, x1:x2]
+    if crop.ndim == 3:
+        crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    w = min(width, crop.shape[1])
+    h = max(int(round(crop.shape[0] * w / crop.shape[1])), 8)
+    return cv2.resize(crop, (w, h), interpolation=cv2.INTER_AREA), crop.shape[1]
+
+
+class FlowSignal:
+    def __init__(self, roi, method=FLOW_METHOD, width=FLOW_WIDTH, budget_ms=FLOW_BUDGET_MS, min_width=FLOW_MIN_WIDTH,
+                 max_gap=FLOW_MAX_GAP):
+        if method not in ('dis', 'farneback'):
+            raise ValueError(f"unknown flow method {method!r}")
+        self.roi = roi
+        self.method = method
+        self.max_width = width
+        self.width = width
+        self.min_width = min(min_width, width)
+        self.budget_ms = budget_ms
+        self.max_gap = max_gap
+        self.restarts = 0        # frame pairs skipped for being more than max_gap apart
+        self.cost_ms = None
+        self.last_ms = 0.0
+        self.resized = 0         # number of working-width changes
+        self._dis = cv2.DISOpticalFlow_create(cv2.DISOPTICAL_FLOW_PRESET_ULTRAFAST) if method == 'dis' else None
+        self._prev = None
+        self._prev_ts = None
+        self._roi_w = None
+
+    def _flow(self, prev, cur):
+        if self._dis is not None:
+            return self._dis.calc(prev, cur, None)
+        return cv2.calcOpticalFlowFarneback(prev, cur, None, 0.5, 2, 9, 2, 5, 1.1, 0)
+
+    def _adapt(self, ms):
+        self.cost_ms = ms if self.cost_ms is None else self.cost_ms + COST_ALPHA * (ms - self.cost_ms)
+        new = self.width
+        if ms > self.budget_ms and self.width > self.min_width:
+            new = max(self.min_width, int(self.width * SHRINK))
+        elif self.cost_ms < GROW_BELOW * self.budget_ms and self.width < self.max_width:
+            new = min(self.max_width, int(self.width / SHRINK) + 1)
+        if new != self.width:
+            print(f"FLOW width {self.width} -> {new} (last {ms:.1f} ms, avg {self.cost_ms:.1f} ms, budget {self.budget_ms:.1f} ms)")
+            self.width = new
+            self.resized += 1
+            # the next call works at a new size; restart the cost estimate from it
+            self.cost_ms = None
+
+    def update(self, frame, ts):
+        # mean flow magnitude since the previous frame, in full-resolution ROI px per second
+        t0 = time.perf_counter()
+        cur, self._roi_w = roi_small_gray(frame, self.roi, self.width)
+        prev, prev_ts = self._prev, self._prev_ts
+        self._prev, self._prev_ts = cur, ts
+        if prev is None or ts is None or prev_ts is None or ts <= prev_ts:
+            return 0.0
+        if ts - prev_ts > self.max_gap:
+            self.restarts += 1
+            return 0.0
+        if prev.shape != cur.shape:
+            prev = cv2.resize(prev, (cur.shape[1], cur.shape[0]), interpolation=cv2.INTER_AREA)
+        flow = self._flow(prev, cur)
+        mag = float(cv2.magnitude(flow[..., 0], flow[..., 1]).mean())
+        speed = mag * (self._roi_w / cur.shape[1]) / (ts - prev_ts)
+        self.last_ms = (time.perf_counter() - t0) * 1000.0
+        self._adapt(self.last_ms)
+        return speed
+
+
+class ForegroundFraction:
+    def __init__(self, roi, method=FG_METHOD, width=FG_WIDTH, history=FG_HISTORY):
+        if method == 'mog2':
+            self._bg = cv2.createBackgroundSubtractorMOG2(history=history, varThreshold=16, detectShadows=False)
+        elif method == 'knn':
+            self._bg = cv2.createBackgroundSubtractorKNN(history=history, dist2Threshold=400.0, detectShadows=False)
+        else:
+            raise ValueError(f"unknown background method {method!r}")
+        self.roi = roi
+        self.width = width
+        self._mask = None
+
+    def update(self, frame, learn=True):
+        # fraction of ROI pixels that differ from the background model
+        small, _ = roi_small_gray(frame, self.roi, self.width)
+        if self._mask is not None and self._mask.shape != small.shape:
+            raise ValueError("frame size changed under the background model")
+        first = self._mask is None
+        self._mask = self._bg.apply(small, self._mask, -1 if learn else 0)
+        if first:
+            return 0.0   # no background yet, the first frame is all foreground
+        return cv2.countNonZero(self._mask) / float(self._mask.size)
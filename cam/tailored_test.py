@@ -7,61 +7,105 @@ Modes:
            usage: ./tailored_test.py manual --label run1 --volume_ml 53
   auto:    script detects events using thresholds and writes calib rows automatically.
            usage: ./tailored_test.py auto
+  replay:  --source clips/clip_auto1_....avi (or an image directory) runs either
+           mode on a recording at full speed instead of the camera (frame_source.py).
+           All outputs then go to REPLAY_PREFIX paths (replay_flow_log.csv,
+           replay_calib_points.csv, replay_events/, ...) so the recording is never
+           appended to the live log and calibration rows a second time.
 
 Outputs:
   - flow_log.csv (appended)
-  - events/ (annotated images saved on event)
+  - events/ (annotated images saved on event; only written when SAVE_CLIPS is off)
+  - clips/ (auto mode with SAVE_CLIPS: one .avi per event including CLIP_PRE_SEC of pre-trigger history)
   - snapshots/ (periodic annotated snapshots)
   - calib_points.csv (appended calibration rows: label,volume_ml,start_ts,end_ts)
+  (with --source each of these is written under its REPLAY_PREFIX name instead)
 """
-import cv2, numpy as np, time, csv, os, sys, argparse
+import time, csv, os, sys, argparse
 from datetime import datetime
+from grabber import size_for_roi
+from frame_source import open_source
+import clock
+from metrics import FrameMetrics, MultiRoiMetrics
+from flow_logger import FlowLogWriter, FLOW_HEADER
+from flow_store import SegmentedFlowLog
+from binlog import BinaryFlowLog, FLOW_FIELDS
+from image_writer import AsyncImageWriter
+from clip_recorder import EventClipRecorder
+from sampling import AdaptiveRate, Integrator
+from baseline import OnlineBaseline
+from signals import ForegroundFraction
 
 # --- CONFIG (tweak these for your setup) ---
 DEVICE = 0
 INTERVAL = 0.25
+HIGH_RATE = False     # True: process every camera frame (native fps) instead of one per INTERVAL
+ADAPTIVE_RATE = True      # sample every IDLE_INTERVAL while quiet, every frame once the ROI starts to move (sampling.py)
+IDLE_INTERVAL = 1.0       # seconds between samples while quiet (ADAPTIVE_RATE)
+PRE_MEAN_THRESHOLD = 3.0  # |delta_mean| / |delta_std| that switch to full rate, keep below the event thresholds
+PRE_STD_THRESHOLD = 2.0
+RATE_QUIET_SEC = 2.0      # back to IDLE_INTERVAL after this long below the pre-thresholds
 ROI = (0.35,0.65,0.35,0.65)
+LUMA = None           # 'YUYV' or 'GREY': read the camera's Y plane directly, no BGR decode/cvtColor (grabber.py)
+MIN_ROI_PX = None     # e.g. 64: capture at the smallest size whose ROI is still 64 px on each side
+ROI_GRID = None       # e.g. (3,4): also log mean/std of every cell of a 3x4 grid over the frame
+ROI_NAMED = None      # e.g. {'left': (0.3,0.7,0.1,0.4)}: also log mean/std of named ROIs (y1,y2,x1,x2)
 LOGFILE = "flow_log.csv"
+BINLOG = None   # e.g. "flow_log.bin" to also write fixed-width binary records (binlog.py)
 EVENT_DIR = "events"
 SNAP_DIR = "snapshots"
 CALIB_CSV = "calib_points.csv"
 SAVE_ON_EVENT = True
 SAVE_PERIODIC = True
 PERIODIC_SEC = 5
+IMAGE_QUEUE = 8          # event/snapshot frames waiting to be encoded; more are dropped (image_writer.py)
+IMAGE_DROP_POLICY = 'drop_new'  # or 'drop_oldest'
+SAVE_CLIPS = True          # auto mode: write one clip per event instead of per-frame event JPEGs
+CLIP_DIR = "clips"
+CLIP_PRE_SEC = 5.0         # seconds of history before the trigger included in the clip
+CLIP_SCALE = 0.5           # clip frames are downscaled by this factor
+CLIP_JPEG_QUALITY = 80     # buffered clip frames kept JPEG-compressed (~20x smaller than raw); None keeps raw frames
 MEAN_THRESHOLD = 8.0
 STD_THRESHOLD = 6.0
+FOREGROUND = False     # True: background model on the ROI; logs fg_frac and an event also needs FG_EVENT_FRAC (signals.py)
+FG_METHOD = 'mog2'     # or 'knn'
+FG_EVENT_FRAC = 0.02   # fraction of ROI pixels in the foreground required for an event
 BASELINE_SAMPLES = 20
+BASELINE_TAU = 300.0   # s: baseline follows lighting drift while no event (baseline.py); None freezes it after BASELINE_SAMPLES
+LOG_FSYNC = 'rotate'      # flow log fsync policy: 'never', 'rotate' or 'flush' (see flow_logger.py)
+LOG_ROTATE_BYTES = None   # e.g. 50_000_000 to start a new flow log every ~50 MB
+LOG_ROTATE_DAILY = False  # start a new flow log each UTC day
+LOG_PARTITION = None      # 'day' or 'hour': write LOG_DIR/<period>.csv segments + manifest.json instead of LOGFILE (flow_store.py)
+LOG_DIR = "flow_log"
+REPLAY_PREFIX = "replay_"  # --source runs write replay_<name> instead of every log/calib/image output above
 EVENT_MIN_DURATION = 0.5   # seconds: ignore very short blips
 QUIET_AFTER_EVENT = 1.0    # seconds of no-event to consider event ended
 # --------------------------------------------
 
-def nowstr():
-    return datetime.utcnow().isoformat(timespec='seconds') + "Z"
+def replay_path(path):
+    head, tail = os.path.split(path)
+    return os.path.join(head, REPLAY_PREFIX + tail)
+
+def use_replay_outputs():
+    # a replayed recording is already in the live outputs; keep its results apart
+    global LOGFILE, BINLOG, LOG_DIR, CALIB_CSV, EVENT_DIR, SNAP_DIR, CLIP_DIR
+    LOGFILE, LOG_DIR, CALIB_CSV = replay_path(LOGFILE), replay_path(LOG_DIR), replay_path(CALIB_CSV)
+    EVENT_DIR, SNAP_DIR, CLIP_DIR = replay_path(EVENT_DIR), replay_path(SNAP_DIR), replay_path(CLIP_DIR)
+    BINLOG = replay_path(BINLOG) if BINLOG else None
 
 def ensure_dirs():
     os.makedirs(EVENT_DIR, exist_ok=True)
     os.makedirs(SNAP_DIR, exist_ok=True)
+    if SAVE_CLIPS:
+        os.makedirs(CLIP_DIR, exist_ok=True)
 
-def frame_metrics(frame):
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    h,w = gray.shape
-    y1 = int(h*ROI[0]); y2 = int(h*ROI[1])
-    x1 = int(w*ROI[2]); x2 = int(w*ROI[3])
-    roi = gray[y1:y2, x1:x2]
-    return float(np.mean(gray)), float(np.std(gray)), float(np.mean(roi)), float(np.std(roi)), w, h, gray
-
-def annotate_image(img, text_lines, scale=0.6, color=(255,255,255), thickness=1):
-    y = 20
-    for line in text_lines:
-        cv2.putText(img, line, (10, y), cv2.FONT_HERSHEY_SIMPLEX, scale, color, thickness, cv2.LINE_AA)
-        y += int(20 * scale * 1.6)
-    return img
-
-def write_header_if_needed():
-    if not os.path.exists(LOGFILE):
-        with open(LOGFILE,'w',newline='') as f:
-            w = csv.writer(f)
-            w.writerow(["timestamp","mean_all","std_all","mean_roi","std_roi","w","h","event_flag"])
+fm = FrameMetrics(ROI)
+multi = MultiRoiMetrics(grid=ROI_GRID, named=ROI_NAMED) if (ROI_GRID or ROI_NAMED) else None
+extra_cols = (multi.columns if multi else []) + (['fg_frac'] if FOREGROUND else [])
+# background model lives for the whole run; learning pauses while an event is active
+fg_model = ForegroundFraction(ROI, FG_METHOD) if FOREGROUND else None
+# provisional from the first frame, settles over BASELINE_SAMPLES, then tracks drift outside events
+baseline = OnlineBaseline(BASELINE_SAMPLES, BASELINE_TAU)
 
 def append_calib_row(label, volume_ml, start_ts, end_ts):
     header_needed = not os.path.exists(CALIB_CSV)
@@ -72,63 +116,82 @@ def append_calib_row(label, volume_ml, start_ts, end_ts):
         w.writerow([label, f"{volume_ml:.3f}", start_ts, end_ts])
     print("Wrote calib row:", label, volume_ml, start_ts, end_ts)
 
-def collect_baseline(cap):
-    baseline_means = []
-    baseline_stds = []
-    print("Collecting baseline samples...")
-    for i in range(BASELINE_SAMPLES):
-        ret, frame = cap.read()
+def wait_for_enter(cap):
+    # keep sampling the baseline while the operator gets ready, so it is current when the pour starts;
+    # returns the capture time of the frame being processed when Enter was pressed
+    frame_ts = None
+    while frame_ts is None or sys.stdin not in select_readable():
+        ret, frame, frame_ts = cap.read()
         if not ret:
-            raise RuntimeError("failed to read frame during baseline")
-        _, _, mean_roi, std_roi, _, _, _ = frame_metrics(frame)
-        baseline_means.append(mean_roi)
-        baseline_stds.append(std_roi)
-        print(f"BASE {i+1}/{BASELINE_SAMPLES} ROI_MEAN:{mean_roi:.2f} ROI_STD:{std_roi:.2f}")
-        time.sleep(INTERVAL)
-    return float(np.mean(baseline_means)), float(np.mean(baseline_stds))
-
-def run_manual(cap, label, volume_ml):
+            raise RuntimeError("failed to read frame while waiting for start")
+        mean_roi, std_roi = fm.roi(frame)
+        if baseline.update(frame_ts, mean_roi, std_roi):
+            print(f"BASELINE DONE mean_roi={baseline.mean[0]:.2f} std_roi={baseline.mean[1]:.2f}")
+        cap.pace(INTERVAL)
+    sys.stdin.readline()
+    return frame_ts
+
+def detect(frame, mean_roi, std_roi, in_event):
+    # event test on the ROI deltas, gated by the foreground fraction when FOREGROUND is on
+    base_mean, base_std = baseline.get(mean_roi, std_roi)
+    delta_mean = mean_roi - base_mean
+    delta_std = std_roi - base_std
+    event = (delta_mean > MEAN_THRESHOLD) or (delta_std > STD_THRESHOLD)
+    fg = None
+    if fg_model:
+        fg = fg_model.update(frame, learn=not in_event)
+        event = event and fg >= FG_EVENT_FRAC
+    return delta_mean, delta_std, fg, event
+
+def run_manual(cap, log, binlog, writer, label, volume_ml):
     print("Manual mode: press Enter to START the pour, press Enter again to STOP.")
-    input("Ready. Press Enter to start...")
-    start_ts = nowstr()
+    print("Ready. Press Enter to start...")
+    start_ts = clock.isostamp(wait_for_enter(cap))
     print("Recording... press Enter to stop when pour is finished.")
     # record while waiting for Enter; still sample camera
     samples = []
     last_periodic = time.time()
+    rate = AdaptiveRate(IDLE_INTERVAL, 0.0, (PRE_MEAN_THRESHOLD, PRE_STD_THRESHOLD), RATE_QUIET_SEC)
+    fg_integ = Integrator()
+    event = False
+    end_ts = start_ts
     while True:
         t0 = time.time()
-        ret, frame = cap.read()
+        ret, frame, frame_ts = cap.read()
         if not ret:
             print("ERROR: failed to read frame")
             break
-        mean_all, std_all, mean_roi, std_roi, w, h, gray = frame_metrics(frame)
-        ts = nowstr()
-        delta_mean = mean_roi - base_mean
-        delta_std = std_roi - base_std
-        event = (delta_mean > MEAN_THRESHOLD) or (delta_std > STD_THRESHOLD)
-        print(f"{ts} MEAN_ROI:{mean_roi:.2f} DELTA:{delta_mean:.2f} STD_ROI:{std_roi:.2f} DELTA_STD:{delta_std:.2f} EVENT:{int(event)}")
-        with open(LOGFILE,'a',newline='') as f:
-            wcsv = csv.writer(f)
-            wcsv.writerow([ts, f"{mean_all:.2f}", f"{std_all:.2f}", f"{mean_roi:.2f}", f"{std_roi:.2f}", f"{w}x{h}", int(event)])
+        mean_all, std_all, mean_roi, std_roi, w, h = fm.full(frame)
+        extra = multi(frame) if multi else ()
+        ts = clock.isostamp(frame_ts)
+        end_ts = ts   # capture time of the frame being processed when Enter is pressed
+        delta_mean, delta_std, fg, event = detect(frame, mean_roi, std_roi, event)
+        if fg is not None:
+            extra = tuple(extra) + (fg,)
+            fg_integ.add(fg, frame_ts)
+        if baseline.update(frame_ts, mean_roi, std_roi, active=event):
+            print(f"BASELINE DONE mean_roi={baseline.mean[0]:.2f} std_roi={baseline.mean[1]:.2f}")
+        interval = rate.update(frame_ts, delta_mean, delta_std) if ADAPTIVE_RATE else INTERVAL
+        fg_col = f" FG:{fg:.3f}" if fg is not None else ""
+        print(f"{ts} MEAN_ROI:{mean_roi:.2f} DELTA:{delta_mean:.2f} STD_ROI:{std_roi:.2f} DELTA_STD:{delta_std:.2f}{fg_col} EVENT:{int(event)}")
+        log.write([ts, f"{mean_all:.2f}", f"{std_all:.2f}", f"{mean_roi:.2f}", f"{std_roi:.2f}", w, h, int(event)] + [f"{v:.2f}" for v in extra])
+        if binlog:
+            binlog.write(frame_ts, mean_all, std_all, mean_roi, std_roi, w, h, int(event), *extra)
         # periodic snapshot
         if SAVE_PERIODIC and (time.time() - last_periodic) >= PERIODIC_SEC:
             text = [f"TS:{ts}", f"MEAN_ROI:{mean_roi:.2f}", f"STD_ROI:{std_roi:.2f}", f"EVENT:{int(event)}"]
-            img = frame.copy()
-            annotate_image(img, text, scale=0.5, color=(255,255,255), thickness=1)
-            fname = f"{SNAP_DIR}/snap_{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.jpg"
-            cv2.imwrite(fname, img)
+            fname = f"{SNAP_DIR}/snap_{datetime.utcfromtimestamp(frame_ts).strftime('%Y%m%dT%H%M%SZ')}.jpg"
+            writer.submit(cap.color(), fname, text, scale=0.5, color=(255,255,255), thickness=1)
             last_periodic = time.time()
         # non-blocking check for Enter
         if sys.stdin in select_readable():
             _ = sys.stdin.readline()
             break
-        elapsed = time.time() - t0
-        to_sleep = INTERVAL - elapsed
-        if to_sleep > 0:
-            time.sleep(to_sleep)
-    end_ts = nowstr()
+        cap.pace(0.0 if HIGH_RATE else interval, t0)
     append_calib_row(label, volume_ml, start_ts, end_ts)
     print("Manual run recorded. start:", start_ts, "end:", end_ts)
+    if fg_model:
+        print(f"FG_INTEGRAL:{fg_integ.total:.6f}")
 
 def select_readable():
     # cross-platform non-blocking stdin check
@@ -136,50 +199,60 @@ def select_readable():
     r,_,_ = select.select([sys.stdin], [], [], 0)
     return r
 
-def run_auto(cap):
+def run_auto(cap, log, binlog, writer):
     print("Auto mode: detecting events. Press Ctrl-C to stop.")
     last_periodic = time.time()
     in_event = False
     event_start = None
     last_event_time = None
     event_count = 0
+    clips = EventClipRecorder(pre_sec=CLIP_PRE_SEC, scale=CLIP_SCALE, jpeg_quality=CLIP_JPEG_QUALITY) if SAVE_CLIPS else None
+    rate = AdaptiveRate(IDLE_INTERVAL, 0.0, (PRE_MEAN_THRESHOLD, PRE_STD_THRESHOLD), RATE_QUIET_SEC)
+    fg_integ = None   # foreground-fraction integral of the open event
     try:
         while True:
             t0 = time.time()
-            ret, frame = cap.read()
+            ret, frame, frame_ts = cap.read()
             if not ret:
                 print("ERROR: failed to read frame")
                 break
-            mean_all, std_all, mean_roi, std_roi, w, h, gray = frame_metrics(frame)
-            ts = nowstr()
-            delta_mean = mean_roi - base_mean
-            delta_std = std_roi - base_std
-            event = (delta_mean > MEAN_THRESHOLD) or (delta_std > STD_THRESHOLD)
-            print(f"{ts} MEAN_ROI:{mean_roi:.2f} DELTA:{delta_mean:.2f} STD_ROI:{std_roi:.2f} DELTA_STD:{delta_std:.2f} EVENT:{int(event)}")
-            with open(LOGFILE,'a',newline='') as f:
-                wcsv = csv.writer(f)
-                wcsv.writerow([ts, f"{mean_all:.2f}", f"{std_all:.2f}", f"{mean_roi:.2f}", f"{std_roi:.2f}", f"{w}x{h}", int(event)])
-            # save annotated image on event
-            if event and SAVE_ON_EVENT:
+            mean_all, std_all, mean_roi, std_roi, w, h = fm.full(frame)
+            extra = multi(frame) if multi else ()
+            ts = clock.isostamp(frame_ts)
+            delta_mean, delta_std, fg, event = detect(frame, mean_roi, std_roi, in_event)
+            if fg is not None:
+                extra = tuple(extra) + (fg,)
+            if baseline.update(frame_ts, mean_roi, std_roi, active=event):
+                print(f"BASELINE DONE mean_roi={baseline.mean[0]:.2f} std_roi={baseline.mean[1]:.2f}")
+            interval = rate.update(frame_ts, delta_mean, delta_std) if ADAPTIVE_RATE else INTERVAL
+            fg_col = f" FG:{fg:.3f}" if fg is not None else ""
+            print(f"{ts} MEAN_ROI:{mean_roi:.2f} DELTA:{delta_mean:.2f} STD_ROI:{std_roi:.2f} DELTA_STD:{delta_std:.2f}{fg_col} EVENT:{int(event)}")
+            log.write([ts, f"{mean_all:.2f}", f"{std_all:.2f}", f"{mean_roi:.2f}", f"{std_roi:.2f}", w, h, int(event)] + [f"{v:.2f}" for v in extra])
+            if binlog:
+                binlog.write(frame_ts, mean_all, std_all, mean_roi, std_roi, w, h, int(event), *extra)
+            if clips:
+                clips.push(frame, frame_ts)
+            # save annotated image on event (the clip covers events when SAVE_CLIPS is on)
+            if event and SAVE_ON_EVENT and not clips:
                 text = [f"TS:{ts}", f"MEAN_ROI:{mean_roi:.2f} DELTA:{delta_mean:.2f}", f"STD_ROI:{std_roi:.2f} DELTA_STD:{delta_std:.2f}", f"EVENT:1"]
-                img = frame.copy()
-                annotate_image(img, text, scale=0.6, color=(0,255,255), thickness=1)
-                fname = f"{EVENT_DIR}/evt_{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.jpg"
-                cv2.imwrite(fname, img)
+                fname = f"{EVENT_DIR}/evt_{datetime.utcfromtimestamp(frame_ts).strftime('%Y%m%dT%H%M%SZ')}.jpg"
+                writer.submit(cap.color(), fname, text, scale=0.6, color=(0,255,255), thickness=1)
             # periodic snapshot
             if SAVE_PERIODIC and (time.time() - last_periodic) >= PERIODIC_SEC:
                 text = [f"TS:{ts}", f"MEAN_ROI:{mean_roi:.2f}", f"STD_ROI:{std_roi:.2f}", f"EVENT:{int(event)}"]
-                img = frame.copy()
-                annotate_image(img, text, scale=0.5, color=(255,255,255), thickness=1)
-                fname = f"{SNAP_DIR}/snap_{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.jpg"
-                cv2.imwrite(fname, img)
+                fname = f"{SNAP_DIR}/snap_{datetime.utcfromtimestamp(frame_ts).strftime('%Y%m%dT%H%M%SZ')}.jpg"
+                writer.submit(cap.color(), fname, text, scale=0.5, color=(255,255,255), thickness=1)
                 last_periodic = time.time()
             # event state machine
-            nowt = time.time()
+            nowt = frame_ts   # capture time, so replays close events the same way
             if event and not in_event:
                 in_event = True
                 event_start = ts
                 last_event_time = nowt
+                if clips:
+                    clips.open_event()
+                if fg_model:
+                    fg_integ = Integrator()
             elif event and in_event:
                 last_event_time = nowt
             elif not event and in_event:
@@ -190,40 +263,65 @@ def run_auto(cap):
                     label = f"auto{event_count}"
                     # volume unknown for auto mode; write 0.0 as placeholder
                     append_calib_row(label, 0.0, event_start, event_end)
-                    print("Auto event recorded:", label, event_start, event_end)
+                    print("Auto event recorded:", label, event_start, event_end,
+                          f"FG_INTEGRAL:{fg_integ.total:.6f}" if fg_integ else "")
+                    if clips:
+                        clips.close_event(clip_path(label, clips.start_ts))
                     in_event = False
                     event_start = None
-            elapsed = time.time() - t0
-            to_sleep = INTERVAL - elapsed
-            if to_sleep > 0:
-                time.sleep(to_sleep)
+            if fg_integ and in_event:
+                fg_integ.add(fg, frame_ts)
+            cap.pace(0.0 if HIGH_RATE else interval, t0)
     except KeyboardInterrupt:
         print("Stopped by user")
+    finally:
+        if clips:
+            # keep the partial clip of an event still open at Ctrl-C
+            if clips.recording:
+                clips.close_event(clip_path(f"auto{event_count+1}_partial", clips.start_ts))
+            clips.close()
+
+def clip_path(label, start_ts):
+    # stamped with the capture time of the clip's first frame (frame_source.py replays from it)
+    return f"{CLIP_DIR}/clip_{label}_{datetime.utcfromtimestamp(start_ts).strftime('%Y%m%dT%H%M%SZ')}.avi"
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('mode', choices=['manual','auto'])
     parser.add_argument('--label', default='run1', help='label for manual run')
     parser.add_argument('--volume_ml', type=float, default=0.0, help='measured volume in ml for manual run')
+    parser.add_argument('--source', default=None, help='video file or image directory to replay instead of DEVICE')
     args = parser.parse_args()
 
+    if args.source:
+        use_replay_outputs()
+        print("Replay outputs:", LOG_DIR if LOG_PARTITION else LOGFILE, CALIB_CSV, EVENT_DIR, SNAP_DIR, CLIP_DIR)
     ensure_dirs()
-    write_header_if_needed()
-    cap = cv2.VideoCapture(DEVICE)
+    cap = open_source(args.source or DEVICE, luma=LUMA, size=size_for_roi(ROI, MIN_ROI_PX) if MIN_ROI_PX else None)
     if not cap.isOpened():
         print("ERROR: camera not opened"); sys.exit(2)
-    for _ in range(5):
-        cap.read(); time.sleep(0.05)
-    global base_mean, base_std
-    base_mean, base_std = collect_baseline(cap)
-    print(f"BASELINE DONE mean_roi={base_mean:.2f} std_roi={base_std:.2f}")
-
-    if args.mode == 'manual':
-        # manual mode uses Enter to mark start/stop and writes the provided volume
-        run_manual(cap, args.label, args.volume_ml)
+    cap.warmup()
+
+    if LOG_PARTITION:
+        log = SegmentedFlowLog(LOG_DIR, header=FLOW_HEADER + extra_cols, partition=LOG_PARTITION, fsync=LOG_FSYNC)
     else:
-        run_auto(cap)
-    cap.release()
+        log = FlowLogWriter(LOGFILE, header=FLOW_HEADER + extra_cols, fsync=LOG_FSYNC, rotate_bytes=LOG_ROTATE_BYTES, rotate_daily=LOG_ROTATE_DAILY)
+    binlog = BinaryFlowLog(BINLOG, fields=FLOW_FIELDS + [(c,'<f4') for c in extra_cols]) if BINLOG else None
+    writer = AsyncImageWriter(queue_size=IMAGE_QUEUE, policy=IMAGE_DROP_POLICY)
+    try:
+        if args.mode == 'manual':
+            # manual mode uses Enter to mark start/stop and writes the provided volume
+            run_manual(cap, log, binlog, writer, args.label, args.volume_ml)
+        else:
+            run_auto(cap, log, binlog, writer)
+    finally:
+        log.close()
+        if binlog:
+            binlog.close()
+        writer.close()
+        print(writer.stats())
+        print(cap.stats())
+        cap.release()
 
 if __name__ == "__main__":
     main()
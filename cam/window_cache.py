@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+window_cache.py
+
+Incremental calibration-window results for build_pump_dataset.py and
+calib_pipeline.py.
+
+A rebuild used to load the whole flow log and recompute every calibration
+window, even when only one run had been appended to calib_points.csv. The flow
+log only grows, so window_cache.json keeps per log:
+
+  - the running sums at the end of the last read (IntegralIndex.state) with the
+    byte offset reached, plus a checkpoint every CHECKPOINT_ROWS samples before it
+  - the baseline, integral and sample count of each window, keyed by its bounds,
+    the signal and the baseline method, with the log offset it was computed at
+
+A rebuild reads only the rows appended after the end offset and computes only
+windows that are new, changed, or were still open at the last build (ending at
+or after the last logged sample). A window that starts before the end offset is
+computed from the nearest checkpoint before its start instead of from the top
+of the log. Windows no longer in calib_points.csv are dropped. The sums carry on
+exactly, so the results are the same as a full rebuild.
+
+The entry for a log is thrown away (full rebuild) when the log was replaced or
+truncated: it is shorter than the end offset, or its first bytes or the bytes
+before the end offset changed. Logs whose timestamps go backwards (merged logs)
+are computed in full and not cached, because the running sums assume appended
+rows are later.
+
+usage:
+    cache = WindowCache()                       # window_cache.json
+    results, counts = cache.compute("flow_log.csv", calib, ['mean_roi', 'std_roi'])
+    bases, integrals = results['mean_roi']     # arrays over the calib rows, integral nan if < 2 samples
+"""
+import os, json, hashlib
+import numpy as np
+from log_reader import read_flow_log_from, epoch_seconds
+from integral_index import IntegralIndex
+
+CACHE_PATH = "window_cache.json"
+BASELINE = 'mean_before_start'   # baseline method, part of every window key
+CHECKPOINT_ROWS = 100000         # samples between stored checkpoints (about 1 h at 30 fps)
+CHECK_BYTES = 256                # log bytes hashed at the start and before the end offset
+
+
+def _digest(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(max(start, 0))
+        return hashlib.sha1(f.read(max(end - max(start, 0), 0))).hexdigest()
+
+
+def _window_key(start, end, signal):
+    return f"{start!r}|{end!r}|{signal}|{BASELINE}"
+
+
+class WindowCache:
+    def __init__(self, path=CACHE_PATH, checkpoint_rows=CHECKPOINT_ROWS):
+        self.path = path
+        self.checkpoint_rows = checkpoint_rows
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, data):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def _entry(self, entry, log_path, signals):
+        # cached entry if it still describes the start of this log, else a fresh one
+        if entry is not None:
+            end = entry['end']['offset']
+            if not set(signals) <= set(entry['signals']):
+                print("WINDOW CACHE reset: new signals")
+            elif os.path.getsize(log_path) < end or _digest(log_path, 0, min(CHECK_BYTES, end)) != entry['head'] \
+                    or _digest(log_path, end - CHECK_BYTES, end) != entry['tail']:
+                print(f"WINDOW CACHE reset: {log_path} was replaced or truncated")
+            else:
+                return entry
+            signals = sorted(set(signals) | set(entry['signals']))
+        start = {'offset': 0, 'n': 0, 'ts': None, 'sums': {s: [0.0, 0.0, None, 0] for s in signals}}
+        return {'signals': list(signals), 'checkpoints': [start], 'end': start, 'windows': {}}
+
+    def compute(self, log_path, calib, signals, cam_id=None):
+        # ({signal: (baselines, integrals)}, counts) over the calib rows; updates the cache file
+        data = self._read()
+        log_key = os.path.realpath(log_path) + (f"#cam_id={cam_id}" if cam_id is not None else '')
+        entry = self._entry(data.get(log_key), log_path, signals)
+        starts, ends = epoch_seconds(calib['start_ts']), epoch_seconds(calib['end_ts'])
+        n = len(starts)
+        keys = [[_window_key(float(starts[k]), float(ends[k]), s) for s in signals] for k in range(n)]
+        cached = entry['windows']
+        todo = [k for k in range(n) if not all(key in cached and cached[key][3] for key in keys[k])]
+
+        # read from the end offset, or from the last checkpoint before the earliest todo window that starts before it
+        last = entry['end']
+        cp = last
+        early = [starts[k] for k in todo if last['ts'] is not None and starts[k] <= last['ts']]
+        if early:
+            t0 = min(early)
+            cp = [c for c in entry['checkpoints'] if c['ts'] is None or c['ts'] < t0][-1]
+        table, row_ends = read_flow_log_from(log_path, cp['offset'])
+        sel = np.ones(len(row_ends), bool) if cam_id is None or 'cam_id' not in table else table['cam_id'] == cam_id
+        ts = epoch_seconds(table['timestamp'])[sel]
+        if len(ts) and ((cp['ts'] is not None and ts[0] < cp['ts']) or np.any(np.diff(ts) < 0)):
+            print(f"WINDOW CACHE off: timestamps in {log_path} go backwards, computing in full")
+            data.pop(log_key, None)
+            self._write(data)
+            table, row_ends = read_flow_log_from(log_path)
+            sel = np.ones(len(row_ends), bool) if cam_id is None or 'cam_id' not in table else table['cam_id'] == cam_id
+            idx = IntegralIndex(epoch_seconds(table['timestamp'])[sel], {s: table[s][sel] for s in signals})
+            return self._results(idx, signals, starts, ends)
+        idx = IntegralIndex(ts, {s: table[s][sel] for s in entry['signals']}, prefix=cp if cp['n'] else None)
+
+        # windows ending before the last sample cannot change any more
+        sub = np.array(todo, dtype=int)
+        results, counts = self._results(idx, signals, starts[sub], ends[sub])
+        end_offset = int(row_ends[-1]) if len(row_ends) else cp['offset']
+        last_ts = idx.state(len(idx))['ts']
+        for m, k in enumerate(todo):
+            final = bool(last_ts is not None and ends[k] < last_ts)
+            for j, s in enumerate(signals):
+                bases, integ = results[s]
+                cached[keys[k][j]] = [float(bases[m]), None if np.isnan(integ[m]) else float(integ[m]),
+                                      int(counts[m]), final, end_offset]
+
+        # checkpoints: every checkpoint_rows samples past the old end, and the new end
+        kept_ends = row_ends[sel]
+        ks = np.arange(1, len(idx) + 1)
+        for k in ks[((idx.n0 + ks) % self.checkpoint_rows == 0) & (kept_ends > last['offset'])]:
+            entry['checkpoints'].append(dict(idx.state(int(k)), offset=int(kept_ends[k-1])))
+        if end_offset > last['offset']:
+            entry['end'] = dict(idx.state(len(idx)), offset=end_offset)
+        end = entry['end']['offset']
+        entry['head'] = _digest(log_path, 0, min(CHECK_BYTES, end))
+        entry['tail'] = _digest(log_path, end - CHECK_BYTES, end)
+        live = {key for row in keys for key in row}
+        entry['windows'] = {key: v for key, v in cached.items() if key in live}
+        data[log_key] = entry
+        self._write(data)
+        print(f"WINDOW CACHE {len(todo)}/{n} windows computed, {len(ts)} log rows read")
+
+        counts_all = np.zeros(n, dtype=int)
+        out = {}
+        for j, s in enumerate(signals):
+            bases = np.empty(n)
+            integ = np.empty(n)
+            for k in range(n):
+                b, i, c, _, _ = entry['windows'][keys[k][j]]
+                bases[k], integ[k], counts_all[k] = b, np.nan if i is None else i, c
+            out[s] = (bases, integ)
+        return out, counts_all
+
+    def _results(self, idx, signals, starts, ends):
+        results = {}
+        for s in signals:
+            bases = idx.baselines(s, starts)
+            results[s] = (bases, idx.integrals(s, starts, ends, bases))
+        return results, idx.counts(starts, ends)